@@ -21,9 +21,27 @@ from tkinter import ttk
 from tkinter import filedialog, messagebox, scrolledtext
 from helpers import Helpers
 from prostitchercontroller import ProStitcherController
+from diskplanner import DiskPlanner
+from recordingindex import RecordingIndex
+from retrypolicy import RetryPolicy
 from time import sleep
 
 
+class SettingsVars(dict):
+    """
+    Tk variables of settings by key, created on first use.
+    """
+
+    def __init__(self, create):
+        super().__init__()
+        self._create = create
+
+    def __missing__(self, key):
+        var = self._create(key)
+        self[key] = var
+        return var
+
+
 class BatchStitcher():
 
     def __init__(self):
@@ -39,6 +57,8 @@ class BatchStitcher():
         self.settings_buttons = {}
         self.button_cancel = None
         self.button_start = None
+        self.button_pause = None
+        self.button_finish = None
         self.text_area = None
         self.line_length = 0
         self.max_line_length = 100
@@ -50,7 +70,7 @@ class BatchStitcher():
         self.button_width = 20
         self.scroll_width = 780
         self.scroll_height = 400
-        self.intvar_keys = ["original_offset", "decode_use_hardware", "decode_hardware_count", "encode_use_hardware", "zenith_optimisation", "flowstate_stabilisation", "direction_lock", "smooth_stitch", "rename_after_stitching"]
+        self.intvar_keys = ["original_offset", "decode_use_hardware", "decode_hardware_count", "encode_use_hardware", "zenith_optimisation", "flowstate_stabilisation", "direction_lock", "smooth_stitch", "rename_after_stitching", "source_recursive", "capability_check", "pause_suspend_children", "vram_admission", "job_spool", "auto_reference_time", "auto_trim"]
 
         self._stitcher = None
         self._stitching_thread = None
@@ -123,20 +143,33 @@ class BatchStitcher():
     def _init_gui(self):
         self._init_tk()
         self._init_ttk()
+        # Tk variables are created when a section uses them, so sections built later cost nothing at startup
+        self.settings_stringvars = SettingsVars(lambda k: tk.StringVar(value=str(self.settings.get(k, ""))))
+        self.settings_intvars = SettingsVars(self._create_intvar)
         for k in self.settings.keys():
-            self.settings_stringvars[k] = tk.StringVar(value=str(self.settings[k]))
             self.settings_widgets[k] = None
             self.settings_labels[k] = None
             self.settings_buttons[k] = None
-        for k in self.intvar_keys:
-            self.settings_intvars[k] = tk.IntVar(value=Helpers.parse_int(self.settings[k]))
-        self.settings_intvars["bitrate_mbps"] = tk.IntVar(value=int(Helpers.parse_int(self.settings["bitrate"])/1024/1024))
 
         if platform == "darwin":
             self.editor_width = 25
             self.button_width = 10
 
 
+    def _create_intvar(self, k):
+        if k == "bitrate_mbps":
+            return tk.IntVar(value=int(Helpers.parse_int(self.settings["bitrate"])/1024/1024))
+        return tk.IntVar(value=Helpers.parse_int(self.settings.get(k)))
+
+    def _set_entry(self, k, value):
+        """
+        Sets the value of a setting shown in an entry. If its section is not built yet, the entry shows it when it is.
+        """
+        self.settings_stringvars[k].set(value)
+        if self.settings_widgets.get(k):
+            self.settings_widgets[k].delete(0, tk.END)  # deletes the current value
+            self.settings_widgets[k].insert(0, value)  # inserts new value assigned by 2nd parameter
+
     def _init_tk(self):
         # Create root element and load and set theme
         self.root = tk.Tk()
@@ -167,14 +200,24 @@ class BatchStitcher():
         if self.root:
             self.root.tk.call('lappend', 'auto_path', self.themes_path)
             try:
-                for name in self.theme_names:
-                    self.root.tk.call('package', 'require', name)
+                # Only load the theme in use, loading a theme creates all its images
                 self.style = ttk.Style(self.root)
-                self.style.theme_use(self.theme_names[0])
+                self._require_theme(self.theme_names[self._get_theme_index()])
+                self.style.theme_use(self.theme_names[self._get_theme_index()])
             except Exception as e:
                 print("Error setting up tk themes: ", e)
                 self.style = None
 
+    def _get_theme_index(self):
+        try:
+            return self.theme_names.index(self.settings.get("gui_theme"))
+        except ValueError:
+            return 0
+
+    def _require_theme(self, name):
+        if name not in self.style.theme_names():
+            self.root.tk.call('package', 'require', name)
+
     def _on_mousewheel(self, event):
         self.scroll_canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
         # if event.state == 0:
@@ -225,7 +268,14 @@ class BatchStitcher():
         if index >= len(self.theme_names):
             index = 0
         if self.style:
-            self.style.theme_use(self.theme_names[index])
+            try:
+                self._require_theme(self.theme_names[index])
+                self.style.theme_use(self.theme_names[index])
+                self.settings["gui_theme"] = self.theme_names[index]
+                if self.settings_stringvars.get("gui_theme"):
+                    self.settings_stringvars["gui_theme"].set(self.theme_names[index])
+            except Exception as e:
+                print("Error setting tk theme: ", e)
             self.root.configure(bg=self.style.lookup('TFrame', 'background'))
             self.parent_frame.configure(bg=self.style.lookup('TFrame', 'background') or 'grey')
             self.scroll_canvas.configure(bg=self.style.lookup('TFrame', 'background') or 'grey')
@@ -247,24 +297,37 @@ class BatchStitcher():
         idir = self.settings_stringvars["source_dir"].get() or None
         fdir = filedialog.askdirectory(initialdir=idir)
         if fdir:
-            self.settings_stringvars["source_dir"].set(fdir)
-            self.settings_widgets["source_dir"].delete(0, tk.END)  # deletes the current value
-            self.settings_widgets["source_dir"].insert(0, fdir)  # inserts new value assigned by 2nd parameter
+            self._set_entry("source_dir", fdir)
 
         if not os.path.isdir(self.settings_stringvars["source_dir"].get()):
             messagebox.showwarning(title="Warning", message="No valid source folder selected.")
         else:
-            recordings = Helpers.get_subdirs(self.settings_stringvars["source_dir"].get(), self.settings["source_filter"])
-            if not recordings:
-                messagebox.showwarning(title="Warning", message="No VID_xxx_xxx subdirectories found.")
+            # sizing large or network folders takes a while, so it runs outside the Tk thread
+            threading.Thread(target=self._size_source_dir,
+                             args=(self.settings_stringvars["source_dir"].get(),
+                                   self.settings_intvars["source_recursive"].get(),
+                                   self.settings["source_filter"]),
+                             name="Source folder size", daemon=True).start()
+
+    def _size_source_dir(self, source_dir, recursive, source_filter):
+        try:
+            if recursive:
+                recordings = RecordingIndex().scan([source_dir], source_filter)
+                recording_sizes = dict(zip(recordings, map(Helpers.get_tree_size, recordings)))
+            else:
+                recording_sizes = Helpers.get_subdir_sizes(source_dir, source_filter)
+            if not recording_sizes:
+                self.log_callback("warning", "Warning: No VID_xxx_xxx subdirectories found.")
+            else:
+                self.log_callback("info", f"Found {len(recording_sizes)} recordings ({DiskPlanner.format_size(sum(recording_sizes.values()))}).")
+        except Exception as e:
+            self.log_callback("error", "Error reading source folder: {}".format(str(e)))
 
     def _on_select_target_dir(self):
         idir = self.settings_stringvars["target_dir"].get() or None
         fdir = filedialog.askdirectory(initialdir=idir)
         if fdir:
-            self.settings_stringvars["target_dir"].set(fdir)
-            self.settings_widgets["target_dir"].delete(0, tk.END)  # deletes the current value
-            self.settings_widgets["target_dir"].insert(0, fdir)  # inserts new value assigned by 2nd parameter
+            self._set_entry("target_dir", fdir)
         if not os.path.isdir(self.settings_stringvars["target_dir"].get()):
             messagebox.showwarning(title="Warning", message="No valid target folder selected.")
 
@@ -293,9 +356,7 @@ class BatchStitcher():
             is_valid = True
 
         if ffile:
-            self.settings_stringvars["stitcher_path"].set(ffile)
-            self.settings_widgets["stitcher_path"].delete(0, tk.END)
-            self.settings_widgets["stitcher_path"].insert(0, ffile)
+            self._set_entry("stitcher_path", ffile)
         if not is_valid:
             messagebox.showwarning(title="Warning", message="No ProStitcher executable selected.")
 
@@ -316,9 +377,7 @@ class BatchStitcher():
                                            filetypes=filetypes,
                                            title="Please select the ffprobe executable")
         if ffile:
-            self.settings_stringvars["ffprobe_path"].set(ffile)
-            self.settings_widgets["ffprobe_path"].delete(0, tk.END)
-            self.settings_widgets["ffprobe_path"].insert(0, ffile)
+            self._set_entry("ffprobe_path", ffile)
         if not os.path.isfile(ffile):
             messagebox.showwarning(title="Warning", message="No ffprobe executable selected.")
 
@@ -336,17 +395,37 @@ class BatchStitcher():
                                            filetypes=filetypes,
                                            title="Please select the logo")
         if lfile:
-            self.settings_stringvars["logo_path"].set(lfile)
-            self.settings_widgets["logo_path"].delete(0, tk.END)
-            self.settings_widgets["logo_path"].insert(0, lfile)
+            self._set_entry("logo_path", lfile)
         if not os.path.isfile(lfile):
-            self.settings_stringvars["logo_path"] = None
-            self.settings_widgets["logo_path"] = None
+            self._set_entry("logo_path", "")
 
 
     def _on_cancel(self):
         if self._stitcher:
             self._stitcher.stop()
+            self._set_batch_buttons(False)
+
+    def _on_pause(self):
+        if self._stitcher:
+            if self._stitcher.is_paused():
+                self._stitcher.resume()
+                self.button_pause.config(text="Pause")
+            else:
+                self._stitcher.pause()
+                self.button_pause.config(text="Resume")
+
+    def _on_finish(self):
+        if self._stitcher:
+            self._stitcher.drain()
+            self.button_pause.config(text="Pause", state=tk.DISABLED)
+            self.button_finish.config(state=tk.DISABLED)
+
+    def _set_batch_buttons(self, running):
+        state = tk.NORMAL if running else tk.DISABLED
+        if self.button_pause:
+            self.button_pause.config(text="Pause", state=state)
+        if self.button_finish:
+            self.button_finish.config(state=state)
 
     def _on_about(self):
         title = 'About Batch Stitcher'
@@ -384,6 +463,9 @@ class BatchStitcher():
                 else:
                     print(f"Could not save setting {k}: {str(e)}")
         for k in self.intvar_keys:
+            if k not in self.settings_intvars:
+                # section not built yet, the setting did not change
+                continue
             try:
                 self.settings[k] = self.settings_intvars[k].get()
             except Exception as e:
@@ -423,12 +505,16 @@ class BatchStitcher():
         def start_stitcher():
             self._stitcher = ProStitcherController()
             self._stitcher.settings = copy.deepcopy(self.settings)
+            self._stitcher.profiles = Helpers.read_config_sections(self.inifile_path, "profile ")
+            self._stitcher.retry_rules = RetryPolicy.parse_rules(
+                Helpers.read_config_sections(self.inifile_path, "retry").get("", {}))
             self._stitcher.stitch(self.log_callback, self.done_callback)
 
         try:
             self._clear_log()
             self.button_start.config(state=tk.DISABLED)
             self.button_cancel.config(state=tk.NORMAL)
+            self._set_batch_buttons(True)
             self._on_save(to_file=True, quiet=True)
 
             if not os.path.isdir(self.settings.get('source_dir')):
@@ -449,6 +535,7 @@ class BatchStitcher():
                 self._stitcher = None
                 self.button_start.config(state=tk.NORMAL)
                 self.button_cancel.config(state=tk.DISABLED)
+                self._set_batch_buttons(False)
 
     def _is_stitching_thread_alive(self):
         alive = False
@@ -515,10 +602,28 @@ class BatchStitcher():
         if self.button_start:
             self.button_start.config(state=tk.NORMAL)
             self.button_cancel.config(state=tk.DISABLED)
+        self._set_batch_buttons(False)
 
     def _populate_scroll_frame(self):
+        # Only the first section is built before the window shows, the others one by one when Tk is idle
+        self._section_row = self._populate_setup_section(0)
+        self._pending_sections = [self._populate_input_section, self._populate_stitch_section,
+                                  self._populate_orientation_section, self._populate_color_section,
+                                  self._populate_output_section, self._populate_post_processing_section]
+        self.root.after(1, self._populate_next_section)
+
+    def _populate_next_section(self):
+        if not self._pending_sections:
+            return
+        try:
+            self._section_row = self._pending_sections.pop(0)(self._section_row)
+            self._resize_scroll_frame(self.scroll_width, self.scroll_height)
+        except Exception as e:
+            print("Error building settings: ", e)
+        if self._pending_sections:
+            self.root.after(1, self._populate_next_section)
 
-        row_s = 0
+    def _populate_setup_section(self, row_s):
         ttk.Label(self.scroll_frame, text="Setup", anchor='se', font=('Arial',16, 'underline')).grid(row=row_s, column=0,padx=2, pady=12,sticky="e")
 
         settings_with_buttons = [("source_dir", 'Source folder:',self._on_select_source_dir),
@@ -548,6 +653,100 @@ class BatchStitcher():
         self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
         ttk.Label(self.scroll_frame, text="values >1 depend on available VRAM.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
 
+        row_s += 1
+        k = "vram_admission"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Limit by free VRAM:", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Checkbutton(self.scroll_frame, variable=self.settings_intvars[k])
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="Start recordings only when they fit into free VRAM.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
+        row_s += 1
+        k = "job_spool"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Keep queue after restart:", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Checkbutton(self.scroll_frame, variable=self.settings_intvars[k])
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="Unfinished recordings are stitched first by the next batch.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
+        row_s += 1
+        k = "segment_count"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Segments per recording:", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Combobox(self.scroll_frame,
+                                                textvariable=self.settings_stringvars[k],
+                                                values=("1", "2", "3", "4", "6", "8", "0"))
+        self.settings_widgets[k].config(width=self.editor_width-2, state="readonly")
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="Stitch long recordings in parallel. Requires ffmpeg.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+        row_s += 1
+        ttk.Label(self.scroll_frame, text="0 = one segment per stitching process.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
+        row_s += 1
+        k = "preview_mode"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Preview:", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Combobox(self.scroll_frame,
+                                                textvariable=self.settings_stringvars[k],
+                                                values=("off", "first", "only", "approved"))
+        self.settings_widgets[k].config(width=self.editor_width-2, state="readonly")
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="Quick low resolution previews in subfolder 'preview'.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+        row_s += 1
+        ttk.Label(self.scroll_frame, text="'approved' stitches recordings with a preview.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
+        row_s += 1
+        k = "profiles"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Output profiles:", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Entry(self.scroll_frame, textvariable=self.settings_stringvars[k], width=self.editor_width)
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="Comma separated [profile name] sections in ini file.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+        row_s += 1
+        ttk.Label(self.scroll_frame, text="Empty to stitch with the settings below only.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
+        row_s += 1
+        k = "disk_space_policy"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="If disk space is low:", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Combobox(self.scroll_frame,
+                                                textvariable=self.settings_stringvars[k],
+                                                values=("reorder", "refuse", "pause", "off"))
+        self.settings_widgets[k].config(width=self.editor_width-2, state="readonly")
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="reorder: smallest first, skip rest, pause: wait for space", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
+        row_s += 1
+        k = "capability_check"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Test settings first:", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Checkbutton(self.scroll_frame, variable=self.settings_intvars[k])
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="Skip settings that fail a short test stitch.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
+        row_s += 1
+        k = "retry_max_attempts"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Retries after known errors:", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Combobox(self.scroll_frame,
+                                                textvariable=self.settings_stringvars[k],
+                                                values=("0", "1", "2", "3", "4"))
+        self.settings_widgets[k].config(width=self.editor_width-2, state="readonly")
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="Retry with safer settings, e.g. without hardware encoding.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
+        if platform != "win32":
+            row_s += 1
+            k = "pause_suspend_children"
+            self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Suspend stitching on pause:", anchor='e', width=25)
+            self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+            self.settings_widgets[k] = ttk.Checkbutton(self.scroll_frame, variable=self.settings_intvars[k])
+            self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+            ttk.Label(self.scroll_frame, text="Pause running recordings too, not only queued ones.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
+        return row_s
+
+    def _populate_input_section(self, row_s):
         row_s += 1
         ttk.Label(self.scroll_frame, text="Input", anchor='se', font=('Arial',16, 'underline')).grid(row=row_s, column=0, padx=2, pady=12, sticky="e")
 
@@ -559,6 +758,14 @@ class BatchStitcher():
         self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
         ttk.Label(self.scroll_frame, text="Filter folders to be stitched. Default is VID_", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
 
+        row_s += 1
+        k = "source_recursive"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Include subfolders:", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Checkbutton(self.scroll_frame, variable=self.settings_intvars[k])
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="Default is off. Finds recordings in nested folders", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
         row_s += 1
         k = "min_recording_duration"
         self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Skip videos shorter than", anchor='e', width=25)
@@ -587,6 +794,9 @@ class BatchStitcher():
         ttk.Label(self.scroll_frame, text="Default is 6", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
 
 
+        return row_s
+
+    def _populate_stitch_section(self, row_s):
         row_s += 1
         ttk.Label(self.scroll_frame, text="Stitch", anchor='se', font=('Arial',16, 'underline')).grid(row=row_s, column=0, padx=2, pady=12, sticky="e")
 
@@ -706,6 +916,14 @@ class BatchStitcher():
         self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
         ttk.Label(self.scroll_frame, text="Set to 0 for middle of recording", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
 
+        row_s += 1
+        k = "auto_reference_time"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Auto reference second", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Checkbutton(self.scroll_frame, variable=self.settings_intvars[k])
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="If 0, use the second with the most detail", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
         row_s += 1
         k = "trim_start"
         self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Trim start", anchor='e', width=25)
@@ -727,6 +945,14 @@ class BatchStitcher():
         ttk.Label(self.scroll_frame, text="<0: Stop before x seconds from end", anchor='w').grid(
             row=row_s, column=2, padx=2, pady=2, sticky="w")
 
+        row_s += 1
+        k = "auto_trim"
+        self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Auto trim", anchor='e', width=25)
+        self.settings_labels[k].grid(row=row_s, column=0, padx=2, pady=2, sticky="e")
+        self.settings_widgets[k] = ttk.Checkbutton(self.scroll_frame, variable=self.settings_intvars[k])
+        self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
+        ttk.Label(self.scroll_frame, text="Also trim still or surface footage at start and end", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
+
         row_s += 1
         k = "logo_path"
         self.settings_labels[k] = ttk.Label(self.scroll_frame, text="Logo path:", anchor='e', width=25)
@@ -746,6 +972,9 @@ class BatchStitcher():
         ttk.Label(self.scroll_frame, text="0 to 60. Default is 30 (= 100% zoom)", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
 
 
+        return row_s
+
+    def _populate_orientation_section(self, row_s):
         row_s += 1
         ttk.Label(self.scroll_frame, text="Orientation", anchor='se', font=('Arial',16, 'underline')).grid(row=row_s, column=0, padx=2, pady=12, sticky="e")
 
@@ -776,6 +1005,9 @@ class BatchStitcher():
         self.settings_widgets[k].grid(row=row_s, column=1, padx=2, pady=2, sticky="w")
         ttk.Label(self.scroll_frame, text="-180 to 180 Degrees, default 0", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
 
+        return row_s
+
+    def _populate_color_section(self, row_s):
         row_s += 1
         ttk.Label(self.scroll_frame, text="Color", anchor='se', font=('Arial',16, 'underline')).grid(row=row_s, column=0, padx=2, pady=12, sticky="e")
         color_settings = ["brightness", "contrast", "highlight", "shadow", "saturation", "temperature", "tint", "sharpness"]
@@ -789,6 +1021,9 @@ class BatchStitcher():
             ttk.Label(self.scroll_frame, text="-100 to 100, default 0", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
 
 
+        return row_s
+
+    def _populate_output_section(self, row_s):
         row_s += 1
         ttk.Label(self.scroll_frame, text="Output", anchor='se', font=('Arial',16, 'underline')).grid(row=row_s, column=0, padx=2, pady=12, sticky="e")
 
@@ -897,6 +1132,9 @@ class BatchStitcher():
         row_s += 1
         ttk.Label(self.scroll_frame, text="Set to 'none' for no audio.", anchor='w').grid(row=row_s, column=2, padx=2, pady=2, sticky="w")
 
+        return row_s
+
+    def _populate_post_processing_section(self, row_s):
         row_s += 1
         ttk.Label(self.scroll_frame, text="Post processing", anchor='se', font=('Arial',16, 'underline')).grid(row=row_s, column=0, padx=2, pady=12, sticky="e")
 
@@ -916,6 +1154,7 @@ class BatchStitcher():
 
         row_s += 1
         ttk.Label(self.scroll_frame, text=" ", anchor='w').grid(row=row_s, column=0,padx=2, pady=2,sticky="w")
+        return row_s
 
     def show(self):
         row = 0
@@ -945,6 +1184,12 @@ class BatchStitcher():
         row += 1
         self.button_cancel = ttk.Button(text='Cancel', command=self._on_cancel, width=self.button_width)
         self.button_cancel.grid(row=row, column=0, padx=(100,0), pady=(15,50), sticky="w")
+        batch_frame = ttk.Frame(self.root)
+        batch_frame.grid(row=row, column=1, pady=(15,50))
+        self.button_pause = ttk.Button(batch_frame, text='Pause', command=self._on_pause, width=self.button_width, state=tk.DISABLED)
+        self.button_pause.pack(side=tk.LEFT, padx=5)
+        self.button_finish = ttk.Button(batch_frame, text='Finish running', command=self._on_finish, width=self.button_width, state=tk.DISABLED)
+        self.button_finish.pack(side=tk.LEFT, padx=5)
         self.button_start = ttk.Button(text='Start', command=self._on_start, width=self.button_width)
         self.button_start.grid(row=row, column=2, padx=(0,100), pady=(15,50), sticky="e")
 
@@ -961,7 +1206,7 @@ class BatchStitcher():
         # self.root.bind_all("<MouseWheel>", _on_mouse_wheel)
 
         # update theme
-        self.set_theme(0)
+        self.set_theme(self._get_theme_index())
 
         # run blocking main loop
         self.root.mainloop()
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Command line version of Batch Stitcher, e.g. for unattended batches on a stitching computer
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import signal
+import argparse
+import threading
+from time import sleep
+from helpers import Helpers
+from prostitchercontroller import ProStitcherController
+from retrypolicy import RetryPolicy
+
+
+class BatchStitcherCli:
+
+    def __init__(self, settings, profiles=None, retry_rules=None):
+        self.stitcher = ProStitcherController()
+        self.stitcher.settings = settings
+        self.stitcher.profiles = profiles or {}
+        self.stitcher.retry_rules = retry_rules or {}
+        self._interrupts = 0
+
+    def _on_interrupt(self, signum, frame):
+        # first Ctrl+C finishes running jobs, the second one cancels them
+        self._interrupts += 1
+        if self._interrupts == 1:
+            print("\nFinishing running jobs. Press Ctrl+C again to cancel them.")
+            self.stitcher.drain()
+        else:
+            self.stitcher.stop()
+
+    def _on_terminate(self, signum, frame):
+        self.stitcher.stop()
+
+    def _on_pause(self, signum, frame):
+        if self.stitcher.is_paused():
+            self.stitcher.resume()
+        else:
+            self.stitcher.pause()
+
+    def _install_signal_handlers(self):
+        signal.signal(signal.SIGINT, self._on_interrupt)
+        signal.signal(signal.SIGTERM, self._on_terminate)
+        if hasattr(signal, "SIGUSR1"):
+            # kill -USR1 <pid> pauses or resumes the batch
+            signal.signal(signal.SIGUSR1, self._on_pause)
+        if hasattr(signal, "SIGUSR2"):
+            # kill -USR2 <pid> finishes running jobs, then stops
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.stitcher.drain())
+
+    def run(self):
+        self._install_signal_handlers()
+        # stitch in a separate thread so signals are handled while waiting for the queue
+        batch = []
+        thread = threading.Thread(target=lambda: batch.append(self.stitcher.stitch()))
+        thread.start()
+        while thread.is_alive():
+            sleep(0.5)
+        thread.join()
+        # a job failed if its last attempt failed
+        return 0 if batch and batch[0].ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stitch all Insta360 Pro 2 recordings in a folder. "
+                    "Ctrl+C finishes running recordings and stops, press twice to cancel. "
+                    "On Linux and macOS, 'kill -USR1 <pid>' pauses and resumes, 'kill -USR2 <pid>' finishes and stops.")
+    parser.add_argument("--ini", default=os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), "batchstitcher.ini"),
+                        help="Settings file")
+    parser.add_argument("--source", help="Source folder, overrides source_dir from the settings file")
+    parser.add_argument("--target", help="Output folder, overrides target_dir from the settings file")
+    parser.add_argument("--profiles", help="Comma separated output profiles")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="Override a setting")
+    parser.add_argument("--suspend-on-pause", action="store_true",
+                        help="Suspend running stitching processes when paused")
+    parser.add_argument("--trace", metavar="FILE", help="Write timing spans as Chrome trace JSON")
+    parser.add_argument("--profile", metavar="FILE", help="Write a cProfile dump of the batch controller")
+    parser.add_argument("--status-port", type=int, metavar="PORT",
+                        help="Serve batch state as JSON and accept commands on this local port")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve Prometheus metrics on this local port")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help="Write Prometheus metrics to this file for the node_exporter textfile collector")
+    parser.add_argument("--enqueue", action="append", default=[], metavar="RECORDING",
+                        help="Add a recording folder to the job spool and exit. A running batch with job_spool = 1 "
+                             "starts it, otherwise the next batch does.")
+    args = parser.parse_args()
+
+    settings = Helpers.read_config(args.ini, ProStitcherController.default_settings)
+    if args.source:
+        settings["source_dir"] = args.source
+    if args.target:
+        settings["target_dir"] = args.target
+    if args.profiles is not None:
+        settings["profiles"] = args.profiles
+    if args.suspend_on_pause:
+        settings["pause_suspend_children"] = 1
+    if args.trace:
+        settings["trace_file"] = args.trace
+    if args.profile:
+        settings["profile_file"] = args.profile
+    if args.status_port is not None:
+        settings["status_port"] = args.status_port
+    if args.metrics_port is not None:
+        settings["metrics_port"] = args.metrics_port
+    if args.metrics_file:
+        settings["metrics_textfile"] = args.metrics_file
+    overrides = {}
+    for value in args.set:
+        if "=" in value:
+            k, v = value.split("=", 1)
+            overrides[k.strip()] = v.strip()
+
+    if not os.path.isdir(settings.get("source_dir") or ""):
+        sys.stderr.write("No valid source folder: '{}'\n".format(settings.get("source_dir")))
+        return 2
+
+    cli = BatchStitcherCli(settings,
+                           Helpers.read_config_sections(args.ini, "profile "),
+                           RetryPolicy.parse_rules(Helpers.read_config_sections(args.ini, "retry").get("", {})))
+    settings.update(cli.stitcher._parse_overrides(overrides))
+    if args.enqueue:
+        return 0 if cli.stitcher.enqueue(args.enqueue) else 1
+    return cli.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Test which hardware and encoder settings work with the installed ProStitcher, cached per ProStitcher binary
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import json
+import hashlib
+import argparse
+import threading
+from helpers import Helpers
+
+
+class CapabilityMatrix:
+
+    matrix_version = 1
+
+    # Settings that decide whether ProStitcher can stitch at all on this computer
+    keys = ("blender_type", "decode_use_hardware", "encode_use_hardware", "output_codec", "encode_profile", "output_format")
+
+    # Values tried by probe_all(), in addition to the current settings
+    options = {
+        "blender_type": ["auto", "cuda", "opencl", "cpu"],
+        "decode_use_hardware": [0, 1],
+        "encode_use_hardware": [0, 1],
+        "output_codec": ["h264", "h265", "prores"],
+        "encode_profile": ["baseline", "main", "high"],
+        "output_format": ["mp4", "mov"],
+    }
+
+    # ProStitcher return codes that mean a configuration is not supported. Other failures, e.g. missing or
+    # unreadable origin files or a killed test, say nothing about the configuration and are not kept.
+    unsupported_codes = (244, 1012, -11, 4294967295)
+
+    # Hardware encoders often support 4K but not 8K, so both resolution classes are tested separately
+    width_classes = {"4k": 3840, "8k": 7680}
+
+    def __init__(self, stitcher_path, cache_path=None):
+        if cache_path is None:
+            cache_path = os.path.join(Helpers.get_datadir(), "BatchStitcher", "capabilities.json")
+        self.stitcher_path = stitcher_path
+        self.cache_path = cache_path
+        self.binary_hash = self.get_binary_hash(stitcher_path)
+        # configuration key -> ProStitcher return code
+        self._results = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_binary_hash(path):
+        """
+        Returns sha256 of the ProStitcher executable, or its path if it cannot be read.
+        """
+        try:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+            return h.hexdigest()
+        except (OSError, TypeError):
+            return str(path)
+
+    @classmethod
+    def get_width_class(cls, width):
+        return "4k" if Helpers.parse_int(width) <= cls.width_classes["4k"] else "8k"
+
+    @classmethod
+    def get_configuration(cls, settings):
+        """
+        Returns the part of settings that is tested, normalised as ProStitcher would use it.
+        """
+        configuration = {k: str(settings.get(k, "")) for k in cls.keys}
+        if sys.platform == "darwin" and configuration["blender_type"] == "cuda":
+            configuration["blender_type"] = "opencl"
+        if configuration["output_codec"] == "prores":
+            # prores has no h264/h265 encoding profile
+            configuration["encode_profile"] = ""
+        configuration["width_class"] = cls.get_width_class(settings.get("width", 0))
+        return configuration
+
+    @classmethod
+    def get_key(cls, configuration):
+        return "/".join(configuration[k] for k in cls.keys + ("width_class",))
+
+    @classmethod
+    def describe(cls, configuration):
+        return "{} {} in {}, {}hardware encoding, {}hardware decoding, {} blender, {}".format(
+            configuration["output_codec"],
+            configuration["encode_profile"] or "",
+            configuration["output_format"],
+            "" if Helpers.parse_int(configuration["encode_use_hardware"]) else "no ",
+            "" if Helpers.parse_int(configuration["decode_use_hardware"]) else "no ",
+            configuration["blender_type"],
+            configuration["width_class"].upper()).replace("  ", " ")
+
+    def load(self):
+        try:
+            if self.cache_path and os.path.isfile(self.cache_path):
+                data = json.loads(Helpers.read_file(self.cache_path, default='{}'))
+                if data.get("version") == self.matrix_version:
+                    results = data.get("binaries", {}).get(self.binary_hash, {}).get("results", {})
+                    self._results = {k: v for k, v in results.items() if self.is_conclusive(v)}
+        except Exception as e:
+            sys.stderr.write("Error reading capability matrix: {}\n".format(str(e)))
+            self._results = {}
+
+    def save(self):
+        if not self.cache_path:
+            return False
+        try:
+            data = {}
+            if os.path.isfile(self.cache_path):
+                data = json.loads(Helpers.read_file(self.cache_path, default='{}'))
+            if data.get("version") != self.matrix_version:
+                data = {"version": self.matrix_version, "binaries": {}}
+            with self._lock:
+                data["binaries"][self.binary_hash] = {"path": self.stitcher_path, "results": dict(self._results)}
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_path = self.cache_path + ".tmp"
+            if Helpers.write_file(tmp_path, json.dumps(data, indent=2)):
+                os.replace(tmp_path, self.cache_path)
+                return True
+        except Exception as e:
+            sys.stderr.write("Error writing capability matrix: {}\n".format(str(e)))
+        return False
+
+    def get(self, settings):
+        """
+        Returns the ProStitcher return code of the test stitch for these settings, or None if not tested yet.
+        """
+        with self._lock:
+            return self._results.get(self.get_key(self.get_configuration(settings)))
+
+    @classmethod
+    def is_conclusive(cls, returncode):
+        """
+        Returns True if a test stitch with this return code shows whether a configuration is supported.
+        """
+        return returncode == 0 or returncode in cls.unsupported_codes
+
+    def set(self, settings, returncode):
+        with self._lock:
+            self._results[self.get_key(self.get_configuration(settings))] = returncode
+
+    def is_supported(self, settings):
+        """
+        Returns False only for settings whose test stitch failed. Untested settings are assumed to work.
+        """
+        returncode = self.get(settings)
+        return returncode is None or returncode == 0
+
+    def get_missing(self, settings_list):
+        """
+        Returns the settings from settings_list that have not been tested yet, one per configuration.
+        """
+        missing = {}
+        for settings in settings_list:
+            if self.get(settings) is None:
+                missing.setdefault(self.get_key(self.get_configuration(settings)), settings)
+        return list(missing.values())
+
+    def probe(self, settings_list, run_test, is_stopping=None, log_info=None):
+        """
+        Runs a test stitch for each untested configuration and stores the results.
+        :param settings_list: list of settings dicts
+        :param run_test: function(settings dict with test width) -> ProStitcher return code
+        """
+        missing = self.get_missing(settings_list)
+        for settings in missing:
+            if is_stopping and is_stopping():
+                break
+            configuration = self.get_configuration(settings)
+            test_settings = dict(settings, width=self.width_classes[configuration["width_class"]])
+            returncode = run_test(test_settings)
+            if returncode is None:
+                continue
+            if not self.is_conclusive(returncode):
+                # test again next time
+                if log_info:
+                    log_info("Testing {}: inconclusive, failed with code {}".format(self.describe(configuration),
+                                                                                   returncode))
+                continue
+            self.set(settings, returncode)
+            if log_info:
+                log_info("Testing {}: {}".format(self.describe(configuration),
+                                                 "ok" if returncode == 0 else f"failed with code {returncode}"))
+        if missing:
+            self.save()
+        return missing
+
+    @classmethod
+    def get_all_configurations(cls, settings):
+        """
+        Returns settings for a full test: each option changed on its own, and all codec, profile, format and
+        hardware encoding combinations, at both resolution classes.
+        """
+        settings_list = []
+        for width in cls.width_classes.values():
+            base = dict(settings, width=width)
+            for k in ("blender_type", "decode_use_hardware"):
+                for v in cls.options[k]:
+                    settings_list.append(dict(base, **{k: v}))
+            for codec in cls.options["output_codec"]:
+                for output_format in cls.options["output_format"]:
+                    for hardware in cls.options["encode_use_hardware"]:
+                        for profile in cls.options["encode_profile"]:
+                            settings_list.append(dict(base, output_codec=codec, output_format=output_format,
+                                                      encode_use_hardware=hardware, encode_profile=profile))
+        return settings_list
+
+    def format_table(self):
+        with self._lock:
+            results = sorted(self._results.items())
+        keys = list(self.keys) + ["width_class", "result"]
+        rows = [keys] + [k.split("/") + ["ok" if rc == 0 else str(rc)] for k, rc in results]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(keys))]
+        return "\n".join("  ".join(v.ljust(widths[i]) for i, v in enumerate(row)) for row in rows)
+
+
+def main():
+    # imported here because prostitchercontroller imports this module
+    from prostitchercontroller import ProStitcherController
+
+    parser = argparse.ArgumentParser(description="Test which settings work with the installed ProStitcher.")
+    parser.add_argument("recording", help="Sample recording folder")
+    parser.add_argument("--ini", default=os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), "batchstitcher.ini"),
+                        help="Settings file")
+    parser.add_argument("--retest", action="store_true", help="Ignore cached results for this ProStitcher")
+    args = parser.parse_args()
+
+    stitcher = ProStitcherController()
+    stitcher.settings = Helpers.read_config(args.ini, ProStitcherController.default_settings)
+    stitcher._prepare_settings()
+    matrix = CapabilityMatrix(stitcher.settings["stitcher_path"])
+    if not args.retest:
+        matrix.load()
+    recording = os.path.abspath(args.recording)
+    try:
+        matrix.probe(CapabilityMatrix.get_all_configurations(stitcher.settings),
+                     lambda s: stitcher.run_capability_test(recording, s),
+                     log_info=print)
+    except KeyboardInterrupt:
+        matrix.save()
+    print(matrix.format_table())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Estimate output sizes of stitching jobs and check them against available disk space
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import threading
+from time import sleep
+from helpers import Helpers
+
+
+class DiskPlanner:
+
+    POLICY_OFF = "off"
+    POLICY_REFUSE = "refuse"
+    POLICY_REORDER = "reorder"
+    POLICY_PAUSE = "pause"
+    policies = (POLICY_OFF, POLICY_REFUSE, POLICY_REORDER, POLICY_PAUSE)
+
+    # Approximate audio bitrates in bits per second, per output audio type
+    audio_bitrates = {
+        "none": 0,
+        "normal": 192 * 1024,
+        "pano": 4 * 192 * 1024,
+        "default": 4 * 192 * 1024,
+    }
+
+    # Container and muxing overhead on top of the raw stream sizes
+    container_overhead = 1.02
+
+    # Templates, parameter files and stitcher logs written to the scratch folder per job
+    scratch_bytes_per_job = 4 * 1024 * 1024
+
+    def __init__(self, target_dir, scratch_dir, policy=POLICY_REORDER, reserve_mb=1024, log_info=None, log_error=None):
+        self.target_dir = target_dir
+        self.scratch_dir = scratch_dir
+        self.policy = policy if policy in self.policies else self.POLICY_REORDER
+        self.reserve = max(0, Helpers.parse_int(reserve_mb)) * 1024 * 1024
+        self.log_info = log_info
+        self.log_error = log_error
+        self._lock = threading.Lock()
+        self._reservations = {}
+        self._low_space_warned = False
+
+    @classmethod
+    def estimate_output_size(cls, bitrate, duration, audio_type="default"):
+        """
+        Estimates the size of a stitched output file in bytes.
+        :param bitrate: video bitrate in bits per second
+        :param duration: stitched (trimmed) duration in seconds
+        :param audio_type: audio type setting
+        """
+        bitrate = max(0, Helpers.parse_int(bitrate))
+        duration = max(0.0, Helpers.parse_float(duration))
+        audio_bitrate = cls.audio_bitrates.get(str(audio_type), cls.audio_bitrates["default"])
+        return int((bitrate + audio_bitrate) / 8 * duration * cls.container_overhead)
+
+    @staticmethod
+    def _device(path):
+        try:
+            return os.stat(path).st_dev
+        except (OSError, TypeError, ValueError):
+            return None
+
+    def _volumes(self):
+        """
+        Returns dict of device id -> path for the target and scratch folders.
+        Folders on the same device share one entry.
+        """
+        volumes = {}
+        for path in (self.target_dir, self.scratch_dir):
+            if path and os.path.isdir(path):
+                try:
+                    volumes.setdefault(os.stat(path).st_dev, path)
+                except OSError:
+                    pass
+        return volumes
+
+    def _requirements(self, target_bytes, scratch_bytes):
+        """
+        Returns dict of device id -> bytes required, combining target and scratch when on the same device.
+        """
+        required = {}
+        for path, size in ((self.target_dir, target_bytes), (self.scratch_dir, scratch_bytes)):
+            if path and os.path.isdir(path):
+                try:
+                    dev = os.stat(path).st_dev
+                    required[dev] = required.get(dev, 0) + size
+                except OSError:
+                    pass
+        return required
+
+    def _outstanding(self, path):
+        """
+        Returns bytes that running jobs are still expected to write to the volume of path.
+        """
+        outstanding = 0
+        dev = self._device(path)
+        if dev is None:
+            return outstanding
+        with self._lock:
+            reservations = list(self._reservations.values())
+        for reservation in reservations:
+            for res_dev, size, output_path in reservation:
+                if res_dev == dev:
+                    written = 0
+                    if output_path:
+                        try:
+                            written = os.path.getsize(output_path)
+                        except OSError:
+                            pass
+                    outstanding += max(0, size - written)
+        return outstanding
+
+    def get_available_space(self, path):
+        """
+        Returns free bytes on the volume of path minus reserve and outstanding writes of running jobs.
+        """
+        try:
+            free = Helpers.get_free_space(path)
+        except OSError:
+            return 0
+        return free - self.reserve - self._outstanding(path)
+
+    def plan(self, jobs):
+        """
+        Checks the total estimated size of all jobs against the free space on target and scratch volumes.
+        :param jobs: list of (name, estimated output bytes) tuples in queue order
+        :return: list of job names to queue, in the order they should be processed
+        """
+        names = [name for name, size in jobs]
+        if self.policy == self.POLICY_OFF:
+            return names
+
+        volumes = self._volumes()
+        free = {}
+        target_free = None
+        target_dev = self._device(self.target_dir) if self.target_dir else None
+        for dev, path in volumes.items():
+            try:
+                space = Helpers.get_free_space(path)
+                free[dev] = space - self.reserve
+                if dev == target_dev:
+                    target_free = space
+            except OSError:
+                free[dev] = 0
+
+        total_target = sum(size for name, size in jobs)
+        total_scratch = self.scratch_bytes_per_job * len(jobs)
+        required = self._requirements(total_target, total_scratch)
+        self._log_info(f"Estimated output size: {self.format_size(total_target)} for {len(jobs)} recordings, "
+                       f"{self.format_size(target_free) if target_free is not None else '?'} free in target folder.")
+
+        fits = all(required[dev] <= free.get(dev, 0) for dev in required)
+        if fits or self.policy == self.POLICY_PAUSE:
+            if not fits:
+                self._log_info("Warning: Not enough disk space for all recordings. "
+                               "Recordings will wait for disk space to become available.")
+            return names
+
+        if self.policy == self.POLICY_REFUSE:
+            self._log_error("ERROR: Not enough disk space for all recordings. "
+                            "Please free up disk space or choose a different output folder.")
+            return []
+
+        # POLICY_REORDER: smallest jobs first, skip those that do not fit, so as many recordings as possible are stitched
+        accepted = []
+        skipped = []
+        remaining = dict(free)
+        for name, size in sorted(jobs, key=lambda job: job[1]):
+            job_required = self._requirements(size, self.scratch_bytes_per_job)
+            if all(job_required[dev] <= remaining.get(dev, 0) for dev in job_required):
+                for dev in job_required:
+                    remaining[dev] -= job_required[dev]
+                accepted.append(name)
+            else:
+                skipped.append(name)
+        if skipped:
+            self._log_info(f"Warning: Not enough disk space for all recordings. "
+                           f"Skipping {len(skipped)} recordings: {', '.join(skipped)}")
+        return accepted
+
+    def reserve_space(self, name, target_bytes, output_path=None):
+        reservation = []
+        target_dev = self._device(self.target_dir)
+        for dev, size in self._requirements(target_bytes, self.scratch_bytes_per_job).items():
+            reservation.append((dev, size, output_path if dev == target_dev else None))
+        with self._lock:
+            self._reservations[name] = reservation
+
+    def release_space(self, name):
+        with self._lock:
+            self._reservations.pop(name, None)
+
+    def has_space(self, target_bytes):
+        for dev, size in self._requirements(target_bytes, self.scratch_bytes_per_job).items():
+            path = self._volumes().get(dev)
+            if path and self.get_available_space(path) < size:
+                return False
+        return True
+
+    def wait_for_space(self, name, target_bytes, is_stopping=None, interval=30):
+        """
+        Checks there is enough space for a job before it starts.
+        With policy 'pause' blocks until space is available or is_stopping() returns True.
+        :return: True if the job can start
+        """
+        if self.policy == self.POLICY_OFF:
+            return True
+        waiting = False
+        while not self.has_space(target_bytes):
+            if self.policy != self.POLICY_PAUSE:
+                self._log_error(f"ERROR: Not enough disk space to stitch {name} "
+                                f"(estimated {self.format_size(target_bytes)}), skipping.")
+                return False
+            if is_stopping and is_stopping():
+                return False
+            if not waiting:
+                self._log_info(f"Waiting for {self.format_size(target_bytes)} of free disk space to stitch {name}.")
+                waiting = True
+            for i in range(max(1, int(interval))):
+                if is_stopping and is_stopping():
+                    return False
+                sleep(1)
+        return True
+
+    def check(self):
+        """
+        Monitors disk usage while jobs are running. Logs a warning once when free space drops below the reserve.
+        :return: True if free space on all volumes is above the reserve
+        """
+        if self.policy == self.POLICY_OFF:
+            return True
+        ok = True
+        for dev, path in self._volumes().items():
+            try:
+                if Helpers.get_free_space(path) < self.reserve:
+                    ok = False
+                    if not self._low_space_warned:
+                        self._log_info(f"Warning: Low disk space on '{path}' "
+                                       f"({self.format_size(Helpers.get_free_space(path))} free).")
+            except OSError:
+                pass
+        self._low_space_warned = not ok
+        return ok
+
+    @staticmethod
+    def format_size(size):
+        size = float(size)
+        for unit in ("B", "KB", "MB", "GB"):
+            if abs(size) < 1024:
+                return f"{round(size, 1)} {unit}"
+            size /= 1024
+        return f"{round(size, 1)} TB"
+
+    def _log_info(self, text):
+        if self.log_info:
+            self.log_info(text)
+        else:
+            print(text)
+
+    def _log_error(self, text):
+        if self.log_error:
+            self.log_error(text)
+        else:
+            sys.stderr.write(text)
+            sys.stderr.write("\n")
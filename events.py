@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Structured events of the stitching controller, delivered to subscribers without blocking the workers
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import atexit
+import weakref
+import threading
+from collections import deque
+from time import time
+
+
+class Event:
+    """
+    Base class of all events. Each event class lists its fields, missing fields are None.
+    """
+
+    fields = ()
+
+    def __init__(self, **kwargs):
+        self.time = time()
+        for field in self.fields:
+            setattr(self, field, kwargs.get(field))
+
+    def to_dict(self):
+        result = {"event": type(self).__name__, "time": self.time}
+        result.update({field: getattr(self, field) for field in self.fields})
+        return result
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join(f"{f}={getattr(self, f)!r}" for f in self.fields))
+
+
+class LogMessage(Event):
+    # level is "info" or "error"
+    fields = ("level", "text")
+
+
+class JobQueued(Event):
+    fields = ("name", "recording", "profile", "priority")
+
+
+class ProbeDone(Event):
+    # seconds is the time ffprobe took
+    fields = ("recording", "duration", "fps", "seconds")
+
+
+class JobStarted(Event):
+    fields = ("name", "recording", "profile", "slot", "attempt", "output_destination", "stitching_duration")
+
+
+class Progress(Event):
+    # sent about once per second while ProStitcher runs
+    fields = ("name", "pid", "elapsed")
+
+
+class JobFinished(Event):
+    fields = ("name", "recording", "profile", "returncode", "output_destination", "output_size",
+              "stitching_duration", "wall_time", "fps", "attempt", "metrics")
+
+
+class JobFailed(Event):
+    # sent for each failed attempt, a retry may follow
+    fields = ("name", "recording", "profile", "returncode", "output_destination", "wall_time", "attempt", "message")
+
+
+class JobCancelled(Event):
+    fields = ("name",)
+
+
+class BatchDone(Event):
+    fields = ("succeeded", "failed", "stopped")
+
+
+class Subscription:
+    """
+    Delivers events to one callback from its own thread. If the callback falls behind by more than
+    maxsize events, the oldest events are dropped instead of slowing down the publisher.
+    """
+
+    # seconds without events after which the delivery thread ends, it is started again by the next event
+    idle_timeout = 5
+
+    def __init__(self, callback, event_types=None, maxsize=1000):
+        self.callback = callback
+        self.event_types = tuple(event_types) if event_types else None
+        self.maxsize = max(1, maxsize)
+        self.dropped = 0
+        self._events = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._delivering = False
+
+    def wants(self, event):
+        return self.event_types is None or isinstance(event, self.event_types)
+
+    def put(self, event):
+        with self._condition:
+            if len(self._events) >= self.maxsize:
+                self._events.popleft()
+                self.dropped += 1
+            self._events.append(event)
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name="Event delivery", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._events:
+                    self._condition.wait(self.idle_timeout)
+                if not self._events:
+                    self._thread = None
+                    self._condition.notify_all()
+                    return
+                event = self._events.popleft()
+                self._delivering = True
+            try:
+                self.callback(event)
+            except Exception as e:
+                sys.stderr.write("Error delivering {}: {}\n".format(type(event).__name__, str(e)))
+            finally:
+                with self._condition:
+                    self._delivering = False
+                    self._condition.notify_all()
+
+    def flush(self, timeout=10):
+        """
+        Waits until all events so far were delivered.
+        :return: True if all events were delivered within timeout seconds
+        """
+        if self._thread is threading.current_thread():
+            return False
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._events and not self._delivering, timeout)
+
+
+class EventBus:
+    """
+    Thread-safe fan-out of events to subscribers. Publishing never blocks on subscribers.
+    """
+
+    def __init__(self):
+        self._subscriptions = []
+        self._lock = threading.Lock()
+        _buses.add(self)
+
+    def subscribe(self, callback, event_types=None, maxsize=1000):
+        """
+        :param callback: called with each event, from a separate thread
+        :param event_types: event classes to receive, None for all
+        :param maxsize: number of undelivered events after which the oldest are dropped
+        :return: Subscription, to pass to unsubscribe()
+        """
+        subscription = Subscription(callback, event_types, maxsize)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(event):
+                subscription.put(event)
+
+    def flush(self, timeout=10):
+        """
+        Waits until all subscribers received the events published so far.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.flush(timeout)
+
+
+# deliver remaining events, e.g. the last log messages, before the interpreter exits
+_buses = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all():
+    for bus in list(_buses):
+        bus.flush(5)
@@ -14,12 +14,22 @@ import pathlib
 import string
 import os.path
 import configparser
+import threading
 from os import scandir
+from concurrent.futures import ThreadPoolExecutor
 from math import sin, cos, degrees, atan2, asin, pi
+from tracing import tracer
 
 
 class Helpers:
 
+    # Name for the configparser default section when reading sections without inheriting DEFAULT values
+    _no_default_section = "__no_default_section__"
+
+    # directory path -> (mtime_ns, list of file paths in directory, list of subdirectory paths)
+    _dir_size_cache = {}
+    _dir_size_cache_lock = threading.Lock()
+
     @staticmethod
     def get_datadir():
         home = pathlib.Path.home()
@@ -42,19 +52,92 @@ class Helpers:
         return free
 
     @staticmethod
-    def get_used_space(folders=(), whole_disk=False):
+    def get_used_space(folders=(), whole_disk=False, max_workers=8):
         total_used = 0
         for f in folders:
             if whole_disk:
                 total, used, free = shutil.disk_usage(f)
                 total_used += used
             else:
-                for path, dirs, files in os.walk(f):
-                    for f in files:
-                        fp = os.path.join(path, f)
-                        total_used += os.path.getsize(fp)
+                total_used += sum(Helpers.get_subdir_sizes(f, max_workers=max_workers).values())
+                total_used += Helpers._get_dir_files_size(f)[0]
         return total_used
 
+    @staticmethod
+    def _get_dir_files_size(path):
+        """
+        Returns (size of files directly in path, list of subdirectory paths).
+        The directory listing is memoized by directory mtime, which changes when entries are added, removed or
+        renamed. File sizes are read each time, as files that grow in place, e.g. a running output or a copy in
+        progress, do not change the mtime of their directory. Symlinks are not followed.
+        """
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return 0, []
+        with Helpers._dir_size_cache_lock:
+            cached = Helpers._dir_size_cache.get(path)
+        if cached and cached[0] == mtime_ns:
+            size = 0
+            for file_path in cached[1]:
+                try:
+                    size += os.stat(file_path, follow_symlinks=False).st_size
+                except OSError:
+                    pass
+            return size, cached[2]
+
+        size = 0
+        files = []
+        subdirs = []
+        try:
+            with scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            # DirEntry caches the stat result. On Windows it comes with the directory listing.
+                            size += entry.stat(follow_symlinks=False).st_size
+                            files.append(entry.path)
+                    except OSError:
+                        pass
+        except OSError:
+            return 0, []
+        with Helpers._dir_size_cache_lock:
+            Helpers._dir_size_cache[path] = (mtime_ns, files, subdirs)
+        return size, subdirs
+
+    @staticmethod
+    def get_tree_size(path):
+        """
+        Returns the total size in bytes of all files below path.
+        """
+        total = 0
+        pending = [path]
+        while pending:
+            size, subdirs = Helpers._get_dir_files_size(pending.pop())
+            total += size
+            pending.extend(subdirs)
+        return total
+
+    @staticmethod
+    def get_subdir_sizes(path, startswith=None, max_workers=8):
+        """
+        Returns dict of subdirectory name -> total size in bytes for the direct subdirectories of path,
+        optionally filtered by prefix. Subdirectories are sized in parallel.
+        Can be used as a size index of the recordings in a source folder.
+        """
+        names = Helpers.get_subdirs(path, startswith, sort=True)
+        if not names:
+            return {}
+        paths = [os.path.join(path, name) for name in names]
+        if max_workers and max_workers > 1 and len(paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+                sizes = list(executor.map(Helpers.get_tree_size, paths))
+        else:
+            sizes = [Helpers.get_tree_size(p) for p in paths]
+        return dict(zip(names, sizes))
+
     @staticmethod
     def get_drives():
         drives = []
@@ -76,6 +159,7 @@ class Helpers:
         return drives
 
     @staticmethod
+    @tracer.traced("get_subdirs", "io")
     def get_subdirs(path, startswith=None, sort=True):
         result = []
         if os.path.isdir(path):
@@ -254,16 +338,51 @@ class Helpers:
             print("Error reading config file: {}".format(str(e)))
         return config_settings
 
+    @staticmethod
+    def read_config_sections(config_file, prefix=""):
+        """
+        Reads all sections whose name starts with prefix, e.g. "profile " for [profile web].
+        Only values set in the section itself are returned, not values inherited from DEFAULT.
+        :return: dictionary of section name without prefix -> dictionary of settings as strings
+        """
+        sections = {}
+        try:
+            config = configparser.ConfigParser(default_section=Helpers._no_default_section, interpolation=None)
+            if os.path.isfile(config_file):
+                config.read(config_file)
+                for name in config.sections():
+                    if name.startswith(prefix) and name != "DEFAULT":
+                        sections[name[len(prefix):].strip()] = dict(config[name].items())
+        except Exception as e:
+            print("Error reading config file sections: {}".format(str(e)))
+        return sections
+
     @staticmethod
     def write_config(config_file, settings, section="DEFAULT"):
         try:
-            config = configparser.ConfigParser()
+            # values are written as they are, other sections are read without interpolation
+            config = configparser.ConfigParser(interpolation=None)
+            # keep other sections, e.g. profiles
+            try:
+                previous = configparser.ConfigParser(default_section=Helpers._no_default_section, interpolation=None)
+                if os.path.isfile(config_file):
+                    previous.read(config_file)
+                for name in previous.sections():
+                    if name != section:
+                        config.add_section(name)
+                        for key, value in previous[name].items():
+                            config.set(name, key, value)
+            except (configparser.Error, ValueError) as e:
+                # don't overwrite sections that could not be read
+                print("Error reading existing config file sections: {}".format(str(e)))
+                return False
             config[section] = {}
             if not settings:
                 settings = {}
             for key in settings.keys():
                 if settings.get(key) is not None:
-                    config[section][key] = str(settings.get(key))
+                    # read_config interpolates, so % is escaped
+                    config[section][key] = str(settings.get(key)).replace("%", "%%")
                 else:
                     config[section][key] = ''
             with open(config_file, "w") as file:
@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Persistent queue of stitching jobs that survives restarts of Batch Stitcher, stored in SQLite
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import json
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from time import time
+from helpers import Helpers
+
+
+class JobSpool:
+    """
+    Each entry is a recording and profile queued by a batch, or a single job added with submit().
+    Entries are "queued" until a worker claims them, then "running" until they are "done", "failed" or "cancelled".
+    Entries of batches that ended without finishing them go back to "queued" and are started again by the next batch.
+    One batch at a time should use a spool file.
+    """
+
+    KIND_RECORDING = "recording"
+    KIND_JOB = "job"
+
+    STATE_QUEUED = "queued"
+    STATE_RUNNING = "running"
+    STATE_DONE = "done"
+    STATE_FAILED = "failed"
+    STATE_CANCELLED = "cancelled"
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            source_dir TEXT NOT NULL,
+            recording TEXT NOT NULL,
+            name TEXT NOT NULL,
+            profile TEXT,
+            job TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            state TEXT NOT NULL,
+            owner TEXT,
+            returncode INTEGER,
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority, id);
+    """
+
+    # Days after which finished entries are removed
+    keep_days = 30
+
+    # Seconds between updates of the entries this process runs, and after which entries of a process that stopped
+    # updating them are started again
+    heartbeat_interval = 60
+    stale_seconds = 300
+
+    def __init__(self, spool_path=None):
+        if not spool_path:
+            spool_path = os.path.join(Helpers.get_datadir(), "BatchStitcher", "job_spool.db")
+        self.spool_path = spool_path
+        # identifies the entries claimed by this process
+        self.owner = "{}:{}".format(socket.gethostname(), os.getpid())
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat = None
+
+    @contextmanager
+    def _connect(self):
+        # one connection per call, so workers can use the spool from their own threads
+        connection = sqlite3.connect(self.spool_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def open(self, recover=True):
+        """
+        Creates the spool file if needed and removes old finished entries.
+        :param recover: put entries of batches that ended without finishing them back in the queue.
+                        False for processes that only add entries.
+        returns True if the spool can be used
+        """
+        try:
+            spool_dir = os.path.dirname(self.spool_path)
+            if spool_dir and not os.path.exists(spool_dir):
+                os.makedirs(spool_dir)
+            with self._connect() as connection:
+                connection.executescript(self.schema)
+                if recover:
+                    rows = connection.execute("SELECT id, owner, updated FROM jobs WHERE state = ? AND owner IS NOT ?",
+                                              (self.STATE_RUNNING, self.owner)).fetchall()
+                    for row in rows:
+                        if self.is_owner_gone(row["owner"], row["updated"]):
+                            # only if it was not claimed again in the meantime
+                            connection.execute("UPDATE jobs SET state = ?, owner = NULL, updated = ? "
+                                               "WHERE id = ? AND state = ? AND owner IS ?",
+                                               (self.STATE_QUEUED, time(), row["id"], self.STATE_RUNNING, row["owner"]))
+                connection.execute("DELETE FROM jobs WHERE state IN (?, ?, ?) AND updated < ?",
+                                   (self.STATE_DONE, self.STATE_FAILED, self.STATE_CANCELLED,
+                                    time() - self.keep_days * 86400))
+            return True
+        except (sqlite3.Error, OSError) as e:
+            sys.stderr.write("Error opening job spool '{}': {}\n".format(self.spool_path, str(e)))
+        return False
+
+    def is_owner_gone(self, owner, updated):
+        """
+        Returns True if the process that claimed an entry ended: its process is not running on this computer,
+        or it has not updated the entry for stale_seconds.
+        """
+        if not owner or time() - (updated or 0) > self.stale_seconds:
+            return True
+        host, _, pid = owner.rpartition(":")
+        if host != socket.gethostname():
+            return False
+        return not self.is_process_alive(Helpers.parse_int(pid))
+
+    @staticmethod
+    def is_process_alive(pid):
+        if pid <= 0:
+            return False
+        if sys.platform == "win32":
+            # os.kill would end the process on Windows
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not handle:
+                return False
+            try:
+                exit_code = ctypes.c_ulong()
+                kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+                return exit_code.value == 259  # STILL_ACTIVE
+            finally:
+                kernel32.CloseHandle(handle)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # running as another user
+            return True
+        except OSError:
+            return False
+        return True
+
+    def start_heartbeat(self):
+        """
+        Updates the entries run by this process every heartbeat_interval seconds, so other batches can tell that
+        they are still running.
+        """
+        if self._heartbeat:
+            return
+        self._heartbeat_stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="Job spool heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self):
+        if self._heartbeat:
+            self._heartbeat_stop.set()
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _heartbeat_loop(self):
+        while not self._heartbeat_stop.wait(self.heartbeat_interval):
+            try:
+                with self._connect() as connection:
+                    connection.execute("UPDATE jobs SET updated = ? WHERE state = ? AND owner = ?",
+                                       (time(), self.STATE_RUNNING, self.owner))
+            except sqlite3.Error as e:
+                sys.stderr.write("Error updating job spool: {}\n".format(str(e)))
+
+    def add(self, kind, source_dir, recording, name, profile=None, job=None, priority=0):
+        """
+        :param kind: KIND_RECORDING for a recording and profile that may be split into segments,
+                     KIND_JOB for a job that is stitched as is
+        :param job: dict with overrides, suffix and output destination of the job
+        :return: id of the entry, or None
+        """
+        try:
+            now = time()
+            with self._connect() as connection:
+                cursor = connection.execute(
+                    "INSERT INTO jobs (kind, source_dir, recording, name, profile, job, priority, state, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, source_dir, recording, name, profile, json.dumps(job or {}), priority,
+                     self.STATE_QUEUED, now, now))
+                return cursor.lastrowid
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            sys.stderr.write("Error adding {} to job spool: {}\n".format(name, str(e)))
+        return None
+
+    def get_queued(self):
+        """
+        returns list of dicts of the queued entries, in the order they should start
+        """
+        try:
+            with self._connect() as connection:
+                rows = connection.execute("SELECT * FROM jobs WHERE state = ? ORDER BY priority, id",
+                                          (self.STATE_QUEUED,)).fetchall()
+        except sqlite3.Error as e:
+            sys.stderr.write("Error reading job spool: {}\n".format(str(e)))
+            return []
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            try:
+                entry["job"] = json.loads(entry["job"] or "{}")
+            except ValueError:
+                entry["job"] = {}
+            entries.append(entry)
+        return entries
+
+    def claim(self, spool_id):
+        """
+        Marks an entry as running by this process, in one transaction so no other batch starts it too.
+        Segments of the same entry can claim it again.
+        returns True if the job can start
+        """
+        try:
+            with self._connect() as connection:
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute("SELECT state, owner FROM jobs WHERE id = ?", (spool_id,)).fetchone()
+                claimed = row is not None and (row["state"] == self.STATE_QUEUED
+                                               or (row["state"] == self.STATE_RUNNING and row["owner"] == self.owner))
+                if claimed:
+                    connection.execute("UPDATE jobs SET state = ?, owner = ?, updated = ? WHERE id = ?",
+                                       (self.STATE_RUNNING, self.owner, time(), spool_id))
+                connection.execute("COMMIT")
+                return claimed
+        except sqlite3.Error as e:
+            sys.stderr.write("Error claiming job {} in job spool: {}\n".format(spool_id, str(e)))
+        # stitch anyway, the spool is only a record of the queue
+        return True
+
+    def set_state(self, spool_ids, state, returncode=None):
+        self._update(spool_ids, "state = ?, owner = NULL, returncode = ?", (state, returncode))
+
+    def set_priority(self, spool_ids, priority):
+        self._update(spool_ids, "priority = ?", (priority,))
+
+    def _update(self, spool_ids, assignments, values):
+        spool_ids = [i for i in spool_ids if i]
+        if not spool_ids:
+            return
+        try:
+            with self._connect() as connection:
+                connection.execute("UPDATE jobs SET {}, updated = ? WHERE id IN ({})".format(
+                    assignments, ", ".join("?" * len(spool_ids))), tuple(values) + (time(),) + tuple(spool_ids))
+        except sqlite3.Error as e:
+            sys.stderr.write("Error updating job spool: {}\n".format(str(e)))
@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Detect hung ProStitcher processes from their expected runtime and the growth of their log and output files
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import json
+import threading
+import subprocess
+from time import time
+from helpers import Helpers
+
+
+class Watchdog:
+
+    def __init__(self, paths, expected_runtime=0, timeout_factor=3, stall_timeout=600):
+        """
+        :param paths: files that grow while the stitcher makes progress, e.g. stitcher log and output file
+        :param expected_runtime: expected stitching time in seconds, 0 if unknown
+        :param timeout_factor: the job is stopped after expected_runtime * timeout_factor, 0 for no limit
+        :param stall_timeout: the job is stopped if no file grows for this many seconds, 0 to disable
+        """
+        self.paths = [p for p in paths if p]
+        self.expected_runtime = max(0, expected_runtime or 0)
+        self.stall_timeout = max(0, Helpers.parse_int(stall_timeout))
+        self.timeout = 0
+        if self.expected_runtime and timeout_factor:
+            # allow at least the stall timeout for starting up
+            self.timeout = max(self.stall_timeout, self.expected_runtime * Helpers.parse_float(timeout_factor))
+        self.started = time()
+        self._last_progress = self.started
+        self._sizes = {}
+        self._suspended_at = None
+
+    def suspend(self):
+        """
+        Stops checking while the process is suspended.
+        """
+        if self._suspended_at is None:
+            self._suspended_at = time()
+
+    def resume(self):
+        """
+        Continues checking. The time the process was suspended does not count as runtime or stall.
+        """
+        if self._suspended_at is not None:
+            suspended = time() - self._suspended_at
+            self.started += suspended
+            self._last_progress += suspended
+            self._suspended_at = None
+
+    def check(self):
+        """
+        Returns the reason the job should be stopped, or None while it is making progress.
+        """
+        if self._suspended_at is not None:
+            return None
+        now = time()
+        for path in self.paths:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = -1
+            if size != self._sizes.get(path, -1):
+                self._sizes[path] = size
+                self._last_progress = now
+        if self.stall_timeout and now - self._last_progress > self.stall_timeout:
+            return "no progress for {}s".format(int(now - self._last_progress))
+        if self.timeout and now - self.started > self.timeout:
+            return "running for {}s, expected {}s".format(int(now - self.started), int(self.expected_runtime))
+        return None
+
+    @staticmethod
+    def terminate(p, grace_period=10):
+        """
+        Terminates a process, and kills it if it does not exit within grace_period seconds.
+        """
+        try:
+            p.terminate()
+            try:
+                p.wait(grace_period)
+            except subprocess.TimeoutExpired:
+                p.kill()
+                p.wait(grace_period)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            sys.stderr.write("Error stopping process {}: {}\n".format(p.pid, str(e)))
+
+
+class RuntimeHistory:
+
+    history_version = 1
+
+    # Settings that have the largest effect on stitching speed
+    keys = ("width", "stitching_mode", "sampling_level", "blender_type", "output_codec", "encode_use_hardware")
+
+    # Weight of the latest measurement in the running average
+    weight = 0.3
+
+    def __init__(self, history_path=None):
+        if history_path is None:
+            history_path = os.path.join(Helpers.get_datadir(), "BatchStitcher", "fps_history.json")
+        self.history_path = history_path
+        # settings key -> average stitching fps
+        self._fps = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_key(cls, settings):
+        return "/".join(str(settings.get(k, "")) for k in cls.keys)
+
+    def load(self):
+        try:
+            if self.history_path and os.path.isfile(self.history_path):
+                data = json.loads(Helpers.read_file(self.history_path, default='{}'))
+                if data.get("version") == self.history_version:
+                    self._fps = data.get("fps", {})
+        except Exception as e:
+            sys.stderr.write("Error reading stitching history: {}\n".format(str(e)))
+            self._fps = {}
+
+    def save(self):
+        if not self.history_path:
+            return False
+        try:
+            history_dir = os.path.dirname(self.history_path)
+            if history_dir and not os.path.exists(history_dir):
+                os.makedirs(history_dir)
+            with self._lock:
+                data = json.dumps({"version": self.history_version, "fps": self._fps})
+            tmp_path = self.history_path + ".tmp"
+            if Helpers.write_file(tmp_path, data):
+                os.replace(tmp_path, self.history_path)
+                return True
+        except Exception as e:
+            sys.stderr.write("Error writing stitching history: {}\n".format(str(e)))
+        return False
+
+    def add(self, settings, fps):
+        if not fps or fps <= 0:
+            return
+        key = self.get_key(settings)
+        with self._lock:
+            if key in self._fps:
+                self._fps[key] = round(self._fps[key] * (1 - self.weight) + fps * self.weight, 2)
+            else:
+                self._fps[key] = round(fps, 2)
+
+    def get_expected_runtime(self, settings, stitching_duration, input_fps):
+        """
+        Returns expected stitching time in seconds from the average fps of earlier jobs with the same settings,
+        or 0 if there are none.
+        """
+        with self._lock:
+            fps = self._fps.get(self.get_key(settings))
+        if not fps:
+            return 0
+        return Helpers.parse_float(input_fps) * stitching_duration / fps
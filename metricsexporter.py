@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Stitching throughput metrics in the Prometheus text format, served over HTTP or written for the textfile collector
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from helpers import Helpers
+from events import JobQueued, ProbeDone, JobFinished, JobFailed, JobCancelled
+
+
+class Histogram:
+    """
+    Counts observed values in cumulative buckets, like a Prometheus histogram.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def format(self, name):
+        lines = []
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append('{}_bucket{{le="{}"}} {}'.format(name, MetricsCollector.format_value(bound), count))
+        lines.append('{}_bucket{{le="+Inf"}} {}'.format(name, self.count))
+        lines.append("{}_sum {}".format(name, MetricsCollector.format_value(round(self.sum, 6))))
+        lines.append("{}_count {}".format(name, self.count))
+        return lines
+
+
+class MetricsCollector:
+    """
+    Updates counters and histograms from the events of a controller. Queued and running jobs are taken from
+    the controller, as jobs that end early, e.g. with a bad trim window, send no event when they end.
+    """
+
+    prefix = "batchstitcher_"
+
+    fps_buckets = (1, 2, 5, 10, 15, 20, 30, 45, 60, 90)
+    probe_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, controller):
+        self.controller = controller
+        # names of cancelled jobs that did not end yet, not counted as failed when they end
+        self._cancelled = set()
+        self.counters = {"jobs_done": 0, "jobs_failed": 0, "jobs_cancelled": 0, "seconds_stitched": 0.0,
+                         "wall_seconds": 0.0, "output_bytes": 0}
+        # ProStitcher exit code -> number of jobs
+        self.exit_codes = {}
+        self.fps = Histogram(self.fps_buckets)
+        self.probe_seconds = Histogram(self.probe_buckets)
+        self._lock = threading.Lock()
+        self._events = controller.events
+        self.subscription = self._events.subscribe(self._on_event, (JobQueued, ProbeDone, JobFinished, JobFailed, JobCancelled),
+                                                   maxsize=10000)
+
+    def close(self):
+        self._events.unsubscribe(self.subscription)
+
+    def _on_event(self, event):
+        with self._lock:
+            if isinstance(event, JobQueued):
+                self._cancelled.discard(event.name)
+            elif isinstance(event, ProbeDone):
+                self.probe_seconds.observe(Helpers.parse_float(event.seconds))
+            elif isinstance(event, JobCancelled):
+                self._cancelled.add(event.name)
+                self.counters["jobs_cancelled"] += 1
+            elif isinstance(event, (JobFinished, JobFailed)):
+                cancelled = event.name in self._cancelled
+                self._cancelled.discard(event.name)
+                self.exit_codes[event.returncode] = self.exit_codes.get(event.returncode, 0) + 1
+                self.counters["wall_seconds"] += event.wall_time or 0
+                if isinstance(event, JobFinished):
+                    self.counters["jobs_done"] += 1
+                    self.counters["seconds_stitched"] += event.stitching_duration or 0
+                    self.counters["output_bytes"] += event.output_size or 0
+                    self.fps.observe(Helpers.parse_float(event.fps))
+                elif not cancelled:
+                    self.counters["jobs_failed"] += 1
+
+    @staticmethod
+    def format_value(value):
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+
+    def _add(self, lines, name, kind, text, samples):
+        """
+        :param samples: list of (labels, value), labels as 'code="1"' or ""
+        """
+        name = self.prefix + name
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append("{}{} {}".format(name, "{" + labels + "}" if labels else "", self.format_value(value)))
+
+    def format(self):
+        """
+        returns all metrics in the Prometheus text exposition format
+        """
+        lines = []
+        queued = len(self.controller.get_queue())
+        running = len(self.controller.get_running())
+        with self._lock:
+            counters = dict(self.counters)
+            self._add(lines, "jobs_queued", "gauge", "Jobs waiting in the queue.", [("", queued)])
+            self._add(lines, "jobs_running", "gauge", "Jobs being stitched.", [("", running)])
+            self._add(lines, "jobs_done_total", "counter", "Jobs stitched successfully.", [("", counters["jobs_done"])])
+            self._add(lines, "jobs_failed_total", "counter", "Failed stitching attempts, including attempts that were retried.",
+                      [("", counters["jobs_failed"])])
+            self._add(lines, "jobs_cancelled_total", "counter", "Jobs cancelled before they ended.",
+                      [("", counters["jobs_cancelled"])])
+            self._add(lines, "stitched_seconds_total", "counter", "Seconds of recordings stitched.",
+                      [("", round(counters["seconds_stitched"], 3))])
+            self._add(lines, "stitching_wall_seconds_total", "counter", "Seconds ProStitcher ran.",
+                      [("", round(counters["wall_seconds"], 3))])
+            self._add(lines, "output_bytes_total", "counter", "Bytes of stitched video written.",
+                      [("", counters["output_bytes"])])
+            self._add(lines, "prostitcher_exit_total", "counter", "ProStitcher runs by exit code.",
+                      [(f'code="{code}"', count) for code, count in sorted(self.exit_codes.items())])
+            name = self.prefix + "job_fps"
+            lines.append(f"# HELP {name} Stitching speed of successful jobs in frames per second.")
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(self.fps.format(name))
+            name = self.prefix + "probe_seconds"
+            lines.append(f"# HELP {name} Time ffprobe took to read a recording.")
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(self.probe_seconds.format(name))
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0].rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.exporter.collector.format().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes are not logged
+        pass
+
+
+class MetricsExporter:
+
+    def __init__(self, controller, host="127.0.0.1", port=0, textfile="", interval=15):
+        """
+        :param controller: ProStitcherController
+        :param host: interface to listen on, 127.0.0.1 for this computer only, 0.0.0.0 for all
+        :param port: TCP port for GET /metrics, 0 to not serve metrics over HTTP
+        :param textfile: path of a .prom file for the node_exporter textfile collector, empty for none
+        :param interval: seconds between updates of the textfile
+        """
+        self.controller = controller
+        self.host = host or "127.0.0.1"
+        self.port = max(0, Helpers.parse_int(port))
+        self.textfile = textfile or ""
+        self.interval = max(1, Helpers.parse_int(interval, 15))
+        self.collector = None
+        self._httpd = None
+        self._stop_event = threading.Event()
+        self._writer = None
+
+    def start(self):
+        """
+        returns True if metrics are served or written
+        """
+        self.collector = MetricsCollector(self.controller)
+        if self.port:
+            try:
+                self._httpd = ThreadingHTTPServer((self.host, self.port), MetricsRequestHandler)
+                self._httpd.daemon_threads = True
+                self._httpd.exporter = self
+                threading.Thread(target=self._httpd.serve_forever, name="Metrics server", daemon=True).start()
+                self.controller._log_info("Metrics on http://{}:{}/metrics".format(self.host, self.port))
+            except OSError as e:
+                self._httpd = None
+                self.controller._log_error("Could not start metrics server on {}:{}: {}".format(self.host, self.port, str(e)))
+        if self.textfile:
+            self._stop_event.clear()
+            self._writer = threading.Thread(target=self._write_loop, name="Metrics textfile", daemon=True)
+            self._writer.start()
+        if not self._httpd and not self._writer:
+            self.collector.close()
+            self.collector = None
+            return False
+        return True
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        if self._writer:
+            self._stop_event.set()
+            self._writer.join()
+            self._writer = None
+        if self.collector:
+            self.collector.close()
+
+    def _write_loop(self):
+        while not self._stop_event.wait(self.interval):
+            self.write_textfile()
+        # final values of the batch
+        self.collector.subscription.flush(5)
+        self.write_textfile()
+
+    def write_textfile(self):
+        """
+        Replaces the textfile in one step, so the collector never reads a partly written file.
+        """
+        try:
+            textfile_dir = os.path.dirname(self.textfile)
+            if textfile_dir and not os.path.exists(textfile_dir):
+                os.makedirs(textfile_dir)
+            tmp_path = self.textfile + ".tmp"
+            if Helpers.write_file(tmp_path, self.collector.format()):
+                os.replace(tmp_path, self.textfile)
+                return True
+        except Exception as e:
+            sys.stderr.write("Error writing metrics file: {}\n".format(str(e)))
+        return False
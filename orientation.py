@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Conversions between euler angles and quaternions for many recordings at once, and level horizon corrections
+from the gravity calibration of the camera
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import argparse
+import xml.etree.ElementTree as et
+from math import atan2, hypot, degrees
+from helpers import Helpers
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Orientation:
+    """
+    Batched versions of Helpers.euler_degrees_to_quaternion and Helpers.quaternion_to_euler_degrees.
+    Values are rounded like the scalar versions. Quaternions are the same, angles can differ from the scalar
+    versions in the last bits (below 1e-12 degrees) as numpy and math round differently. Without numpy, the scalar
+    versions are called for each value.
+    """
+
+    # decimals of parse_float, used by the scalar versions
+    precision = 8
+
+    @staticmethod
+    def _to_array(values):
+        try:
+            return numpy.round(numpy.asarray(values, dtype=numpy.float64), Orientation.precision)
+        except (TypeError, ValueError):
+            # e.g. strings with decimal commas
+            return numpy.array([Helpers.parse_float(v) for v in values], dtype=numpy.float64)
+
+    @staticmethod
+    def euler_degrees_to_quaternions(rolls_x, pitches_y, yaws_z, y_up=False):
+        """
+        :param rolls_x, pitches_y, yaws_z: lists of angles in degrees, of the same length
+        :return: lists qx, qy, qz, qw
+        """
+        if numpy is None:
+            quaternions = [Helpers.euler_degrees_to_quaternion(r, p, y, y_up=y_up)
+                           for r, p, y in zip(rolls_x, pitches_y, yaws_z)]
+            return tuple(list(q) for q in zip(*quaternions)) if quaternions else ([], [], [], [])
+        if y_up:
+            pitches_y, yaws_z = yaws_z, pitches_y
+        half_roll = numpy.radians(Orientation._to_array(rolls_x)) / 2
+        half_pitch = numpy.radians(Orientation._to_array(pitches_y)) / 2
+        half_yaw = numpy.radians(Orientation._to_array(yaws_z)) / 2
+        sr, cr = numpy.sin(half_roll), numpy.cos(half_roll)
+        sp, cp = numpy.sin(half_pitch), numpy.cos(half_pitch)
+        sy, cy = numpy.sin(half_yaw), numpy.cos(half_yaw)
+        qx = sr * cp * cy - cr * sp * sy
+        qy = cr * sp * cy + sr * cp * sy
+        qz = cr * cp * sy - sr * sp * cy
+        qw = cr * cp * cy + sr * sp * sy
+        return tuple(numpy.round(q, Orientation.precision).tolist() for q in (qx, qy, qz, qw))
+
+    @staticmethod
+    def quaternions_to_euler_degrees(qx, qy, qz, qw):
+        """
+        :param qx, qy, qz, qw: lists of quaternion components, of the same length
+        :return: lists rolls_x, pitches_y, yaws_z in degrees
+        """
+        if numpy is None:
+            angles = [Helpers.quaternion_to_euler_degrees(x, y, z, w) for x, y, z, w in zip(qx, qy, qz, qw)]
+            return tuple(list(a) for a in zip(*angles)) if angles else ([], [], [])
+        qx, qy, qz, qw = (Orientation._to_array(q) for q in (qx, qy, qz, qw))
+        ysqr = qy * qy
+        rolls_x = numpy.degrees(numpy.arctan2(2.0 * (qw * qx + qy * qz), 1.0 - 2.0 * (qx * qx + ysqr)))
+        pitches_y = numpy.degrees(numpy.arcsin(numpy.clip(2.0 * (qw * qy - qz * qx), -1.0, 1.0)))
+        yaws_z = numpy.degrees(numpy.arctan2(2.0 * (qw * qz + qx * qy), 1.0 - 2.0 * (ysqr + qz * qz)))
+        return rolls_x.tolist(), pitches_y.tolist(), yaws_z.tolist()
+
+    @staticmethod
+    def multiply_quaternions(a, b):
+        """
+        Hamilton products a * b, i.e. the rotation b followed by a.
+        :param a, b: tuples of lists qx, qy, qz, qw, of the same length
+        :return: lists qx, qy, qz, qw
+        """
+        if numpy is None:
+            products = ([], [], [], [])
+            for ax, ay, az, aw, bx, by, bz, bw in zip(*a, *b):
+                for values, value in zip(products, (aw * bx + ax * bw + ay * bz - az * by,
+                                                    aw * by - ax * bz + ay * bw + az * bx,
+                                                    aw * bz + ax * by - ay * bx + az * bw,
+                                                    aw * bw - ax * bx - ay * by - az * bz)):
+                    values.append(round(value, Orientation.precision))
+            return products
+        ax, ay, az, aw = (numpy.asarray(q, dtype=numpy.float64) for q in a)
+        bx, by, bz, bw = (numpy.asarray(q, dtype=numpy.float64) for q in b)
+        products = (aw * bx + ax * bw + ay * bz - az * by,
+                    aw * by - ax * bz + ay * bw + az * bx,
+                    aw * bz + ax * by - ay * bx + az * bw,
+                    aw * bw - ax * bx - ay * by - az * bz)
+        return tuple(numpy.round(q, Orientation.precision).tolist() for q in products)
+
+    @staticmethod
+    def level_correction(gravity_x, gravity_y, gravity_z):
+        """
+        Returns roll_x, tilt_y and pan_z in degrees that level the horizon of a camera whose gravity calibration
+        is (gravity_x, gravity_y, gravity_z). The rotation turns the measured gravity onto the down axis -y of
+        the y up coordinates used for diff_quat. A missing calibration returns no correction.
+        This assumes that the calibration is in the same coordinates as diff_quat, which has not been checked with
+        ProStitcher, and ProStitcher also uses the calibration itself. Check the result on one recording first.
+        """
+        gravity_x = Helpers.parse_float(gravity_x)
+        gravity_y = Helpers.parse_float(gravity_y)
+        gravity_z = Helpers.parse_float(gravity_z)
+        roll_x = degrees(atan2(gravity_z, -gravity_y))
+        tilt_y = degrees(atan2(-gravity_x, hypot(gravity_y, gravity_z)))
+        return Helpers.parse_float(roll_x), Helpers.parse_float(tilt_y), 0.0
+
+    @staticmethod
+    def level_corrections(gravities_x, gravities_y, gravities_z):
+        """
+        Batched version of level_correction.
+        :return: lists rolls_x, tilts_y, pans_z in degrees
+        """
+        if numpy is None:
+            corrections = [Orientation.level_correction(x, y, z) for x, y, z in zip(gravities_x, gravities_y, gravities_z)]
+            return tuple(list(c) for c in zip(*corrections)) if corrections else ([], [], [])
+        gravity_x, gravity_y, gravity_z = (Orientation._to_array(g) for g in (gravities_x, gravities_y, gravities_z))
+        rolls_x = numpy.round(numpy.degrees(numpy.arctan2(gravity_z, -gravity_y)), Orientation.precision)
+        tilts_y = numpy.round(numpy.degrees(numpy.arctan2(-gravity_x, numpy.hypot(gravity_y, gravity_z))),
+                              Orientation.precision)
+        return rolls_x.tolist(), tilts_y.tolist(), [0.0] * len(rolls_x)
+
+    @staticmethod
+    def read_gravity(project_file):
+        """
+        returns gravity_x, gravity_y and gravity_z of the gyro calibration in a pro.prj file, rounded like in the
+        stitching template, or None if the file has none
+        """
+        try:
+            project = et.fromstring(Helpers.read_file(project_file))
+            return tuple(round(float(project.find("./gyro/calibration/" + name).text), 6)
+                         for name in ("gravity_x", "gravity_y", "gravity_z"))
+        except (et.ParseError, AttributeError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def get_level_settings(gravities, roll_x=0.0, tilt_y=0.0, pan_z=0.0):
+        """
+        Returns roll_x, tilt_y and pan_z for each gravity calibration: the level correction followed by the
+        orientation offsets of the settings.
+        :param gravities: list of (gravity_x, gravity_y, gravity_z)
+        :return: list of (roll_x, tilt_y, pan_z) tuples
+        """
+        if not gravities:
+            return []
+        count = len(gravities)
+        rolls, tilts, pans = Orientation.level_corrections(*zip(*gravities))
+        level = Orientation.euler_degrees_to_quaternions(rolls, tilts, pans, y_up=True)
+        offset = Orientation.euler_degrees_to_quaternions([roll_x] * count, [tilt_y] * count, [pan_z] * count, y_up=True)
+        # y up: the scalar conversion returns the pan as pitch and the tilt as yaw
+        rolls, pans, tilts = Orientation.quaternions_to_euler_degrees(*Orientation.multiply_quaternions(offset, level))
+        # + 0.0 turns -0.0 into 0.0
+        return [(round(r, 3) + 0.0, round(t, 3) + 0.0, round(p, 3) + 0.0) for r, t, p in zip(rolls, tilts, pans)]
+
+
+def main():
+    # imported here so the conversions can be used without the controller
+    from prostitchercontroller import ProStitcherController
+
+    parser = argparse.ArgumentParser(
+        description="Print roll_x, tilt_y and pan_z that level the horizon of each recording in a folder, "
+                    "calculated from the gravity calibration in pro.prj and the orientation settings. "
+                    "Copy them into a batchstitcher.ini in a recording folder to use them.")
+    parser.add_argument("source", help="Folder with recordings")
+    parser.add_argument("--ini", default=os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), "batchstitcher.ini"),
+                        help="Settings file with source_filter, roll_x, tilt_y and pan_z")
+    args = parser.parse_args()
+
+    settings = Helpers.read_config(args.ini, ProStitcherController.default_settings)
+    recordings = []
+    gravities = []
+    for recording in Helpers.get_subdirs(args.source, settings.get("source_filter")):
+        gravity = Orientation.read_gravity(os.path.join(args.source, recording, "pro.prj"))
+        if gravity is None:
+            print("{}: no gravity calibration".format(recording))
+            continue
+        recordings.append(recording)
+        gravities.append(gravity)
+    level_settings = Orientation.get_level_settings(gravities, settings.get("roll_x"), settings.get("tilt_y"),
+                                                    settings.get("pan_z"))
+    for recording, gravity, (roll_x, tilt_y, pan_z) in zip(recordings, gravities, level_settings):
+        print("{}: gravity {} {} {}: roll_x = {}, tilt_y = {}, pan_z = {}".format(
+            recording, *gravity, roll_x, tilt_y, pan_z))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Stitch a short window of one sample recording with every combination of a grid of settings and rank the results
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import copy
+import csv
+import argparse
+import itertools
+from time import strftime, localtime
+from helpers import Helpers
+from prostitchercontroller import ProStitcherController
+
+
+class ParameterSweep:
+
+    # Settings that are varied by default, and the values tried for each
+    default_grid = {
+        "sampling_level": ["fast", "medium", "slow"],
+        "encode_preset": ["superfast", "veryfast", "fast"],
+        "blender_type": ["auto", "cuda", "opencl", "cpu"],
+        "decode_hardware_count": [2, 4, 6],
+        "encode_use_hardware": [0, 1],
+    }
+
+    columns = ["rank", "returncode", "fps", "wall_time", "output_size", "stitching_duration"]
+
+    def __init__(self, settings, recording, grid=None, duration=10, trim_start=None, sweep_dir=None,
+                 keep_outputs=False, log_callback=None):
+        """
+        :param settings: stitcher settings, e.g. read from batchstitcher.ini
+        :param recording: absolute path of the sample recording folder
+        :param grid: dict of setting name -> list of values, defaults to default_grid
+        :param duration: length of the stitched window in seconds
+        :param trim_start: start of the stitched window, defaults to the middle of the recording
+        :param sweep_dir: folder for the stitched files and the results table, defaults to target_dir/sweep
+        :param keep_outputs: keep the stitched files after measuring their size
+        """
+        self.settings = copy.deepcopy(settings)
+        self.recording = os.path.abspath(recording)
+        self.grid = grid or copy.deepcopy(self.default_grid)
+        if sys.platform == "darwin" and "cuda" in self.grid.get("blender_type", []):
+            self.grid["blender_type"] = [v for v in self.grid["blender_type"] if v != "cuda"]
+        self.duration = max(1, Helpers.parse_int(duration, 10))
+        self.trim_start = trim_start
+        self.sweep_dir = sweep_dir
+        self.keep_outputs = keep_outputs
+        self.log_callback = log_callback
+        self.results = []
+        self._stitcher = None
+
+    @staticmethod
+    def parse_grid(values):
+        """
+        Parses grid entries like "sampling_level=fast,medium" or a dict of name -> "fast,medium".
+        :return: dict of setting name -> list of values
+        """
+        if isinstance(values, dict):
+            values = ["{}={}".format(k, v) for k, v in values.items()]
+        grid = {}
+        for value in values or []:
+            if "=" not in value:
+                continue
+            k, v = value.split("=", 1)
+            options = [o.strip() for o in v.split(",") if o.strip()]
+            if k.strip() and options:
+                grid[k.strip()] = options
+        return grid
+
+    def get_combinations(self):
+        """
+        Returns list of dicts with one value for each setting in the grid.
+        """
+        keys = list(self.grid.keys())
+        return [dict(zip(keys, values)) for values in itertools.product(*(self.grid[k] for k in keys))]
+
+    def run(self):
+        """
+        Stitches the sample recording once per combination, one job at a time so wall times are comparable.
+        :return: list of result dicts, ranked
+        """
+        self._stitcher = ProStitcherController()
+        self._stitcher.settings = self.settings
+        self._stitcher.log_callback = self.log_callback
+        self._stitcher._prepare_settings()
+        self.settings["target_dir"] = self.settings.get("target_dir") or os.path.dirname(self.recording)
+        if not self.sweep_dir:
+            self.sweep_dir = os.path.join(self.settings["target_dir"], "sweep")
+        if not os.path.exists(self.sweep_dir):
+            os.makedirs(self.sweep_dir)
+
+        duration, fps = self._stitcher._probe_recording(self.recording)
+        if not duration:
+            self._log_error("ERROR: Could not read duration of {}".format(self.recording))
+            return []
+        if self.trim_start is None:
+            trim_start = max(0, int((duration - self.duration) / 2))
+        else:
+            trim_start = max(0, min(Helpers.parse_int(self.trim_start), int(duration) - 1))
+        trim_end = min(int(duration), trim_start + self.duration)
+
+        combinations = self.get_combinations()
+        name = os.path.basename(os.path.normpath(self.recording))
+        self._log_info("Sweeping {} combinations of {} on {} ({}s to {}s)".format(
+            len(combinations), ", ".join(self.grid.keys()), name, trim_start, trim_end))
+
+        self.results = []
+        for i, combination in enumerate(combinations, 1):
+            if self._stitcher._stopping:
+                break
+            overrides = self._stitcher._parse_overrides(combination)
+            overrides.update({
+                "trim_start": trim_start,
+                "trim_end": trim_end,
+                "min_recording_duration": 0,
+                "rename_after_stitching": 0,
+            })
+            suffix = "_sweep{}".format(i)
+            output_destination = os.path.join(self.sweep_dir, "{}{}.{}".format(
+                name, suffix, self.settings["output_format"]))
+            job = {
+                "recording": self.recording,
+                "name": "{} sweep {}/{}".format(name, i, len(combinations)),
+                "suffix": suffix,
+                "overrides": overrides,
+                "output_destination": output_destination,
+            }
+            count = len(self._stitcher.results)
+            self._stitcher.process_recording(self.recording, job)
+            # show the stitcher's log messages before the next sweep step
+            self._stitcher._log_subscription.flush()
+            row = dict(combination)
+            if len(self._stitcher.results) > count:
+                result = self._stitcher.results[-1]
+                row.update({k: result[k] for k in self.columns if k in result})
+            else:
+                row.update({"returncode": -1, "fps": 0, "wall_time": 0, "output_size": 0,
+                            "stitching_duration": trim_end - trim_start})
+            self.results.append(row)
+            if not self.keep_outputs and os.path.exists(output_destination):
+                try:
+                    os.remove(output_destination)
+                except OSError as e:
+                    self._log_error("Error removing {}: {}".format(output_destination, str(e)))
+
+        self.results = self.rank(self.results)
+        return self.results
+
+    @staticmethod
+    def rank(results):
+        """
+        Sorts successful results by achieved fps, then wall time, followed by failed ones.
+        """
+        succeeded = sorted((r for r in results if r.get("returncode") == 0),
+                           key=lambda r: (-r.get("fps", 0), r.get("wall_time", 0)))
+        failed = [r for r in results if r.get("returncode") != 0]
+        for i, r in enumerate(succeeded, 1):
+            r["rank"] = i
+        for r in failed:
+            r["rank"] = ""
+        return succeeded + failed
+
+    def write_table(self, path=None):
+        """
+        Writes the ranked results as CSV to path, by default into the sweep folder.
+        :return: path of the table, or None on error
+        """
+        if path is None:
+            name = os.path.basename(os.path.normpath(self.recording))
+            path = os.path.join(self.sweep_dir, "{}_sweep_{}.csv".format(name, strftime("%Y%m%d_%H%M%S", localtime())))
+        fieldnames = ["rank"] + list(self.grid.keys()) + [c for c in self.columns if c != "rank"]
+        try:
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(self.results)
+            return path
+        except Exception as e:
+            self._log_error("Error writing sweep results: {}".format(str(e)))
+        return None
+
+    def format_table(self):
+        fieldnames = ["rank"] + list(self.grid.keys()) + [c for c in self.columns if c != "rank"]
+        rows = [fieldnames] + [[str(r.get(k, "")) for k in fieldnames] for r in self.results]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(fieldnames))]
+        return "\n".join("  ".join(v.ljust(widths[i]) for i, v in enumerate(row)) for row in rows)
+
+    def stop(self):
+        if self._stitcher:
+            self._stitcher.stop()
+
+    def _log_info(self, text):
+        if self.log_callback:
+            self.log_callback("info", text)
+        else:
+            print(text)
+
+    def _log_error(self, text):
+        if self.log_callback:
+            self.log_callback("error", text)
+        else:
+            sys.stderr.write(text)
+            sys.stderr.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the fastest working stitching settings for this computer.")
+    parser.add_argument("recording", help="Sample recording folder")
+    parser.add_argument("--ini", default=os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), "batchstitcher.ini"),
+                        help="Settings file, the [sweep] section sets the grid")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=V1,V2",
+                        help="Values to try for a setting, replaces the grid from the settings file")
+    parser.add_argument("--duration", type=int, default=10, help="Seconds to stitch per combination")
+    parser.add_argument("--start", type=int, default=None, help="Start of the stitched window in seconds")
+    parser.add_argument("--output", default=None, help="Folder for stitched files and results")
+    parser.add_argument("--keep", action="store_true", help="Keep stitched files")
+    args = parser.parse_args()
+
+    settings = Helpers.read_config(args.ini, ProStitcherController.default_settings)
+    grid = ParameterSweep.parse_grid(args.set) or \
+        ParameterSweep.parse_grid(Helpers.read_config_sections(args.ini, "sweep").get("", {}))
+    sweep = ParameterSweep(settings, args.recording, grid=grid, duration=args.duration, trim_start=args.start,
+                           sweep_dir=args.output, keep_outputs=args.keep)
+    try:
+        results = sweep.run()
+    except KeyboardInterrupt:
+        sweep.stop()
+        results = ParameterSweep.rank(sweep.results)
+    if results:
+        print(sweep.format_table())
+        path = sweep.write_table()
+        if path:
+            print("Results written to {}".format(path))
+    return 0 if any(r.get("returncode") == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
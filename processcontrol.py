@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Apply process priority, I/O priority, CPU affinity and memory limits to stitching processes
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os
+import shutil
+import subprocess
+from helpers import Helpers
+
+
+class ProcessControl:
+
+    # ionice setting -> ionice scheduling class
+    ionice_classes = {"realtime": "1", "best-effort": "2", "idle": "3"}
+
+    # warnings are logged once, not for every job
+    _logged = set()
+
+    # None until checked whether systemd-run can create scopes with memory limits
+    _systemd_run_works = None
+
+    def __init__(self, nice=0, ionice="", cpus="", memory_limit_mb=0, log_error=None):
+        """
+        :param nice: process priority, -20 (highest) to 19 (lowest), 0 for normal
+        :param ionice: I/O priority on Linux: idle, best-effort or best-effort:<0-7>, empty for normal
+        :param cpus: CPUs the process may run on, e.g. "0-7,16-23", empty for all
+        :param memory_limit_mb: memory limit on Linux with systemd, 0 for no limit
+        """
+        self.log_error = log_error
+        self.nice = max(-20, min(19, Helpers.parse_int(nice)))
+        self.ionice = str(ionice or "").strip().lower()
+        self.cpus = self.parse_cpus(cpus)
+        if self.cpus and hasattr(os, "sched_getaffinity"):
+            # ignore CPUs this computer does not have
+            available = os.sched_getaffinity(0)
+            if not available.intersection(self.cpus):
+                self._log_error(f"CPUs '{cpus}' not available, using all CPUs.")
+            self.cpus = [c for c in self.cpus if c in available]
+        self.memory_limit_mb = max(0, Helpers.parse_int(memory_limit_mb))
+
+    @staticmethod
+    def parse_cpus(cpus):
+        """
+        Parses a CPU list like "0-3,8,10-11".
+        :return: sorted list of CPU numbers
+        """
+        result = set()
+        for part in str(cpus or "").replace(" ", "").split(","):
+            try:
+                if "-" in part:
+                    first, last = part.split("-", 1)
+                    result.update(range(int(first), int(last) + 1))
+                elif part:
+                    result.add(int(part))
+            except ValueError:
+                pass
+        return sorted(result)
+
+    @staticmethod
+    def get_slot_value(value, slot):
+        """
+        Returns the value for a worker slot from a semicolon separated list of values per slot, e.g. "0-7;8-15".
+        Slots without their own value use the values from the start of the list again.
+        """
+        values = [v.strip() for v in str(value if value is not None else "").split(";")]
+        return values[slot % len(values)] if values else ""
+
+    def is_active(self):
+        return bool(self.nice or self.ionice or self.cpus or self.memory_limit_mb)
+
+    def wrap_args(self, args):
+        """
+        Returns the command line with wrapper commands that set the limits before ProStitcher starts,
+        so all its threads inherit them.
+        """
+        if sys.platform == "win32":
+            return args
+        prefix = []
+        if self.memory_limit_mb and sys.platform.startswith("linux"):
+            if self._check_systemd_run():
+                prefix += ["systemd-run", "--user", "--scope", "--quiet",
+                           "-p", f"MemoryMax={self.memory_limit_mb}M", "--"]
+            else:
+                self._log_error("Memory limit not applied: systemd-run --user is not available.")
+        if self.nice:
+            prefix += ["nice", "-n", str(self.nice)]
+        if self.ionice and sys.platform.startswith("linux"):
+            ionice_class, _, level = self.ionice.partition(":")
+            if ionice_class in self.ionice_classes and shutil.which("ionice"):
+                prefix += ["ionice", "-c", self.ionice_classes[ionice_class]]
+                if level and ionice_class != "idle":
+                    prefix += ["-n", str(max(0, min(7, Helpers.parse_int(level))))]
+            else:
+                self._log_error(f"I/O priority '{self.ionice}' not applied.")
+        if self.cpus and sys.platform.startswith("linux") and shutil.which("taskset"):
+            prefix += ["taskset", "-c", ",".join(str(c) for c in self.cpus)]
+        return prefix + list(args)
+
+    @classmethod
+    def _check_systemd_run(cls):
+        if cls._systemd_run_works is None:
+            cls._systemd_run_works = False
+            if shutil.which("systemd-run") and shutil.which("true"):
+                try:
+                    cls._systemd_run_works = subprocess.call(
+                        ["systemd-run", "--user", "--scope", "--quiet", "-p", "MemoryMax=64M", "--", "true"],
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10) == 0
+                except (OSError, subprocess.TimeoutExpired):
+                    pass
+        return cls._systemd_run_works
+
+    def popen_kwargs(self):
+        """
+        Returns additional arguments for subprocess.Popen. On Windows the priority is set with a priority class.
+        """
+        if sys.platform != "win32" or not self.nice:
+            return {}
+        if self.nice >= 15:
+            priority = subprocess.IDLE_PRIORITY_CLASS
+        elif self.nice > 0:
+            priority = subprocess.BELOW_NORMAL_PRIORITY_CLASS
+        elif self.nice <= -15:
+            priority = subprocess.HIGH_PRIORITY_CLASS
+        else:
+            priority = subprocess.ABOVE_NORMAL_PRIORITY_CLASS
+        return {"creationflags": priority}
+
+    def apply(self, pid):
+        """
+        Applies limits that could not be set by a wrapper command to a started process.
+        """
+        if self.cpus and sys.platform.startswith("linux") and not shutil.which("taskset"):
+            try:
+                os.sched_setaffinity(pid, self.cpus)
+            except (OSError, AttributeError) as e:
+                self._log_error("CPU affinity not applied: {}".format(str(e)))
+        elif self.cpus and not sys.platform.startswith("linux"):
+            self._log_error("CPU affinity is only supported on Linux.")
+
+    def _log_error(self, text):
+        if text in self._logged:
+            return
+        self._logged.add(text)
+        if self.log_error:
+            self.log_error(text)
+        else:
+            sys.stderr.write(text)
+            sys.stderr.write("\n")
@@ -18,10 +18,29 @@ import subprocess
 import shlex
 import threading
 import queue
+import heapq
 import json
+import signal
 import xml.etree.ElementTree as et
+from concurrent.futures import Future, ThreadPoolExecutor
 from time import localtime, strftime, time, sleep
 from helpers import Helpers
+from diskplanner import DiskPlanner
+from recordingindex import RecordingIndex
+from capabilityprobe import CapabilityMatrix
+from retrypolicy import RetryPolicy
+from jobwatchdog import Watchdog, RuntimeHistory
+from processcontrol import ProcessControl
+from telemetry import TelemetrySampler
+from vramplanner import VramPlanner
+from tracing import tracer
+from stitchapi import StitchSettings, JobResult, BatchResult
+from statusserver import StatusServer
+from metricsexporter import MetricsExporter
+from jobspool import JobSpool
+from sidecarsettings import SidecarSettings
+from sceneanalysis import SceneAnalyzer
+from events import EventBus, LogMessage, JobQueued, ProbeDone, JobStarted, Progress, JobFinished, JobFailed, JobCancelled, BatchDone
 
 
 class ProStitcherController:
@@ -84,7 +103,55 @@ class ProStitcherController:
         "reference_time": 0,
         "logo_path": None,
         "logo_angle": "30",
-        "logo_node": ""
+        "logo_node": "",
+        "disk_space_policy": "reorder",
+        "disk_space_reserve_mb": 1024,
+        "disk_check_interval": 30,
+        "source_recursive": 0,
+        "source_roots": "",
+        "source_all_drives": 0,
+        "segment_count": 1,
+        "segment_min_duration": 300,
+        "segment_overlap": 2,
+        "ffmpeg_path": "",
+        "preview_mode": "off",
+        "preview_width": 1920,
+        "preview_duration": 10,
+        "preview_dir": "",
+        "profiles": "",
+        "capability_check": 0,
+        "capability_test_duration": 2,
+        "retry_max_attempts": 2,
+        "watchdog_stall_timeout": 600,
+        "watchdog_timeout_factor": 3,
+        "watchdog_requeue": 1,
+        "pause_suspend_children": 0,
+        "process_nice": "0",
+        "process_ionice": "",
+        "process_cpus": "",
+        "process_memory_limit_mb": "0",
+        "telemetry_interval": 5,
+        "telemetry_gpu_command": TelemetrySampler.default_gpu_command,
+        "trace_file": "",
+        "profile_file": "",
+        "vram_admission": 0,
+        "vram_budget_mb": 0,
+        "vram_reserve_mb": 512,
+        "vram_probe_command": VramPlanner.default_probe_command,
+        "vram_check_interval": 10,
+        "status_port": 0,
+        "status_host": "127.0.0.1",
+        "status_token": "",
+        "metrics_port": 0,
+        "metrics_host": "127.0.0.1",
+        "metrics_textfile": "",
+        "metrics_interval": 15,
+        "job_spool": 0,
+        "job_spool_path": "",
+        "job_spool_poll_interval": 10,
+        "sidecar_settings": 1,
+        "auto_reference_time": 0,
+        "auto_trim": 0
     }
 
     default_parameters = {
@@ -227,18 +294,87 @@ class ProStitcherController:
     </stitchParam>
     """
 
-    def __init__(self):
-        self.settings = {}
+    PREVIEW_OFF = "off"
+    PREVIEW_FIRST = "first"         # stitch previews of all recordings, then full quality
+    PREVIEW_ONLY = "only"           # stitch previews only
+    PREVIEW_APPROVED = "approved"   # stitch full quality only for recordings whose preview was kept
+
+    PRIORITY_PREVIEW = 0
+    PRIORITY_DEFAULT = 10
+    PRIORITY_STOP = sys.maxsize
+
+    # returned instead of a ProStitcher return code when the watchdog stopped a hung process
+    RETURNCODE_STALLED = -1000
+
+    def __init__(self, settings=None):
+        """
+        :param settings: dict or StitchSettings, usually read from batchstitcher.ini
+        """
+        self.settings = settings.to_dict() if isinstance(settings, StitchSettings) else dict(settings or {})
+        # profile name -> settings overlay, used for the profiles listed in settings["profiles"]
+        self.profiles = {}
+        # return code -> fallback changes, replacing the default rules of RetryPolicy for these codes
+        self.retry_rules = {}
         self.log_callback = None
         self.done_callback = None
-        self.q = queue.Queue()
+        self.q = queue.PriorityQueue()
+        self._q_counter = 0
+        self._q_lock = threading.Lock()
         self._stopping = False
-
-    def _run_prostitcher(self, prostitcher, workingdir, templatefile, logfile, parametersfile):
+        self._draining = False
+        self._paused = False
+        self._children_suspended = False
+        # pid -> (process, watchdog) of running ProStitcher processes
+        self._processes = {}
+        # pid -> job name of running ProStitcher processes
+        self._process_names = {}
+        # worker slot -> name of the job it took from the queue and did not finish yet
+        self._active_jobs = {}
+        # names of jobs cancelled with cancel() that did not end yet
+        self._cancelled_jobs = set()
+        self._processes_lock = threading.Lock()
+        self._probe_cache = {}
+        self._project_cache = {}
+        self._project_tree_cache = {}
+        # settings files in recording folders
+        self._sidecars = SidecarSettings(self.default_settings, self._log_info, self._log_error)
+        # one dict per stitched job, see _add_result
+        self.results = []
+        self._results_lock = threading.Lock()
+        self._active_profiles = [(None, {})]
+        self._disk_planner = None
+        self._capabilities = None
+        self._retry_policy = RetryPolicy(max_attempts=0)
+        self._runtime_history = None
+        self._vram_planner = None
+        self._scene_analyzer = None
+        # worker threads started by start() for jobs added with submit()
+        self._workers = []
+        self._status_server = None
+        self._metrics_exporter = None
+        self._spool = None
+        # spool ids of the entries queued in self.q
+        self._spooled_ids = set()
+        # (recording folder, job name) of the entries resumed from the spool
+        self._spooled_recordings = set()
+        self._spool_lock = threading.Lock()
+        self._spool_poll_stop = threading.Event()
+        # structured events for the GUI, command line and monitoring. The text log is one subscriber.
+        self.events = EventBus()
+        self._log_subscription = self.events.subscribe(self._on_log_event, (LogMessage, Progress), maxsize=100000)
+
+    @tracer.traced("run_prostitcher", "prostitcher")
+    def _run_prostitcher(self, prostitcher, workingdir, templatefile, logfile, parametersfile, watchdog=None, process_control=None, telemetry=None, name=None):
         returncode = -1
+        p = None
+        started = time()
         try:
             cmd = f'"{prostitcher}" -l "{logfile}" -w stitch -x "{templatefile}"'
             args = shlex.split(cmd)
+            kwargs = {}
+            if process_control and process_control.is_active():
+                args = process_control.wrap_args(args)
+                kwargs = process_control.popen_kwargs()
 
             if sys.platform == "win32":
                 # Hide console
@@ -250,6 +386,7 @@ class ProStitcherController:
                                      startupinfo=startupinfo,
                                      stdout=subprocess.DEVNULL,
                                      stderr=subprocess.DEVNULL,
+                                     **kwargs
                                      )
             else:
                 p = subprocess.Popen(args,
@@ -257,43 +394,44 @@ class ProStitcherController:
                                      shell=False,
                                      stdout=subprocess.DEVNULL,
                                      stderr=subprocess.DEVNULL,
+                                     **kwargs
                                      )
+            if p and process_control and process_control.is_active():
+                process_control.apply(p.pid)
+            if p and telemetry:
+                telemetry.start(p.pid)
             if p:
+                with self._processes_lock:
+                    self._processes[p.pid] = (p, watchdog)
+                    self._process_names[p.pid] = name
+                    if self._children_suspended:
+                        self._signal_process(p, watchdog, suspend=True)
+                last_disk_check = time()
                 while True:
                     returncode = p.poll()
                     if returncode is None:
-                        if self._stopping:
+                        if self._stopping or name in self._cancelled_jobs:
                             self._log_info("Terminating stitching. ")
-                            p.terminate()
+                            Watchdog.terminate(p)
                             self._log_info("Stitching terminated. ")
+                            returncode = -1
                             break
                         else:
                             sleep(1)
-                            self._log_info(".")
+                            if not self._children_suspended:
+                                self.events.publish(Progress(name=name, pid=p.pid, elapsed=round(time() - started, 1)))
+                            if self._disk_planner and time() - last_disk_check >= self.settings.get("disk_check_interval", 30):
+                                last_disk_check = time()
+                                self._disk_planner.check()
+                            reason = watchdog.check() if watchdog else None
+                            if reason:
+                                self._log_error(f"ERROR: ProStitcher is not responding ({reason}), stopping it.")
+                                Watchdog.terminate(p)
+                                returncode = self.RETURNCODE_STALLED
+                                break
                     else:
                         if returncode != 0:
-                            explanation = ''
-                            resolution = ''
-                            if returncode == -6:
-                                explanation = "Not all origin_x.mp4 files present"
-                            elif returncode == 235:
-                                explanation = "Source video not found"
-                            elif returncode == 244:
-                                if self.settings["encode_use_hardware"]:
-                                    explanation = "Hardware encoding not supported"
-                                    resolution = "Please unset 'Use hardware encoding' and try again."
-                                else:
-                                    explanation = "Codec/Profile/Bitrate combination not supported by hardware"
-                                    resolution = "Please try again with different settings for Codec/Profile/Bitrate."
-                            elif returncode == 1003:
-                                explanation = "'No such file or directory' error looking for origin files"
-                                resolution = "Please make sure your origin files have the original file names (origin_1.mp4 etc.), and that the path has no special characters."
-                            elif returncode == 1012:
-                                explanation = "'File format', 'Codec type' and 'Use hardware encoding' settings are not compatible"
-                                resolution = "Please try again with different settings for 'File format', 'Codec type' and 'Use hardware encoding'."
-                            elif returncode == 4294967295 or returncode == -11:
-                                explanation = "Wrong output file format or audio type, or logo not found."
-                                resolution = "Please change the output file format and check the logo path, then try again."
+                            explanation, resolution = self.explain_returncode(returncode, self.settings["encode_use_hardware"])
                             if explanation:
                                 self._log_info(f"ERROR. ProStitcher returned code {returncode} ({explanation}).")
                             else:
@@ -306,8 +444,45 @@ class ProStitcherController:
             self._log_error("Error running prostitcher: {}".format(str(e)))
         except subprocess.CalledProcessError as e:
             self._log_error("Error running prostitcher: {}".format(str(e)))
+        finally:
+            if telemetry:
+                telemetry.stop()
+            if p:
+                with self._processes_lock:
+                    self._processes.pop(p.pid, None)
+                    self._process_names.pop(p.pid, None)
         return returncode
 
+    @staticmethod
+    def explain_returncode(returncode, encode_use_hardware=0):
+        """
+        returns (explanation, resolution) for known ProStitcher return codes, empty strings otherwise
+        """
+        explanation = ''
+        resolution = ''
+        if returncode == -6:
+            explanation = "Not all origin_x.mp4 files present"
+        elif returncode == 235:
+            explanation = "Source video not found"
+        elif returncode == 244:
+            if encode_use_hardware:
+                explanation = "Hardware encoding not supported"
+                resolution = "Please unset 'Use hardware encoding' and try again."
+            else:
+                explanation = "Codec/Profile/Bitrate combination not supported by hardware"
+                resolution = "Please try again with different settings for Codec/Profile/Bitrate."
+        elif returncode == 1003:
+            explanation = "'No such file or directory' error looking for origin files"
+            resolution = "Please make sure your origin files have the original file names (origin_1.mp4 etc.), and that the path has no special characters."
+        elif returncode == 1012:
+            explanation = "'File format', 'Codec type' and 'Use hardware encoding' settings are not compatible"
+            resolution = "Please try again with different settings for 'File format', 'Codec type' and 'Use hardware encoding'."
+        elif returncode == 4294967295 or returncode == -11:
+            explanation = "Wrong output file format or audio type, or logo not found."
+            resolution = "Please change the output file format and check the logo path, then try again."
+        return explanation, resolution
+
+    @tracer.traced("run_ffprobe", "ffprobe")
     def _run_ffprobe(self, ffprobe, filename):
         """
         returns duration, fps
@@ -330,6 +505,697 @@ class ProStitcherController:
             self._log_error("Error running ffprobe: {}".format(str(e)))
         return duration, fps
 
+    @tracer.traced("run_ffprobe_keyframes", "ffprobe")
+    def _run_ffprobe_keyframes(self, ffprobe, filename):
+        """
+        returns list of keyframe timestamps in seconds
+        """
+        keyframes = []
+        try:
+            result = subprocess.check_output(
+                f'"{ffprobe}" -v quiet -select_streams v:0 -skip_frame nokey -show_entries frame=pts_time -of json "{filename}"',
+                shell=True).decode()
+            for frame in json.loads(result).get('frames', []):
+                if 'pts_time' in frame:
+                    keyframes.append(float(frame['pts_time']))
+        except (OSError, ValueError) as e:
+            self._log_error("Error running ffprobe: {}".format(str(e)))
+        except subprocess.CalledProcessError as e:
+            self._log_error("Error running ffprobe: {}".format(str(e)))
+        return sorted(keyframes)
+
+    def _get_ffmpeg_path(self):
+        """
+        returns the ffmpeg executable configured in settings, or the one next to ffprobe
+        """
+        if self.settings.get("ffmpeg_path"):
+            return self.settings["ffmpeg_path"]
+        ffprobe = self.settings.get("ffprobe_path") or "ffprobe"
+        return os.path.join(os.path.dirname(ffprobe), os.path.basename(ffprobe).replace("ffprobe", "ffmpeg"))
+
+    @tracer.traced("run_ffmpeg_concat", "ffmpeg")
+    def _run_ffmpeg_concat(self, ffmpeg, segments, output_destination):
+        """
+        Joins stitched segments without re-encoding.
+        :param segments: list of (filename, inpoint, outpoint) tuples, see _get_segment_cuts. inpoint is the time
+                         in seconds to start at, outpoint the time to end at or None for the end of the file.
+        returns ffmpeg return code
+        """
+        returncode = -1
+        list_filepath = os.path.join(tempfile.gettempdir(), os.path.basename(output_destination) + "_segments.txt")
+        try:
+            lines = []
+            for filename, inpoint, outpoint in segments:
+                lines.append("file '{}'".format(os.path.abspath(filename).replace("'", "'\\''")))
+                if inpoint:
+                    lines.append(f"inpoint {inpoint}")
+                if outpoint:
+                    lines.append(f"outpoint {outpoint}")
+            Helpers.write_file(list_filepath, "\n".join(lines) + "\n")
+            args = [ffmpeg, "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_filepath,
+                    "-map", "0", "-c", "copy", output_destination]
+            if sys.platform == "win32":
+                # Hide console
+                startupinfo = subprocess.STARTUPINFO()
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                returncode = subprocess.call(args, shell=False, startupinfo=startupinfo,
+                                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            else:
+                returncode = subprocess.call(args, shell=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            self._log_error("Error running ffmpeg: {}".format(str(e)))
+        finally:
+            try:
+                os.remove(list_filepath)
+            except OSError:
+                pass
+        return returncode
+
+    def _probe_recording(self, recording):
+        """
+        returns duration, fps of a recording. Results are cached for the lifetime of the controller.
+        """
+        if recording not in self._probe_cache:
+            preview_filepath = os.path.join(self.settings["source_dir"], recording, "preview.mp4")
+            t = time()
+            self._probe_cache[recording] = self._run_ffprobe(self.settings["ffprobe_path"], preview_filepath)
+            duration, fps = self._probe_cache[recording]
+            self.events.publish(ProbeDone(recording=recording, duration=duration, fps=fps, seconds=round(time() - t, 3)))
+        return self._probe_cache[recording]
+
+    def _discover_recordings(self, source_dir, source_filter):
+        """
+        Returns absolute paths of all recordings in subfolders of source_dir, additional source roots
+        and optionally all drives.
+        """
+        roots = [source_dir]
+        roots.extend(r.strip() for r in str(self.settings.get("source_roots") or "").split(";") if r.strip())
+        if self.settings.get("source_all_drives"):
+            roots.extend(Helpers.get_drives())
+        self._log_info("Searching for recordings in {}".format(", ".join(roots)))
+        return self._skip_copies(RecordingIndex().scan(roots, source_filter), roots)
+
+    def _skip_copies(self, recordings, roots):
+        """
+        Returns the recordings without copies of the same recording in other roots, e.g. a backup on another drive,
+        which would be stitched twice to the same output name. Copies have the same folder name and preview.mp4 size;
+        the modification time is not compared as not all copies keep it. The copy in the first root is kept.
+        """
+        def get_root_index(recording):
+            for i, root in enumerate(roots):
+                try:
+                    if os.path.commonpath([os.path.abspath(root), recording]) == os.path.abspath(root):
+                        return i
+                except ValueError:
+                    # on different drives
+                    pass
+            return len(roots)
+
+        def get_preview_size(recording):
+            try:
+                return os.path.getsize(os.path.join(recording, "preview.mp4"))
+            except OSError:
+                return None
+
+        kept = {}
+        for recording in sorted(recordings, key=get_root_index):
+            key = (os.path.basename(os.path.normpath(recording)), get_preview_size(recording))
+            if key in kept:
+                self._log_info("Skipping '{}', a copy of '{}'".format(recording, kept[key]))
+            else:
+                kept[key] = recording
+        kept = set(kept.values())
+        return [r for r in recordings if r in kept]
+
+    @staticmethod
+    def get_stitching_window(trim_start, trim_end, duration):
+        """
+        Returns absolute (start, end) in seconds for relative trim settings, using the same rules as process_recording.
+        """
+        trim_start = Helpers.parse_int(trim_start)
+        trim_end = Helpers.parse_int(trim_end)
+        if not trim_end:
+            trim_end = duration
+        elif trim_end < 0:
+            trim_end = duration + trim_end
+        if trim_start < 0 or trim_start > duration:
+            trim_start = 0
+        if trim_end < trim_start or trim_end > duration:
+            trim_end = duration
+        return trim_start, trim_end
+
+    def _estimate_output_size(self, recording):
+        """
+        Estimates the output file size of a recording in bytes from bitrate and trimmed duration, for all profiles.
+        Returns 0 for recordings that will be skipped.
+        Recordings are not analysed here, so auto trim and auto reference time do not delay the first job; the
+        untrimmed duration overestimates the size.
+        """
+        duration, fps = self._probe_recording(recording)
+        if duration < self._get_recording_settings(recording, analyse=False)["min_recording_duration"]:
+            return 0
+        size = 0
+        if self.settings["preview_mode"] != self.PREVIEW_ONLY:
+            for profile, overrides in self._active_profiles:
+                settings = self._get_recording_settings(recording, overrides, analyse=False)
+                start, end = self.get_stitching_window(settings["trim_start"], settings["trim_end"], duration)
+                profile_size = DiskPlanner.estimate_output_size(settings["bitrate"], end - start, settings["audio_type"])
+                if self._get_segment_count(end - start, settings) > 1:
+                    # segments and joined output exist at the same time until segments are removed
+                    profile_size *= 2
+                size += profile_size
+        if self.settings["preview_mode"] in (self.PREVIEW_FIRST, self.PREVIEW_ONLY):
+            preview = self._get_preview_overrides(recording, analyse=False)
+            size += DiskPlanner.estimate_output_size(preview["bitrate"],
+                                                     preview["trim_end"] - preview["trim_start"],
+                                                     self.settings["audio_type"])
+        return size
+
+    def _get_recording_settings(self, recording, overrides=None, analyse=True):
+        """
+        Returns the settings of a recording: the batch settings, changed by the settings file in the recording folder
+        if sidecar_settings is enabled, then by the overrides of a job, e.g. of a profile or segment.
+        auto_trim is only applied if analyse is True.
+        """
+        settings = dict(self.settings)
+        sidecar = {}
+        if self.settings.get("sidecar_settings"):
+            recording_dir = os.path.join(self.settings["source_dir"], recording)
+            sidecar = self._parse_overrides(self._sidecars.get(recording_dir))
+            settings.update(sidecar)
+        if analyse and settings.get("auto_trim") and "trim_start" not in sidecar and "trim_end" not in sidecar:
+            settings.update(self._get_auto_trim(recording, settings))
+        settings.update(overrides or {})
+        return settings
+
+    def _get_auto_trim(self, recording, settings):
+        """
+        Returns trim_start and trim_end without the dead footage at the start and end of a recording, e.g. on deck,
+        or an empty dict to keep the trim settings.
+        """
+        if not self._scene_analyzer:
+            return {}
+        duration, fps = self._probe_recording(recording)
+        if duration < settings["min_recording_duration"]:
+            return {}
+        window = self.get_stitching_window(settings["trim_start"], settings["trim_end"], duration)
+        preview_filepath = os.path.join(self.settings["source_dir"], recording, "preview.mp4")
+        with tracer.span("propose_trim", "analysis"):
+            proposal = self._scene_analyzer.propose_trim(
+                os.path.join(self.settings["source_dir"], recording), window,
+                lambda: self._run_ffprobe_keyframes(self.settings["ffprobe_path"], preview_filepath), duration,
+                settings["min_recording_duration"])
+        if not proposal:
+            return {}
+        return {"trim_start": proposal[0], "trim_end": proposal[1]}
+
+    def _get_reference_time(self, recording, duration, analyse=True):
+        """
+        Returns reference_time if set. Otherwise, if auto_reference_time is enabled and analyse is True, the time of
+        the keyframe with the most detail in the stitching window, so optical flow offsets are not taken from e.g.
+        open water. 0 uses the middle of the recording.
+        """
+        settings = self._get_recording_settings(recording, analyse=analyse)
+        if settings["reference_time"] or not settings["auto_reference_time"] or not analyse or not self._scene_analyzer:
+            return settings["reference_time"]
+        window = self.get_stitching_window(settings["trim_start"], settings["trim_end"], duration)
+        preview_filepath = os.path.join(self.settings["source_dir"], recording, "preview.mp4")
+        with tracer.span("choose_reference_time", "analysis"):
+            reference_time = self._scene_analyzer.choose_reference_time(
+                os.path.join(self.settings["source_dir"], recording), window,
+                lambda: self._run_ffprobe_keyframes(self.settings["ffprobe_path"], preview_filepath), duration)
+        return reference_time or 0
+
+    def _get_segment_count(self, stitching_duration, settings=None):
+        """
+        Returns the number of segments a recording with the given stitching duration is split into.
+        segment_count 0 uses one segment per parallel stitching process.
+        """
+        settings = settings or self.settings
+        count = settings["segment_count"]
+        if count == 0:
+            count = settings["threads"]
+        min_duration = max(1, settings["segment_min_duration"])
+        return max(1, min(count, int(stitching_duration // min_duration)))
+
+    def _get_segment_windows(self, recording, settings=None):
+        """
+        Splits the stitching window of a recording into segments aligned to keyframes.
+        Each segment after the first starts segment_overlap seconds early so stabilisation can settle.
+        returns list of (trim start, trim end, overlap) tuples, or an empty list if the recording is not split
+        """
+        settings = settings or self.settings
+        duration, fps = self._probe_recording(recording)
+        if duration < settings["min_recording_duration"]:
+            return []
+        start, end = self.get_stitching_window(settings["trim_start"], settings["trim_end"], duration)
+        count = self._get_segment_count(end - start, settings)
+        if count <= 1:
+            return []
+
+        preview_filepath = os.path.join(self.settings["source_dir"], recording, "preview.mp4")
+        keyframes = self._run_ffprobe_keyframes(self.settings["ffprobe_path"], preview_filepath)
+        boundaries = [start]
+        for i in range(1, count):
+            boundary = start + (end - start) * i / count
+            if keyframes:
+                boundary = min(keyframes, key=lambda k: abs(k - boundary))
+            # trim values are whole seconds
+            boundary = int(round(boundary))
+            if boundaries[-1] < boundary < end:
+                boundaries.append(boundary)
+        boundaries.append(end)
+
+        windows = []
+        for i in range(len(boundaries) - 1):
+            overlap = min(settings["segment_overlap"], boundaries[i]) if i > 0 else 0
+            windows.append((boundaries[i] - overlap, boundaries[i + 1], overlap))
+        return windows
+
+    def _create_jobs(self, recording, profile=None, overrides=None):
+        """
+        Returns the jobs to queue for a recording and profile: one job, or one job per segment in segment mode.
+        """
+        overrides = dict(overrides or {})
+        settings = self._get_recording_settings(recording, overrides)
+        name = f"{recording} ({profile})" if profile else recording
+        suffix = f"_{profile}" if profile else ""
+        windows = self._get_segment_windows(recording, settings)
+        if len(windows) <= 1:
+            return [{"recording": recording, "name": name, "suffix": suffix, "profile": profile, "overrides": overrides}]
+
+        recording_name = os.path.basename(os.path.normpath(os.path.join(self.settings["source_dir"], recording)))
+        t = strftime("%H%M%S", localtime())
+        output_format = settings["output_format"]
+        group = {
+            "recording": recording,
+            "name": name,
+            "output_destination": os.path.join(self.settings["target_dir"], f"{recording_name}{suffix}_{t}.{output_format}"),
+            "segments": [],
+            "remaining": len(windows),
+            "failed": False,
+            "lock": threading.Lock(),
+        }
+        jobs = []
+        for i, (trim_start, trim_end, overlap) in enumerate(windows):
+            segment_path = os.path.join(self.settings["target_dir"], f".{recording_name}{suffix}_{t}_part{i + 1}.{output_format}")
+            group["segments"].append((segment_path, overlap))
+            jobs.append({
+                "recording": recording,
+                "name": f"{name} (segment {i + 1}/{len(windows)})",
+                "suffix": f"{suffix}_part{i + 1}",
+                "profile": profile,
+                "overrides": dict(overrides, trim_start=trim_start, trim_end=trim_end, rename_after_stitching=0),
+                "output_destination": segment_path,
+                "segment_group": group,
+            })
+        self._log_info(f"Splitting {name} into {len(windows)} segments: "
+                       + ", ".join(f"{s}-{e}s" for s, e, o in windows))
+        return jobs
+
+    def _get_preview_dir(self):
+        return self.settings.get("preview_dir") or os.path.join(self.settings["target_dir"], "preview")
+
+    def _get_preview_destination(self, recording):
+        recording_name = os.path.basename(os.path.normpath(os.path.join(self.settings["source_dir"], recording)))
+        return os.path.join(self._get_preview_dir(), f"{recording_name}_preview.{self.settings['output_format']}")
+
+    def _get_preview_overrides(self, recording, analyse=True):
+        """
+        Returns settings for a fast, low resolution preview of a short window around the reference time.
+        """
+        duration, fps = self._probe_recording(recording)
+        settings = self._get_recording_settings(recording, analyse=analyse)
+        preview_duration = max(1, settings["preview_duration"])
+        center = self._get_reference_time(recording, duration, analyse)
+        if not center or center < 0 or center > duration:
+            center = duration / 2
+        trim_start = int(max(0, center - preview_duration / 2))
+        trim_end = int(min(duration, trim_start + preview_duration)) or int(duration)
+        width = max(256, min(settings["preview_width"], settings["width"]))
+        # scale bitrate with the number of pixels
+        bitrate = max(8 * 1024 * 1024, int(settings["bitrate"] * (width / max(1, settings["width"])) ** 2))
+        return {
+            "width": width,
+            "bitrate": bitrate,
+            "stitching_mode": "Scene-specific Template",
+            "sampling_level": "fast",
+            "encode_preset": "superfast",
+            "trim_start": trim_start,
+            "trim_end": trim_end,
+            "rename_after_stitching": 0,
+        }
+
+    def _create_preview_job(self, recording):
+        return {
+            "recording": recording,
+            "name": f"{recording} (preview)",
+            "suffix": "_preview",
+            "overrides": self._get_preview_overrides(recording),
+            "output_destination": self._get_preview_destination(recording),
+            "priority": self.PRIORITY_PREVIEW,
+        }
+
+    def _put_job(self, job):
+        """
+        Adds a job to the queue. Jobs with lower priority values are processed first, in the order they were added.
+        """
+        with self._q_lock:
+            self._q_counter += 1
+            counter = self._q_counter
+        self.q.put((job.get("priority", self.PRIORITY_DEFAULT) if job else self.PRIORITY_STOP, counter, job))
+        if job:
+            self.events.publish(JobQueued(name=job["name"], recording=job["recording"], profile=job.get("profile"),
+                                          priority=job.get("priority", self.PRIORITY_DEFAULT)))
+
+    def _queue_recording(self, recording):
+        """
+        Queues the jobs of a recording for all profiles back to back, so the origin files stay in the OS page cache.
+        The recording folder is renamed after all jobs of the recording succeeded.
+        """
+        jobs = []
+        skipped = False
+        for profile, overrides in self._active_profiles:
+            name = f"{recording} ({profile})" if profile else recording
+            if self._is_spooled(recording, name):
+                # resumed from the job spool
+                continue
+            if not self._is_supported({"recording": recording, "name": name, "overrides": overrides}):
+                skipped = True
+                continue
+            spool_id = self._spool_add(JobSpool.KIND_RECORDING, recording, name, profile, {"overrides": overrides})
+            for job in self._create_jobs(recording, profile, overrides):
+                job["spool_id"] = spool_id
+                jobs.append(job)
+        group = {"recording": recording, "remaining": len(jobs), "failed": skipped, "lock": threading.Lock()}
+        for job in jobs:
+            job["recording_group"] = group
+            job["overrides"] = dict(job.get("overrides") or {}, rename_after_stitching=0)
+            self._put_job(job)
+
+    def _spool_add(self, kind, recording, name, profile=None, job=None, priority=None):
+        """
+        Adds a job to the job spool if enabled.
+        returns the spool id, or None
+        """
+        if not self._spool:
+            return None
+        with self._spool_lock:
+            spool_id = self._spool.add(kind, self.settings["source_dir"], recording, name, profile, job,
+                                       self.PRIORITY_DEFAULT if priority is None else priority)
+            if spool_id:
+                self._spooled_ids.add(spool_id)
+        return spool_id
+
+    def _is_spooled(self, recording, name):
+        """
+        returns True if a job of a recording was resumed from the job spool
+        """
+        return (os.path.normpath(os.path.join(self.settings["source_dir"], recording)), name) in self._spooled_recordings
+
+    def _queue_spooled(self):
+        """
+        Queues the entries of the job spool not queued yet, e.g. of an earlier batch that was stopped or crashed,
+        or added by another process with enqueue().
+        returns number of entries queued
+        """
+        if not self._spool:
+            return 0
+        with self._spool_lock:
+            entries = [e for e in self._spool.get_queued() if e["id"] not in self._spooled_ids]
+            self._spooled_ids.update(e["id"] for e in entries)
+        groups = {}
+        for entry in entries:
+            recording = entry["recording"]
+            if os.path.normpath(entry["source_dir"]) != os.path.normpath(self.settings["source_dir"]):
+                recording = os.path.join(entry["source_dir"], recording)
+            recording_dir = os.path.join(self.settings["source_dir"], recording)
+            if not os.path.isdir(recording_dir):
+                self._log_error("Recording folder '{}' of {} not found, removing it from the queue.".format(recording_dir, entry["name"]))
+                self._spool.set_state([entry["id"]], JobSpool.STATE_CANCELLED)
+                continue
+            self._spooled_recordings.add((os.path.normpath(recording_dir), entry["name"]))
+            data = entry["job"]
+            if entry["kind"] == JobSpool.KIND_RECORDING:
+                jobs = self._create_jobs(recording, entry["profile"], data.get("overrides"))
+            else:
+                jobs = [dict(data, recording=recording, name=entry["name"], profile=entry["profile"])]
+            for job in jobs:
+                job["spool_id"] = entry["id"]
+                if entry["priority"] != self.PRIORITY_DEFAULT:
+                    job["priority"] = entry["priority"]
+            if entry["kind"] == JobSpool.KIND_RECORDING:
+                # rename the folder once all resumed profiles of the recording succeeded
+                groups.setdefault(recording, []).extend(jobs)
+            else:
+                for job in jobs:
+                    self._put_job(job)
+        for recording, jobs in groups.items():
+            group = {"recording": recording, "remaining": len(jobs), "failed": False, "lock": threading.Lock()}
+            for job in jobs:
+                job["recording_group"] = group
+                job["overrides"] = dict(job.get("overrides") or {}, rename_after_stitching=0)
+                self._put_job(job)
+        if entries:
+            self._log_info("Queued {} jobs from the job spool.".format(len(entries)))
+        return len(entries)
+
+    def _poll_spool(self):
+        """
+        Queues entries added to the job spool by other processes while the batch runs.
+        """
+        while not self._spool_poll_stop.wait(self.settings["job_spool_poll_interval"]):
+            if not self._stopping and not self._draining:
+                self._queue_spooled()
+
+    def _claim_spooled(self, job):
+        """
+        returns False if the job must not start because its spool entry was cancelled or started elsewhere
+        """
+        if not self._spool or not job.get("spool_id"):
+            return True
+        if self._spool.claim(job["spool_id"]):
+            return True
+        self._log_info("Skipping {}, it was cancelled or started by another batch.".format(job["name"]))
+        return False
+
+    def _finish_spooled(self, job, result, cancelled=False):
+        """
+        Records the outcome of a job in the job spool. Jobs not finished because the batch was stopped stay queued.
+        """
+        if not self._spool or not job.get("spool_id"):
+            return
+        if cancelled or job["name"] in self._cancelled_jobs:
+            self._spool.set_state([job["spool_id"]], JobSpool.STATE_CANCELLED, result)
+        elif result != 0 and (self._stopping or self._draining):
+            self._spool.set_state([job["spool_id"]], JobSpool.STATE_QUEUED)
+        else:
+            self._spool.set_state([job["spool_id"]], JobSpool.STATE_DONE if result == 0 else JobSpool.STATE_FAILED, result)
+
+    def _finish_recording_job(self, job, result):
+        """
+        Called when a job ends. After the last job of a recording its cached project file is dropped and the
+        recording folder is renamed if configured.
+        """
+        group = job["recording_group"]
+        with group["lock"]:
+            group["remaining"] -= 1
+            if result != 0:
+                group["failed"] = True
+            if group["remaining"] > 0:
+                return
+        self._forget_project(group["recording"])
+        if not group["failed"] and not self._stopping and self.settings["rename_after_stitching"]:
+            self._rename_recording(os.path.join(self.settings["source_dir"], group["recording"]))
+
+    def _get_segment_cuts(self, segments):
+        """
+        Returns (filename, inpoint, outpoint) of each stitched segment for joining without re-encoding.
+        Without re-encoding a segment can only start at one of its own keyframes, so each segment starts at its last
+        keyframe within the overlap, and the segment before ends where that keyframe starts in the recording.
+        No frames are shown twice and timestamps continue at each join.
+        :param segments: list of (filename, overlap) tuples
+        """
+        ffprobe = self.settings["ffprobe_path"]
+        cuts = []
+        for i, (filename, overlap) in enumerate(segments):
+            inpoint = 0
+            if overlap:
+                keyframes = [k for k in self._run_ffprobe_keyframes(ffprobe, filename) if 0 <= k <= overlap + 0.001]
+                inpoint = max(keyframes) if keyframes else 0
+            cuts.append([filename, inpoint, None])
+            # the part of the overlap before the keyframe is taken from the previous segment instead
+            kept = overlap - inpoint
+            if i > 0 and kept > 0:
+                duration, fps = self._run_ffprobe(ffprobe, cuts[i - 1][0])
+                if duration > kept:
+                    cuts[i - 1][2] = round(duration - kept, 6)
+        return [tuple(cut) for cut in cuts]
+
+    def _finish_segment(self, job, result):
+        """
+        Called when a segment job ends. The last segment of a recording joins all segments into the output file.
+        returns the result of the job, or of joining the segments for the last segment
+        """
+        group = job["segment_group"]
+        with group["lock"]:
+            group["remaining"] -= 1
+            if result != 0:
+                group["failed"] = True
+            if group["remaining"] > 0:
+                return result
+
+        recording = group["name"]
+        output_destination = group["output_destination"]
+        segments = group["segments"]
+        returncode = -1
+        if group["failed"] or self._stopping:
+            self._log_error(f"ERROR: Not all segments of {recording} were stitched, output file not created.")
+        else:
+            self._log_info(f"Joining {len(segments)} segments of {recording}")
+            returncode = self._run_ffmpeg_concat(self._get_ffmpeg_path(), self._get_segment_cuts(segments),
+                                                 output_destination)
+            if returncode == 0:
+                self._log_info(f"Completed {recording}: {output_destination}")
+            else:
+                self._log_error(f"ERROR. ffmpeg returned code {returncode} joining segments of {recording}.")
+        for filename, overlap in segments:
+            try:
+                if os.path.exists(filename):
+                    os.remove(filename)
+            except OSError:
+                pass
+        self._finish_spooled(job, returncode)
+        return returncode
+
+    def _rename_recording(self, recording_dir):
+        try:
+            recording_dir = os.path.normpath(recording_dir)
+            new_path = os.path.join(os.path.dirname(recording_dir),
+                                    self.settings["rename_prefix"] + os.path.basename(recording_dir))
+            os.rename(recording_dir, new_path)
+        except:
+            pass
+
+    def _analyse_recordings(self, recordings):
+        """
+        Yields the recordings in order, each once auto trim and auto reference time are analysed.
+        Recordings are analysed in parallel while the workers stitch the jobs queued before.
+        """
+        if not self._scene_analyzer:
+            yield from recordings
+            return
+        with ThreadPoolExecutor(max_workers=max(1, self.settings["threads"]), thread_name_prefix="Analysis") as executor:
+            for r, _ in zip(recordings, executor.map(self._analyse_recording, recordings)):
+                yield r
+
+    def _analyse_recording(self, recording):
+        """
+        Runs the scene analysis of a recording, the results are cached for its jobs.
+        """
+        if self._stopping:
+            return
+        try:
+            duration, fps = self._probe_recording(recording)
+            self._get_reference_time(recording, duration)
+        except Exception as e:
+            # the jobs analyse again, or stitch without
+            self._log_error("Error analysing recording {}: {}".format(recording, str(e)))
+
+    def _plan_disk_space(self, recordings, target_dir):
+        """
+        Returns the recordings to queue after checking their estimated output size against free disk space.
+        """
+        self._disk_planner = DiskPlanner(target_dir,
+                                         tempfile.gettempdir(),
+                                         policy=self.settings["disk_space_policy"],
+                                         reserve_mb=self.settings["disk_space_reserve_mb"],
+                                         log_info=self._log_info,
+                                         log_error=self._log_error)
+        if self._disk_planner.policy == DiskPlanner.POLICY_OFF:
+            return recordings
+        jobs = []
+        for r in recordings:
+            if self._stopping:
+                break
+            jobs.append((r, self._estimate_output_size(r)))
+        try:
+            return self._disk_planner.plan(jobs)
+        except Exception as e:
+            # free space is checked again before each recording starts
+            self._log_error("Error checking disk space: {}".format(str(e)))
+        return [name for name, size in jobs]
+
+    def run_capability_test(self, recording, settings):
+        """
+        Stitches a few seconds of a recording with the given settings to test if ProStitcher supports them.
+        returns ProStitcher return code, or None if the test stitch could not be started
+        """
+        duration, fps = self._probe_recording(recording)
+        if not duration:
+            return None
+        test_duration = max(1, self.settings.get("capability_test_duration", 2))
+        trim_start = int(max(0, duration / 2 - test_duration / 2))
+        trim_end = int(min(duration, trim_start + test_duration))
+        output_destination = os.path.join(tempfile.gettempdir(),
+                                          f"capability_test_{os.getpid()}.{settings['output_format']}")
+
+        # a separate controller, so test stitches are not logged or counted as results of the batch.
+        # The settings file of the recording is ignored, so the tested settings are stitched.
+        tester = ProStitcherController()
+        tester.settings = dict(settings, trim_start=trim_start, trim_end=trim_end,
+                               min_recording_duration=0, rename_after_stitching=0, sidecar_settings=0)
+        tester.log_callback = lambda level, text: None
+        tester._probe_cache = self._probe_cache
+        tester._project_cache = self._project_cache
+        tester._project_tree_cache = self._project_tree_cache
+        try:
+            tester.process_recording(recording, {"name": f"{recording} (test)",
+                                                 "suffix": "_test",
+                                                 "output_destination": output_destination})
+        finally:
+            try:
+                if os.path.exists(output_destination):
+                    os.remove(output_destination)
+            except OSError:
+                pass
+        return tester.results[-1]["returncode"] if tester.results else None
+
+    def _check_capabilities(self, recordings):
+        """
+        Tests the settings of all profiles with short test stitches of the first recording.
+        Results are kept per ProStitcher binary, so each combination of settings is tested only once.
+        """
+        self._capabilities = CapabilityMatrix(self.settings["stitcher_path"])
+        self._capabilities.load()
+        settings_list = [dict(self.settings, **overrides) for profile, overrides in self._active_profiles]
+        if self.settings["preview_mode"] in (self.PREVIEW_FIRST, self.PREVIEW_ONLY):
+            settings_list.append(dict(self.settings, **self._get_preview_overrides(recordings[0], analyse=False)))
+        missing = self._capabilities.get_missing(settings_list)
+        if missing:
+            self._log_info(f"Testing {len(missing)} combinations of settings with {recordings[0]}")
+            self._capabilities.probe(missing,
+                                     lambda settings: self.run_capability_test(recordings[0], settings),
+                                     lambda: self._stopping,
+                                     self._log_info)
+
+    def _is_supported(self, job):
+        """
+        Returns False if the settings of a job failed a test stitch, so the job is not queued.
+        """
+        if not self._capabilities:
+            return True
+        settings = self._get_recording_settings(job["recording"], job.get("overrides"), analyse=False)
+        returncode = self._capabilities.get(settings)
+        if returncode is None or returncode == 0:
+            return True
+        explanation, resolution = self.explain_returncode(returncode, settings["encode_use_hardware"])
+        self._log_error(f"ERROR: Skipping {job['name']}. Its settings failed a test stitch with ProStitcher code {returncode}"
+                        + (f" ({explanation})." if explanation else "."))
+        if resolution:
+            self._log_info(resolution)
+        return False
+
     @classmethod
     def get_prostitcher_major_version(cls, prostitcher_path):
         """
@@ -367,9 +1233,39 @@ class ProStitcherController:
             pass
         return major_version
 
-    def update_template(self, recording_settings, recording_name, duration, input_fps, recording_project_data, output_destination):
+    @tracer.traced("read_project", "io")
+    def _read_project(self, recording_project_file):
+        """
+        returns the content of a pro.prj file. Cached so jobs of the same recording read it only once.
+        """
+        if recording_project_file not in self._project_cache:
+            self._project_cache[recording_project_file] = Helpers.read_file(recording_project_file)
+        return self._project_cache[recording_project_file]
+
+    def _parse_project(self, recording_project_file):
+        """
+        returns the parsed XML tree of a pro.prj file. Cached so jobs of the same recording parse it only once.
+        """
+        if recording_project_file not in self._project_tree_cache:
+            self._project_tree_cache[recording_project_file] = et.fromstring(self._read_project(recording_project_file))
+        return self._project_tree_cache[recording_project_file]
+
+    def _forget_project(self, recording):
+        """
+        Drops the cached pro.prj file of a recording after its jobs ended.
+        """
+        recording_project_file = os.path.join(self.settings["source_dir"], recording, "pro.prj")
+        self._project_cache.pop(recording_project_file, None)
+        self._project_tree_cache.pop(recording_project_file, None)
+
+    @tracer.traced("update_template", "controller")
+    def update_template(self, recording_settings, recording_name, duration, input_fps, recording_project_data, output_destination,
+                        recording_project_file=None):
         try:
-            project = et.fromstring(recording_project_data)
+            if recording_project_file:
+                project = self._parse_project(recording_project_file)
+            else:
+                project = et.fromstring(recording_project_data)
             gravity_x = str(round(float(project.find("./gyro/calibration/gravity_x").text), 6))
             gravity_y = str(round(float(project.find("./gyro/calibration/gravity_y").text), 6))
             gravity_z = str(round(float(project.find("./gyro/calibration/gravity_z").text), 6))
@@ -397,7 +1293,7 @@ class ProStitcherController:
             recording_settings["firmware_version"] = firmware_version
             recording_settings["recording_dir"] = os.path.join(recording_settings["source_dir"], recording_name)
             recording_settings["output_destination"] = output_destination
-            recording_settings["recording_name"] = recording_name
+            recording_settings["recording_name"] = os.path.basename(os.path.normpath(recording_settings["recording_dir"]))
             recording_settings["trim_start"] = Helpers.parse_int(recording_settings["trim_start"])
             if recording_settings["trim_start"] < 0 or recording_settings["trim_start"] > duration:
                 recording_settings["trim_start"] = 0
@@ -614,34 +1510,47 @@ class ProStitcherController:
 
         return recording_template
 
-    def process_recording(self, recording):
+    @tracer.traced("process_recording", "controller")
+    def process_recording(self, recording, job=None):
+        """
+        Stitches a recording.
+        :param recording: folder name in source_dir, or absolute path of the recording folder
+        :param job: optional dict with "name", "overrides" (settings for this job only),
+                    "output_destination" and "suffix" for temporary file names
+        returns ProStitcher return code
+        """
         result = -1
         t = strftime("%H%M%S", localtime())
+        job = job or {}
+        job_name = job.get("name") or recording
 
         # make private copy as we'll change some things for each recording
-        recording_settings = copy.deepcopy(self.settings)
+        recording_settings = copy.deepcopy(self._get_recording_settings(recording, job.get("overrides")))
 
-        self._log_info("\nProcessing {}".format(recording))
+        self._log_info("\nProcessing {}".format(job_name))
 
         # insert any default settings not present
         for k,v in self.default_parameters.items():
             if k not in recording_settings:
                 recording_settings[k] = v
 
-        preview_filepath = os.path.join(recording_settings["source_dir"], recording, "preview.mp4")
-        duration, fps = self._run_ffprobe(recording_settings["ffprobe_path"], preview_filepath)
+        # recording is a folder name in source_dir, or the absolute path of a recording folder
+        recording_dir = os.path.join(recording_settings["source_dir"], recording)
+        recording_name = os.path.basename(os.path.normpath(recording_dir))
+        duration, fps = self._probe_recording(recording)
 
         if duration >= recording_settings["min_recording_duration"]:
 
             # create file paths
             tempdir = tempfile.gettempdir()
-            recording_project_file = os.path.join(recording_settings["source_dir"], recording, "pro.prj")
-            destination_file = "{}_{}.{}".format(recording, t, recording_settings["output_format"])
-            output_destination = os.path.join(recording_settings["target_dir"], destination_file)
-            project_filepath = os.path.join(tempdir, recording + "_{}_project.xml".format(t))
-            template_filepath = os.path.join(tempdir, recording + "_{}_template.xml".format(t))
-            recording_logfile = os.path.join(tempdir, recording + "_{}_stitcher.log".format(t))
-            parameters_filepath = os.path.join(tempdir, recording + "_{}_parameters.json".format(t))
+            recording_project_file = os.path.join(recording_dir, "pro.prj")
+            file_prefix = recording_name + job.get("suffix", "")
+            destination_file = "{}_{}.{}".format(file_prefix, t, recording_settings["output_format"])
+            output_destination = job.get("output_destination") or os.path.join(recording_settings["target_dir"], destination_file)
+            project_filepath = os.path.join(tempdir, file_prefix + "_{}_project.xml".format(t))
+            template_filepath = os.path.join(tempdir, file_prefix + "_{}_template.xml".format(t))
+            recording_logfile = os.path.join(tempdir, file_prefix + "_{}_stitcher.log".format(t))
+            parameters_filepath = os.path.join(tempdir, file_prefix + "_{}_parameters.json".format(t))
 
             # update trim end settings from relative to absolute.
             if not recording_settings["trim_end"]:
@@ -670,9 +1579,12 @@ class ProStitcherController:
                         recording, stitching_duration))
                 return result
 
+            if not recording_settings["reference_time"] and recording_settings["auto_reference_time"]:
+                recording_settings["reference_time"] = self._get_reference_time(recording, duration)
+
             # read project file
             if os.path.exists(recording_project_file):
-                recording_project_data = Helpers.read_file(recording_project_file)
+                recording_project_data = self._read_project(recording_project_file)
                 Helpers.write_file(project_filepath, recording_project_data)
 
                 # get stitcher version
@@ -684,7 +1596,8 @@ class ProStitcherController:
                                                             int(duration),
                                                             fps,
                                                             recording_project_data,
-                                                            output_destination)
+                                                            output_destination,
+                                                            recording_project_file)
                 Helpers.write_file(template_filepath, recording_template)
                 try:
                     Helpers.write_file(parameters_filepath, json.dumps(recording_settings, indent=4))
@@ -693,55 +1606,248 @@ class ProStitcherController:
 
                 # stitch
                 stitching_duration = int(stitching_duration)
-                self._log_info("Stitching {} (stitching {}s of total {}s) ".format(recording, stitching_duration, duration))
+                self._log_info("Stitching {} (stitching {}s of total {}s) ".format(job_name, stitching_duration, duration))
                 self._log_info(f"ProStitcher: {recording_settings['stitcher_path']}\n"
                                 f"Template: {os.path.abspath(template_filepath)}\n"
                                 f"Logfile: {os.path.abspath(recording_logfile)}\n"
                                 f"Settings: {os.path.abspath(parameters_filepath)}")
+                estimated_size = DiskPlanner.estimate_output_size(recording_settings["bitrate"],
+                                                                  stitching_duration,
+                                                                  recording_settings["audio_type"])
+                if self._disk_planner and not self._disk_planner.wait_for_space(job_name,
+                                                                                 estimated_size,
+                                                                                 lambda: self._stopping,
+                                                                                 self.settings["disk_check_interval"]):
+                    return result
                 if not self._stopping:
+                    if self._vram_planner and not self._vram_planner.wait_for_vram(job_name,
+                                                                                   self._vram_planner.estimate(recording_settings),
+                                                                                   lambda: self._stopping,
+                                                                                   self.settings["vram_check_interval"]):
+                        return result
                     t1 = time()
-                    result = self._run_prostitcher(recording_settings["stitcher_path"],
-                                         tempdir,
-                                         os.path.abspath(template_filepath),
-                                         os.path.abspath(recording_logfile),
-                                         os.path.abspath(parameters_filepath))
+                    telemetry = None
+                    # reservations are released even if the job fails before ProStitcher runs
+                    try:
+                        if self._disk_planner:
+                            self._disk_planner.reserve_space(job_name, estimated_size, output_destination)
+                        expected_runtime = 0
+                        if self._runtime_history:
+                            expected_runtime = self._runtime_history.get_expected_runtime(recording_settings,
+                                                                                          stitching_duration, fps)
+                        if Helpers.parse_float(recording_settings.get("telemetry_interval")) > 0:
+                            telemetry = TelemetrySampler(recording_settings["telemetry_interval"],
+                                                         recording_settings.get("telemetry_gpu_command"),
+                                                         log_error=self._log_error)
+                        watchdog = Watchdog([os.path.abspath(recording_logfile), output_destination],
+                                            expected_runtime,
+                                            recording_settings.get("watchdog_timeout_factor", 3),
+                                            recording_settings.get("watchdog_stall_timeout", 600))
+                        self.events.publish(JobStarted(name=job_name, recording=recording, profile=job.get("profile"),
+                                                       slot=job.get("slot", 0), attempt=job.get("attempt", 1),
+                                                       output_destination=output_destination,
+                                                       stitching_duration=stitching_duration))
+                        result = self._run_prostitcher(recording_settings["stitcher_path"],
+                                             tempdir,
+                                             os.path.abspath(template_filepath),
+                                             os.path.abspath(recording_logfile),
+                                             os.path.abspath(parameters_filepath),
+                                             watchdog,
+                                             self._get_process_control(recording_settings, job.get("slot", 0)),
+                                             telemetry,
+                                             name=job_name)
+                    finally:
+                        if self._disk_planner:
+                            self._disk_planner.release_space(job_name)
+                        if self._vram_planner:
+                            if result == 0 and telemetry:
+                                self._vram_planner.learn(job_name, recording_settings,
+                                                         telemetry.get_summary().get("gpu_memory_mb", {}).get("peak"))
+                            self._vram_planner.release(job_name)
+                    metrics = telemetry.get_summary() if telemetry else {}
+                    job_result = self._add_result(job_name, recording, job, result, output_destination,
+                                                  stitching_duration, time() - t1, fps, recording_settings, metrics)
+                    if result == 0 and self._runtime_history:
+                        self._runtime_history.add(recording_settings, job_result["fps"])
+                    if result != 0 and (self._stopping or job_name in self._cancelled_jobs):
+                        self._remove_partial_output(job_result)
                     if result == 0:
                         t2 = time()
-                        t3 = int(t2 - t1)
-                        self._log_info("Completed {} in {}s at {} fps.".format(recording, t3,
+                        t3 = max(1, int(t2 - t1))
+                        self._log_info("Completed {} in {}s at {} fps.".format(job_name, t3,
                                                                              round(float(fps) * int(stitching_duration) / t3, 2)))
+                        if metrics:
+                            self._log_info("Resources: {}".format(TelemetrySampler.format_summary(metrics)))
 
                         if recording_settings["rename_after_stitching"]:
-                            try:
-                                cur_path = os.path.join(recording_settings["source_dir"], recording)
-                                new_path = os.path.join(recording_settings["source_dir"], recording_settings["rename_prefix"] + recording)
-                                os.rename(cur_path, new_path)
-                            except:
-                                pass
+                            self._rename_recording(recording_dir)
             else:
                 self._log_error("ERROR: Project file pro.prj not found for recording {}".format(recording))
         else:
             self._log_info("Recording {} is too short, skipping.".format(recording))
         return result
 
-    def _worker_func(self):
+    def _add_result(self, name, recording, job, returncode, output_destination, stitching_duration, wall_time, input_fps, recording_settings, metrics=None):
+        output_size = 0
+        try:
+            if os.path.exists(output_destination):
+                output_size = os.path.getsize(output_destination)
+        except OSError:
+            pass
+        fps = 0
+        if returncode == 0 and wall_time > 0:
+            fps = round(Helpers.parse_float(input_fps) * stitching_duration / wall_time, 2)
+        result = {
+            "name": name,
+            "recording": recording,
+            "profile": job.get("profile"),
+            "returncode": returncode,
+            "output_destination": output_destination,
+            "output_size": output_size,
+            "stitching_duration": stitching_duration,
+            "wall_time": round(wall_time, 2),
+            "fps": fps,
+            "attempt": job.get("attempt", 1),
+            "fallback": job.get("fallback") or {},
+            "settings": recording_settings,
+            "metrics": metrics or {},
+            "job_id": job.get("job_id"),
+        }
+        with self._results_lock:
+            self.results.append(result)
+        if returncode == 0:
+            self.events.publish(JobFinished(**{k: result[k] for k in JobFinished.fields}))
+        else:
+            explanation = self.explain_returncode(returncode, recording_settings.get("encode_use_hardware"))[0]
+            self.events.publish(JobFailed(message=explanation, **{k: result[k] for k in JobFailed.fields if k in result}))
+        return result
+
+    def _stitch_job(self, job):
+        """
+        Stitches a job. Known ProStitcher failures are retried right away with fallback settings,
+        while the origin files of the recording are still in the OS page cache.
+        returns return code of the last attempt
+        """
+        attempt = 1
+        result = self.process_recording(job["recording"], job)
+        while result != 0 and not self._stopping and job["name"] not in self._cancelled_jobs:
+            # the settings of the failed attempt, including the settings file of the recording
+            settings = self._get_recording_settings(job["recording"], job.get("overrides"), analyse=False)
+            fallback = self._retry_policy.get_fallback(result, settings, attempt)
+            if not fallback:
+                break
+            self._remove_partial_output(job)
+            attempt += 1
+            job = dict(job,
+                       overrides=dict(job.get("overrides") or {}, **fallback),
+                       fallback=dict(job.get("fallback") or {}, **fallback),
+                       attempt=attempt)
+            self._log_info("Retrying {} with {} (attempt {} of {})".format(
+                job["name"], ", ".join(f"{k} = {v}" for k, v in fallback.items()), attempt, self._retry_policy.max_attempts + 1))
+            result = self.process_recording(job["recording"], job)
+        return result
+
+    def _get_process_control(self, settings, slot):
+        """
+        Returns the process priority, affinity and memory limits for a worker slot.
+        Each setting can have a value per slot, separated by semicolons, e.g. process_cpus = 0-7;8-15
+        """
+        return ProcessControl(ProcessControl.get_slot_value(settings.get("process_nice"), slot),
+                              ProcessControl.get_slot_value(settings.get("process_ionice"), slot),
+                              ProcessControl.get_slot_value(settings.get("process_cpus"), slot),
+                              ProcessControl.get_slot_value(settings.get("process_memory_limit_mb"), slot),
+                              self._log_error)
+
+    def _remove_partial_output(self, job):
+        """
+        Removes the output file of the last failed attempt of a job.
+        """
+        with self._results_lock:
+            failed = [r for r in self.results if r["name"] == job["name"] and r["returncode"] != 0]
+        if failed:
+            try:
+                if os.path.exists(failed[-1]["output_destination"]):
+                    os.remove(failed[-1]["output_destination"])
+                    self._log_info("Removed incomplete file {}".format(failed[-1]["output_destination"]))
+            except OSError:
+                pass
+
+    def _requeue_job(self, job):
+        """
+        Queues a job again after the watchdog stopped it, at the end of the jobs with the same priority.
+        returns True if the job was queued
+        """
+        requeued = job.get("requeued", 0)
+        if self._stopping or self._draining or requeued >= self.settings["watchdog_requeue"] \
+                or job["name"] in self._cancelled_jobs:
+            return False
+        self._remove_partial_output(job)
+        self._log_info("Queuing {} again.".format(job["name"]))
+        self._put_job(dict(job, requeued=requeued + 1))
+        return True
+
+    def _worker_func(self, slot=0):
+        profiler = tracer.start_thread_profile()
         while True:
-            recording = self.q.get()
+            with tracer.span("queue_wait", "scheduler"):
+                priority, counter, job = self.q.get()
+            result = -1
+            requeued = False
+            cancelled = False
             try:
-                if recording is not None and not self._stopping:
-                    self.process_recording(recording)
+                if job is not None:
+                    with self._processes_lock:
+                        self._active_jobs[slot] = job["name"]
+                    self._wait_while_paused()
+                    job["slot"] = slot
+                    future = job.get("future")
+                    if job["name"] in self._cancelled_jobs:
+                        cancelled = True
+                    elif future and not future.running():
+                        # Future.cancel() only succeeds before this
+                        cancelled = not future.set_running_or_notify_cancel()
+                if job is not None and not self._stopping and not self._draining and not cancelled:
+                    cancelled = not self._claim_spooled(job)
+                if job is not None and not self._stopping and not self._draining and not cancelled:
+                    result = self._stitch_job(job)
+                    if result == self.RETURNCODE_STALLED:
+                        requeued = self._requeue_job(job)
             except Exception as e:
-                self._log_error("Error processing {}: {}".format(recording, str(e)))
+                self._log_error("Error processing {}: {}".format(job["name"], str(e)))
             finally:
+                with self._processes_lock:
+                    self._active_jobs.pop(slot, None)
+                # a requeued job is finished when its requeued copy ends
+                if not requeued:
+                    try:
+                        if job is not None and job.get("segment_group"):
+                            result = self._finish_segment(job, result)
+                    except Exception as e:
+                        result = -1
+                        self._log_error("Error joining segments of {}: {}".format(job["recording"], str(e)))
+                    try:
+                        if job is not None and job.get("recording_group"):
+                            self._finish_recording_job(job, result)
+                    except Exception as e:
+                        self._log_error("Error finishing {}: {}".format(job["recording"], str(e)))
+                    if job is not None and not job.get("recording_group"):
+                        # e.g. previews and single jobs, read again if the recording has more jobs
+                        self._forget_project(job["recording"])
+                    if job is not None and not job.get("segment_group"):
+                        self._finish_spooled(job, result, cancelled)
+                    if job is not None:
+                        self._resolve_future(job, result)
+                        self._cancelled_jobs.discard(job["name"])
                 self.q.task_done()
-                if recording is None:
-                    break
+            if job is None:
+                break
+        tracer.stop_thread_profile(profiler)
 
     def _start_workers(self, _worker_pool=3):
         threads = []
         for i in range(_worker_pool):
             if not self._stopping:
-                t = threading.Thread(target=self._worker_func)
+                t = threading.Thread(target=self._worker_func, args=(i,), name=f"Worker {i + 1}")
                 if t:
                     t.start()
                     threads.append(t)
@@ -750,36 +1856,61 @@ class ProStitcherController:
     def _stop_workers(self, threads):
         for i in threads:
             # _workers are configured to quit after retrieving None from the queue.
-            self.q.put(None)
+            self._put_job(None)
         for t in threads:
             t.join()
 
+    def _parse_overrides(self, overrides):
+        """
+        Converts setting overrides read as strings to the types of the default settings.
+        """
+        parsed = {}
+        for k, v in (overrides or {}).items():
+            default = self.default_settings.get(k)
+            if isinstance(default, bool):
+                parsed[k] = Helpers.parse_bool(v)
+            elif isinstance(default, int):
+                parsed[k] = Helpers.parse_int(v, default)
+            elif isinstance(default, float):
+                parsed[k] = Helpers.parse_float(v, default)
+            else:
+                parsed[k] = v
+        if "bitrate_mbps" in parsed and "bitrate" not in parsed:
+            parsed["bitrate"] = Helpers.parse_int(parsed["bitrate_mbps"]) * 1024 * 1024
+        return parsed
+
+    def _prepare_profiles(self):
+        """
+        Selects the profiles listed in settings["profiles"]. Without profiles there is one job per recording.
+        """
+        self._active_profiles = []
+        for name in str(self.settings.get("profiles") or "").split(","):
+            name = name.strip()
+            if not name:
+                continue
+            if name in self.profiles:
+                self._active_profiles.append((name, self._parse_overrides(self.profiles[name])))
+            else:
+                self._log_error(f"Profile '{name}' not found, skipping.")
+        if not self._active_profiles:
+            self._active_profiles = [(None, {})]
+        elif len(self._active_profiles) > 1 or self._active_profiles[0][0]:
+            self._log_info("Stitching profiles: {}".format(", ".join(name for name, o in self._active_profiles)))
+
     def _prepare_settings(self):
-        self.settings["width"] = Helpers.parse_int(self.settings["width"])
-        self.settings["threads"] = Helpers.parse_int(self.settings["threads"])
-        self.settings["encode_use_hardware"] = Helpers.parse_int(self.settings["encode_use_hardware"])
-        self.settings["decode_hardware_count"] = Helpers.parse_int(self.settings["decode_hardware_count"])
-        self.settings["decode_use_hardware"] = Helpers.parse_int(self.settings["decode_use_hardware"])
-        self.settings["width"] = Helpers.parse_int(self.settings["width"])
-        self.settings["bitrate"] = Helpers.parse_int(self.settings["bitrate"])
-        self.settings["bitrate_mbps"] = int(self.settings["bitrate"]/1024/1024)
-        self.settings["min_recording_duration"] = Helpers.parse_int(self.settings["min_recording_duration"])
-        self.settings["trim_start"] = Helpers.parse_int(self.settings["trim_start"])
-        self.settings["trim_end"] = Helpers.parse_int(self.settings["trim_end"])
-        self.settings["zenith_optimisation"] = Helpers.parse_int(self.settings["zenith_optimisation"])
-        self.settings["flowstate_stabilisation"] = Helpers.parse_int(self.settings["flowstate_stabilisation"])
-        self.settings["original_offset"] = Helpers.parse_int(self.settings["original_offset"])
-        self.settings["smooth_stitch"] = Helpers.parse_int(self.settings["smooth_stitch"])
-        self.settings["zenith_optimisation"] = Helpers.parse_int(self.settings["zenith_optimisation"])
-        self.settings["reference_time"] = Helpers.parse_int(self.settings["reference_time"])
-        self.settings["roll_x"] = Helpers.parse_int(self.settings["roll_x"])
-        self.settings["tilt_y"] = Helpers.parse_int(self.settings["tilt_y"])
-        self.settings["pan_z"] = Helpers.parse_int(self.settings["pan_z"])
+        # convert values entered as strings in the GUI or ini file once, before any job uses them
+        self.settings.update(StitchSettings(self.settings).to_dict())
 
     def stitch(self, log_callback=None, done_callback=None):
         self.log_callback = log_callback
         self.done_callback = done_callback
         self._prepare_settings()
+        self.results = []
+        trace_file = self.settings.get("trace_file")
+        profile_file = self.settings.get("profile_file")
+        if trace_file or profile_file:
+            tracer.start(trace=bool(trace_file), profile=bool(profile_file))
+        profiler = tracer.start_thread_profile()
 
         source_dir = self.settings["source_dir"]
         source_filter = self.settings["source_filter"]
@@ -787,50 +1918,457 @@ class ProStitcherController:
         threads = self.settings["threads"]
 
         self._log_info(f"Starting to stitch recordings in folder '{source_dir}'")
+        self._prepare_profiles()
+        self._prepare_batch()
+        # started before recordings are probed, to include the probe latency
+        self._start_metrics_exporter()
+        target_dir = self.settings["target_dir"]
 
-        try:
-            if not target_dir:
-                target_dir = source_dir
-            if not os.path.exists(target_dir):
-                os.makedirs(target_dir)
-        except Exception as e:
-            error = "Error location or creating target directory '{}': {}".format(target_dir, str(e))
-            self._log_error(error)
-            self._log_info(error)
-
-        recordings = Helpers.get_subdirs(source_dir, source_filter)
+        if self.settings["source_recursive"]:
+            recordings = self._discover_recordings(source_dir, source_filter)
+        else:
+            recordings = Helpers.get_subdirs(source_dir, source_filter)
         if not recordings:
             self._log_error("No recordings in folder '{}'".format(source_dir))
         else:
             self._log_info(f"Found {len(recordings)} recordings to stitch")
+            if self.settings["preview_mode"] == self.PREVIEW_APPROVED:
+                recordings = [r for r in recordings if os.path.exists(self._get_preview_destination(r))]
+                self._log_info(f"{len(recordings)} recordings have an approved preview in '{self._get_preview_dir()}'")
+            recordings = self._plan_disk_space(recordings, target_dir)
+            if recordings and self.settings["capability_check"] and not self._stopping:
+                self._check_capabilities(recordings)
+        spooled = self._spool.get_queued() if self._spool else []
+
+        if recordings or spooled:
 
             try:
                 _workers = self._start_workers(_worker_pool=threads)
-                for r in recordings:
-                    if not self._stopping:
-                        self.q.put(r)
+                self._workers = _workers
+                self._start_status_server()
+                # unfinished jobs of earlier batches first
+                self._queue_spooled()
+                analysed = self._analyse_recordings(recordings)
+                if self.settings["preview_mode"] in (self.PREVIEW_FIRST, self.PREVIEW_ONLY):
+                    if not os.path.exists(self._get_preview_dir()):
+                        os.makedirs(self._get_preview_dir())
+                    # previews have a higher priority and are stitched before any full quality job
+                    for r in analysed:
+                        if not self._stopping:
+                            job = self._create_preview_job(r)
+                            if not self._is_spooled(r, job["name"]) and self._is_supported(job):
+                                job["spool_id"] = self._spool_add(JobSpool.KIND_JOB, r, job["name"], None,
+                                                                  self._get_spool_data(job), job["priority"])
+                                self._put_job(job)
+                    # all recordings are analysed now
+                    analysed = recordings
+                if self.settings["preview_mode"] != self.PREVIEW_ONLY:
+                    for r in analysed:
+                        if not self._stopping:
+                            self._queue_recording(r)
+                poll_thread = None
+                if self._spool:
+                    self._spool_poll_stop.clear()
+                    poll_thread = threading.Thread(target=self._poll_spool, name="Job spool", daemon=True)
+                    poll_thread.start()
                 self.q.join()  # blocking
+                if poll_thread:
+                    self._spool_poll_stop.set()
+                    poll_thread.join()
                 self._stop_workers(_workers)
+                self._workers = []
+                self._save_history()
                 self._log_info('Done. \n')
             except Exception as e:
                 error = "Error processing recordings: {}".format((e))
                 self._log_error(error)
-
+            finally:
+                self._stop_status_server()
+                if self._spool:
+                    self._spool.stop_heartbeat()
+
+        self._stop_metrics_exporter()
+        tracer.stop_thread_profile(profiler)
+        self._export_trace(trace_file, profile_file)
+        batch = BatchResult.from_results(self.results, self._stopping or self._draining)
+        self.events.publish(BatchDone(succeeded=len(batch.succeeded), failed=len(batch.failed), stopped=batch.stopped))
+        # deliver all log messages before the GUI is told the batch is done
+        self._log_subscription.flush()
         if self.done_callback:
             self.done_callback()
-    
-    def _log_info(self, text):
-        if self.log_callback:
-            self.log_callback("info", text)
+        return batch
+
+    def _prepare_batch(self):
+        """
+        Sets up retries, runtime and VRAM history and the target folder before the first job starts.
+        """
+        self._retry_policy = RetryPolicy(self.retry_rules, self.settings["retry_max_attempts"])
+        self._runtime_history = RuntimeHistory()
+        self._runtime_history.load()
+        self._vram_planner = None
+        if self._spool:
+            self._spool.stop_heartbeat()
+        self._spool = None
+        self._spooled_ids = set()
+        self._spooled_recordings = set()
+        if self.settings["job_spool"]:
+            self._spool = JobSpool(self.settings.get("job_spool_path"))
+            if self._spool.open():
+                self._spool.start_heartbeat()
+            else:
+                self._log_error("Job spool not available, jobs will not be kept after a restart.")
+                self._spool = None
+        if self.settings["vram_admission"]:
+            self._vram_planner = VramPlanner(self.settings.get("vram_budget_mb"),
+                                             self.settings.get("vram_probe_command"),
+                                             self.settings.get("vram_reserve_mb"),
+                                             log_info=self._log_info,
+                                             log_error=self._log_error)
+            self._vram_planner.load()
+        self._scene_analyzer = None
+        if self.settings["auto_reference_time"] or self.settings["auto_trim"]:
+            self._scene_analyzer = SceneAnalyzer(self._get_ffmpeg_path(), log_info=self._log_info, log_error=self._log_error)
+            self._scene_analyzer.load()
+
+        target_dir = self.settings["target_dir"]
+        try:
+            if not target_dir:
+                target_dir = self.settings["source_dir"]
+            if not os.path.exists(target_dir):
+                os.makedirs(target_dir)
+            self.settings["target_dir"] = target_dir
+        except Exception as e:
+            error = "Error location or creating target directory '{}': {}".format(target_dir, str(e))
+            self._log_error(error)
+            self._log_info(error)
+
+    def _start_status_server(self):
+        if Helpers.parse_int(self.settings.get("status_port")) > 0 and not self._status_server:
+            self._status_server = StatusServer(self, self.settings.get("status_host"),
+                                               self.settings.get("status_port"),
+                                               self.settings.get("status_token"))
+            if not self._status_server.start():
+                self._status_server = None
+
+    def _stop_status_server(self):
+        if self._status_server:
+            self._status_server.stop()
+            self._status_server = None
+
+    def _start_metrics_exporter(self):
+        if (Helpers.parse_int(self.settings.get("metrics_port")) > 0 or self.settings.get("metrics_textfile")) \
+                and not self._metrics_exporter:
+            self._metrics_exporter = MetricsExporter(self, self.settings.get("metrics_host"),
+                                                     self.settings.get("metrics_port"),
+                                                     self.settings.get("metrics_textfile"),
+                                                     self.settings.get("metrics_interval"))
+            if not self._metrics_exporter.start():
+                self._metrics_exporter = None
+
+    def _stop_metrics_exporter(self):
+        if self._metrics_exporter:
+            self._metrics_exporter.stop()
+            self._metrics_exporter = None
+
+    def _save_history(self):
+        if self._runtime_history:
+            self._runtime_history.save()
+        if self._vram_planner:
+            self._vram_planner.save()
+        if self._scene_analyzer:
+            self._scene_analyzer.save()
+
+    def start(self, log_callback=None):
+        """
+        Starts the worker threads for jobs added with submit(), without scanning the source folder.
+        Called by submit() if needed.
+        """
+        if self._workers:
+            return
+        self.log_callback = log_callback or self.log_callback
+        self._prepare_settings()
+        self._prepare_batch()
+        self._workers = self._start_workers(_worker_pool=max(1, self.settings["threads"]))
+        self._start_status_server()
+        self._start_metrics_exporter()
+
+    def submit(self, job):
+        """
+        Queues a job for the worker threads, e.g. from an ingest service.
+        Segments and the profiles in settings["profiles"] are not used, submit one job per profile instead.
+        :param job: StitchJob
+        :return: concurrent.futures.Future resolving to a JobResult when the job ended. Jobs that did not start
+                 yet can be cancelled with Future.cancel().
+        """
+        self.start()
+        overrides = {}
+        if job.profile:
+            if job.profile in self.profiles:
+                overrides.update(self._parse_overrides(self.profiles[job.profile]))
+            else:
+                self._log_error(f"Profile '{job.profile}' not found, skipping.")
+        overrides.update(self._parse_overrides(job.overrides))
+        future = Future()
+        queued_job = {
+            "recording": job.recording,
+            "name": job.name,
+            "suffix": f"_{job.profile}" if job.profile else "",
+            "profile": job.profile,
+            "overrides": overrides,
+            "job_id": job.id,
+            "future": future,
+        }
+        if job.output_destination:
+            queued_job["output_destination"] = job.output_destination
+        if job.priority is not None:
+            queued_job["priority"] = job.priority
+        queued_job["spool_id"] = self._spool_add(JobSpool.KIND_JOB, job.recording, job.name, job.profile,
+                                                 self._get_spool_data(queued_job), job.priority)
+        self._put_job(queued_job)
+        return future
+
+    def enqueue(self, recordings):
+        """
+        Adds recordings to the job spool for all profiles in settings["profiles"], e.g. from another process.
+        A running batch with job_spool enabled starts them within job_spool_poll_interval seconds,
+        otherwise the next batch does.
+        :param recordings: folder names in source_dir, or absolute paths of recording folders
+        :return: number of jobs added
+        """
+        self._prepare_settings()
+        self._prepare_profiles()
+        spool = JobSpool(self.settings.get("job_spool_path"))
+        # entries of a running batch must stay claimed by it
+        if not spool.open(recover=False):
+            return 0
+        added = 0
+        for recording in recordings:
+            if not os.path.isdir(os.path.join(self.settings["source_dir"], recording)):
+                self._log_error("Recording folder '{}' not found.".format(recording))
+                continue
+            for profile, overrides in self._active_profiles:
+                name = f"{recording} ({profile})" if profile else recording
+                if spool.add(JobSpool.KIND_RECORDING, self.settings["source_dir"], recording, name, profile,
+                             {"overrides": overrides}, self.PRIORITY_DEFAULT):
+                    self._log_info(f"Added {name} to the job spool.")
+                    added += 1
+        return added
+
+    @staticmethod
+    def _get_spool_data(job):
+        """
+        returns the settings of a job that are kept in the job spool
+        """
+        return {k: job[k] for k in ("suffix", "overrides", "output_destination") if k in job}
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker threads started by start().
+        :param wait: finish all queued jobs first, otherwise running jobs are cancelled
+        """
+        if not self._workers:
+            return
+        if not wait:
+            self.stop()
+        self.q.join()
+        self._stop_workers(self._workers)
+        self._workers = []
+        self._stop_status_server()
+        self._stop_metrics_exporter()
+        if self._spool:
+            self._spool.stop_heartbeat()
+        self._save_history()
+        self._log_subscription.flush()
+
+    def _resolve_future(self, job, result):
+        """
+        Sets the JobResult of a job added with submit().
+        """
+        future = job.get("future")
+        if not future or future.done():
+            return
+        with self._results_lock:
+            results = [r for r in self.results if r.get("job_id") == job["job_id"]]
+        if results:
+            future.set_result(JobResult.from_result(results[-1]))
         else:
-            print(text)
+            # stopped or skipped before ProStitcher ran
+            future.set_result(JobResult(job["name"], job["recording"], result,
+                                        output_path=job.get("output_destination"), profile=job.get("profile")))
+
+
+    def _export_trace(self, trace_file, profile_file):
+        """
+        Logs the time spent in each traced function and writes the trace and profile files.
+        """
+        if tracer.enabled:
+            totals = tracer.get_totals()
+            self._log_info("Time spent: " + ", ".join(
+                f"{name} {round(duration, 2)}s ({count}x)"
+                for name, (count, duration) in sorted(totals.items(), key=lambda t: -t[1][1])))
+            if tracer.export(trace_file):
+                self._log_info(f"Trace written to {os.path.abspath(trace_file)}")
+        if tracer.profiling and tracer.export_profile(profile_file):
+            self._log_info(f"Profile written to {os.path.abspath(profile_file)}")
+        tracer.stop()
+
+    def _log_info(self, text):
+        self.events.publish(LogMessage(level="info", text=text))
 
     def _log_error(self, text):
+        self.events.publish(LogMessage(level="error", text=text))
+
+    def _on_log_event(self, event):
+        """
+        Writes log messages and progress as text to log_callback, or to stdout and stderr.
+        """
+        level = getattr(event, "level", "info")
+        # progress is shown as a row of dots
+        text = event.text if isinstance(event, LogMessage) else "."
         if self.log_callback:
-            self.log_callback("error", text)
-        else:
+            self.log_callback(level, text)
+        elif level == "error":
             sys.stderr.write(text)
             sys.stderr.write("\n")
+        else:
+            print(text)
+
+    def _wait_while_paused(self):
+        while self._paused and not self._stopping and not self._draining:
+            sleep(1)
+
+    def _signal_process(self, p, watchdog, suspend):
+        try:
+            if suspend:
+                os.kill(p.pid, signal.SIGSTOP)
+                if watchdog:
+                    watchdog.suspend()
+            else:
+                os.kill(p.pid, signal.SIGCONT)
+                if watchdog:
+                    watchdog.resume()
+        except (OSError, AttributeError) as e:
+            self._log_error("Error {} stitching process {}: {}".format("suspending" if suspend else "resuming", p.pid, str(e)))
+
+    def _suspend_children(self, suspend):
+        """
+        Suspends or resumes running ProStitcher processes with SIGSTOP/SIGCONT. Not available on Windows.
+        """
+        if sys.platform == "win32" or suspend == self._children_suspended:
+            return
+        with self._processes_lock:
+            self._children_suspended = suspend
+            for p, watchdog in self._processes.values():
+                self._signal_process(p, watchdog, suspend)
+
+    def is_paused(self):
+        return self._paused
+
+    def pause(self, suspend_running=None):
+        """
+        Stops starting new jobs. Running jobs continue, or are suspended if suspend_running
+        or the setting pause_suspend_children is set.
+        """
+        if suspend_running is None:
+            suspend_running = self.settings.get("pause_suspend_children")
+        if self._stopping or self._paused:
+            return
+        self._paused = True
+        if suspend_running and sys.platform != "win32":
+            self._suspend_children(True)
+            self._log_info("Paused. Running stitching processes are suspended.")
+        else:
+            self._log_info("Paused. No new recordings will be started, running stitching processes continue.")
+
+    def resume(self):
+        if not self._paused:
+            return
+        self._suspend_children(False)
+        self._paused = False
+        self._log_info("Resumed.")
+
+    def drain(self):
+        """
+        Lets running jobs finish, then stops. Queued jobs are not started.
+        """
+        if self._stopping or self._draining:
+            return
+        self._draining = True
+        self._suspend_children(False)
+        self._paused = False
+        self._log_info("Finishing running jobs, then stopping. Queued recordings will not be started.")
+
+    def get_state(self):
+        """
+        returns "stopping", "draining", "paused", "running" or "idle"
+        """
+        if self._stopping:
+            return "stopping"
+        elif self._draining:
+            return "draining"
+        elif self._paused:
+            return "paused"
+        elif self._workers:
+            return "running"
+        return "idle"
+
+    def get_queue(self):
+        """
+        returns list of dicts with name, recording, profile and priority of the queued jobs, in the order they start
+        """
+        with self.q.mutex:
+            entries = sorted(e for e in self.q.queue if e[2] is not None)
+        return [{"name": job["name"], "recording": job["recording"], "profile": job.get("profile"), "priority": priority}
+                for priority, counter, job in entries]
+
+    def get_running(self):
+        """
+        returns list of dicts with name and slot of the jobs that workers took from the queue and did not finish yet,
+        including jobs waiting for disk space or VRAM
+        """
+        with self._processes_lock:
+            active = sorted(self._active_jobs.items())
+        return [{"name": name, "slot": slot} for slot, name in active]
+
+    def cancel(self, name):
+        """
+        Cancels a queued or running job. A running ProStitcher process is stopped and its output file removed.
+        returns True if the job was found
+        """
+        with self.q.mutex:
+            spool_ids = [job.get("spool_id") for priority, counter, job in self.q.queue
+                         if job is not None and job["name"] == name]
+        found = bool(spool_ids)
+        with self._processes_lock:
+            found = found or name in self._process_names.values()
+        if found:
+            self._cancelled_jobs.add(name)
+            if self._spool:
+                # also cancelled if the batch ends before a worker takes the job from the queue
+                self._spool.set_state(spool_ids, JobSpool.STATE_CANCELLED)
+            self.events.publish(JobCancelled(name=name))
+            self._log_info(f"Cancelling {name}.")
+        return found
+
+    def reprioritize(self, name, priority):
+        """
+        Changes the priority of a queued job. Jobs with lower values are started first.
+        returns True if the job was found
+        """
+        spool_ids = []
+        with self.q.mutex:
+            for i, (old_priority, counter, job) in enumerate(self.q.queue):
+                if job is not None and job["name"] == name:
+                    job["priority"] = priority
+                    self.q.queue[i] = (priority, counter, job)
+                    spool_ids.append(job.get("spool_id"))
+            if spool_ids:
+                heapq.heapify(self.q.queue)
+        if self._spool:
+            self._spool.set_priority(spool_ids, priority)
+        return bool(spool_ids)
 
     def stop(self):
         self._stopping = True
+        # suspended processes must continue to handle terminate
+        self._suspend_children(False)
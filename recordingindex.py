@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Find Insta360 Pro 2 recordings in nested folders on one or more drives, using a persistent index
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import json
+import threading
+from os import scandir
+from concurrent.futures import ThreadPoolExecutor
+from helpers import Helpers
+
+
+class RecordingIndex:
+
+    index_version = 1
+    ignore_entries = [".DS_store", "__pycache__", "$RECYCLE.BIN", "System Volume Information"]
+    project_file = "pro.prj"
+    origin_files = ["origin_1.mp4", "origin_2.mp4", "origin_3.mp4", "origin_4.mp4", "origin_5.mp4", "origin_6.mp4"]
+
+    def __init__(self, index_path=None):
+        if index_path is None:
+            index_path = os.path.join(Helpers.get_datadir(), "BatchStitcher", "recording_index.json")
+        self.index_path = index_path
+        # directory path -> {"mtime_ns": int, "subdirs": [path, ...], "recording": bool}
+        self._dirs = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @classmethod
+    def is_recording(cls, names):
+        """
+        Returns True if a folder with the given entry names is a recording, i.e. has pro.prj and all origin files.
+        """
+        names = set(names)
+        return cls.project_file in names and all(f in names for f in cls.origin_files)
+
+    def load(self):
+        self._loaded = True
+        if self.index_path and os.path.isfile(self.index_path):
+            try:
+                data = json.loads(Helpers.read_file(self.index_path, default='{}'))
+                if data.get("version") == self.index_version:
+                    self._dirs = data.get("dirs", {})
+            except Exception as e:
+                sys.stderr.write("Error reading recording index: {}\n".format(str(e)))
+                self._dirs = {}
+
+    def save(self):
+        if not self.index_path:
+            return False
+        try:
+            index_dir = os.path.dirname(self.index_path)
+            if index_dir and not os.path.exists(index_dir):
+                os.makedirs(index_dir)
+            with self._lock:
+                data = json.dumps({"version": self.index_version, "dirs": self._dirs})
+            # write to a temporary file first so an interrupted write does not corrupt the index
+            tmp_path = self.index_path + ".tmp"
+            if Helpers.write_file(tmp_path, data):
+                os.replace(tmp_path, self.index_path)
+                return True
+        except Exception as e:
+            sys.stderr.write("Error writing recording index: {}\n".format(str(e)))
+        return False
+
+    def _scan_dir(self, path):
+        """
+        Returns (is_recording, subdirs) for path. Uses the index entry if the directory mtime is unchanged.
+        """
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return False, []
+        with self._lock:
+            entry = self._dirs.get(path)
+        if entry and entry.get("mtime_ns") == mtime_ns:
+            return entry.get("recording", False), entry.get("subdirs", [])
+
+        names = []
+        subdirs = []
+        try:
+            with scandir(path) as it:
+                for e in it:
+                    names.append(e.name)
+                    if e.name in self.ignore_entries or e.name.startswith("."):
+                        continue
+                    try:
+                        if e.is_dir(follow_symlinks=False):
+                            subdirs.append(e.path)
+                    except OSError:
+                        pass
+        except OSError:
+            return False, []
+        recording = self.is_recording(names)
+        if recording:
+            # recordings do not contain nested recordings
+            subdirs = []
+        with self._lock:
+            self._dirs[path] = {"mtime_ns": mtime_ns, "subdirs": sorted(subdirs), "recording": recording}
+        return recording, subdirs
+
+    def _scan_tree(self, path, seen=None):
+        """
+        Returns (recordings, visited folders) below path.
+        """
+        if seen is None:
+            seen = set()
+        recordings = []
+        pending = [path]
+        while pending:
+            current = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            recording, subdirs = self._scan_dir(current)
+            if recording:
+                recordings.append(current)
+            else:
+                pending.extend(subdirs)
+        return recordings, seen
+
+    def scan(self, roots, startswith=None, max_workers=8):
+        """
+        Recursively finds recordings below the given root folders.
+        Unchanged folders are taken from the index; only changed subtrees are listed again.
+        :param roots: list of folders or drives
+        :param startswith: optional prefix for recording folder names, e.g. VID_
+        :return: sorted list of absolute recording paths
+        """
+        if not self._loaded:
+            self.load()
+
+        # Scan the first level of each root sequentially, then the subtrees in parallel
+        roots = [os.path.abspath(r) for r in roots if r and os.path.isdir(r)]
+        top_level = []
+        recordings = []
+        visited = set(roots)
+        for root in roots:
+            recording, subdirs = self._scan_dir(root)
+            if recording:
+                recordings.append(root)
+            else:
+                top_level.extend(subdirs)
+
+        if max_workers and max_workers > 1 and len(top_level) > 1:
+            # each worker keeps its own set of visited folders, duplicates from overlapping roots are removed below
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(top_level))) as executor:
+                results = list(executor.map(self._scan_tree, top_level))
+        else:
+            seen = set()
+            results = [self._scan_tree(p, seen) for p in top_level]
+        for r, seen in results:
+            recordings.extend(r)
+            visited.update(seen)
+
+        self._prune(roots, visited)
+        self.save()
+
+        if startswith:
+            recordings = [r for r in recordings if os.path.basename(r).startswith(startswith)]
+        return sorted(set(recordings))
+
+    def _prune(self, roots, visited):
+        """
+        Removes index entries below the scanned roots that were not visited, e.g. deleted or moved folders.
+        """
+        prefixes = tuple(os.path.join(r, "") for r in roots)
+        with self._lock:
+            for path in list(self._dirs.keys()):
+                if path not in visited and (path in roots or path.startswith(prefixes)):
+                    del self._dirs[path]
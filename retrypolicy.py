@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Choose fallback settings for retrying a job after known ProStitcher failure codes
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+from helpers import Helpers
+
+
+class RetryPolicy:
+
+    ANY = "*"
+
+    # ProStitcher return code -> fallback changes as (setting, current value, new value), tried in order.
+    # One change is applied per retry, on top of the changes of earlier retries.
+    default_rules = {
+        # Hardware encoding not supported, or codec/profile/bitrate not supported by hardware
+        244: [("encode_use_hardware", 1, 0),
+              ("encode_profile", "high", "main"),
+              ("encode_profile", "main", "baseline"),
+              ("output_codec", "h265", "h264")],
+        # File format, codec type and hardware encoding settings not compatible
+        1012: [("encode_use_hardware", 1, 0),
+               ("output_codec", "h265", "h264"),
+               ("output_codec", "prores", "h264")],
+        # Crash, often in the GPU blender or hardware decoder
+        -11: [("blender_type", "cuda", "opencl"),
+              ("blender_type", "opencl", "cpu"),
+              ("decode_use_hardware", 1, 0)],
+    }
+    default_rules[4294967295] = default_rules[-11]
+
+    def __init__(self, rules=None, max_attempts=2):
+        """
+        :param rules: dict of return code -> list of changes, replacing the default rules for these codes
+        :param max_attempts: maximum number of retries per job, 0 to disable retries
+        """
+        self.rules = dict(self.default_rules)
+        self.rules.update(rules or {})
+        self.max_attempts = max(0, Helpers.parse_int(max_attempts))
+
+    @classmethod
+    def parse_rules(cls, values):
+        """
+        Parses rules from an ini file section, e.g. "244 = encode_use_hardware=1>0, encode_profile=main>baseline".
+        Use * as current value to change a setting whatever its value.
+        :param values: dict of return code -> string of comma separated changes
+        :return: dict of return code -> list of (setting, current value, new value)
+        """
+        rules = {}
+        for code, changes in (values or {}).items():
+            try:
+                code = int(code)
+            except ValueError:
+                continue
+            rules[code] = []
+            for change in str(changes).split(","):
+                if "=" not in change or ">" not in change:
+                    continue
+                setting, values = change.split("=", 1)
+                current, new = values.split(">", 1)
+                rules[code].append((setting.strip(), current.strip(), new.strip()))
+        return rules
+
+    @classmethod
+    def _matches(cls, value, current):
+        if str(current) == cls.ANY:
+            return True
+        return str(value).strip().lower() == str(current).strip().lower()
+
+    def get_fallback(self, returncode, settings, attempt):
+        """
+        Returns settings changes for the next attempt of a failed job, or None if it should not be retried.
+        :param returncode: ProStitcher return code of the failed attempt
+        :param settings: effective settings of the failed attempt
+        :param attempt: number of the failed attempt, starting at 1
+        """
+        if attempt > self.max_attempts:
+            return None
+        for setting, current, new in self.rules.get(returncode, []):
+            if setting in settings and self._matches(settings[setting], current) \
+                    and not self._matches(settings[setting], new):
+                default = settings[setting]
+                if isinstance(default, bool):
+                    new = Helpers.parse_bool(new)
+                elif isinstance(default, int):
+                    new = Helpers.parse_int(new)
+                return {setting: new}
+        return None
@@ -0,0 +1,348 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Analyse small grayscale keyframes of the preview video of a recording, to choose a reference time and trim for stitching
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import json
+import threading
+import subprocess
+from helpers import Helpers
+
+try:
+    import numpy
+except ImportError:
+    # scores are calculated in pure Python, which is slower
+    numpy = None
+
+
+class SceneAnalyzer:
+
+    cache_version = 1
+
+    # size of the analysed frames. Keyframes of preview.mp4 are scaled down to this size by ffmpeg.
+    frame_width = 160
+    frame_height = 80
+
+    # seconds at the start and end of the stitching window not used as reference time
+    edge_margin = 2
+
+    # frames analysed at most, evenly spread over long recordings
+    max_frames = 300
+
+    # Trim detection: change of the mean brightness (0-255) between the frames before and after a boundary that
+    # marks e.g. going under water, the number of frames compared on each side, the mean pixel change between
+    # keyframes below which the camera is considered still, and the part of the recording searched at each end.
+    exposure_threshold = 20
+    exposure_frames = 3
+    motion_threshold = 2.0
+    trim_search = 0.4
+    # recordings whose frames are kept, at least the number analysed at the same time
+    frames_cache_size = 8
+
+    def __init__(self, ffmpeg="ffmpeg", cache_path=None, log_info=None, log_error=None):
+        if cache_path is None:
+            cache_path = os.path.join(Helpers.get_datadir(), "BatchStitcher", "scene_analysis.json")
+        self.ffmpeg = ffmpeg
+        self.cache_path = cache_path
+        self.log_info = log_info
+        self.log_error = log_error
+        # recording folder -> {"mtime_ns": int, "size": int, "reference_time": int, "reference_time_window": [start, end],
+        #                       "trim": [start, end] or [] for no change, "trim_window": [start, end]}
+        # mtime_ns and size are of preview.mp4
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        # recording folder -> (frames, timestamps) of the last analysed recordings, used for reference time and trim
+        self._frames = {}
+
+    def load(self):
+        self._loaded = True
+        if self.cache_path and os.path.isfile(self.cache_path):
+            try:
+                data = json.loads(Helpers.read_file(self.cache_path, default='{}'))
+                if data.get("version") == self.cache_version:
+                    self._cache = data.get("recordings", {})
+            except Exception as e:
+                sys.stderr.write("Error reading scene analysis cache: {}\n".format(str(e)))
+                self._cache = {}
+
+    def save(self):
+        if not self.cache_path:
+            return False
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            with self._lock:
+                data = json.dumps({"version": self.cache_version, "recordings": self._cache})
+            tmp_path = self.cache_path + ".tmp"
+            if Helpers.write_file(tmp_path, data):
+                os.replace(tmp_path, self.cache_path)
+                return True
+        except Exception as e:
+            sys.stderr.write("Error writing scene analysis cache: {}\n".format(str(e)))
+        return False
+
+    def _get_cached(self, recording_dir, key, window):
+        """
+        returns the cached value of a recording if preview.mp4 and the stitching window did not change, or None
+        """
+        if not self._loaded:
+            self.load()
+        try:
+            stat = os.stat(os.path.join(recording_dir, "preview.mp4"))
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._cache.get(os.path.normpath(recording_dir))
+        if entry and entry.get("mtime_ns") == stat.st_mtime_ns and entry.get("size") == stat.st_size \
+                and entry.get(key + "_window") == list(window):
+            return entry.get(key)
+        return None
+
+    def _set_cached(self, recording_dir, key, window, value):
+        try:
+            stat = os.stat(os.path.join(recording_dir, "preview.mp4"))
+        except OSError:
+            return
+        with self._lock:
+            entry = self._cache.get(os.path.normpath(recording_dir))
+            if not entry or entry.get("mtime_ns") != stat.st_mtime_ns or entry.get("size") != stat.st_size:
+                entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+                self._cache[os.path.normpath(recording_dir)] = entry
+            entry[key] = value
+            entry[key + "_window"] = list(window)
+
+    def read_keyframes(self, filename):
+        """
+        Decodes only the keyframes of a video, scaled down to frame_width x frame_height grayscale pixels.
+        returns list of frames as bytes
+        """
+        frame_size = self.frame_width * self.frame_height
+        args = [self.ffmpeg, "-v", "error", "-skip_frame", "nokey", "-i", filename, "-an",
+                "-vf", f"scale={self.frame_width}:{self.frame_height},format=gray",
+                "-vsync", "passthrough", "-f", "rawvideo", "-"]
+        try:
+            if sys.platform == "win32":
+                # Hide console
+                startupinfo = subprocess.STARTUPINFO()
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                data = subprocess.check_output(args, stderr=subprocess.DEVNULL, startupinfo=startupinfo)
+            else:
+                data = subprocess.check_output(args, stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError) as e:
+            self._log_error("Error reading keyframes of '{}' with ffmpeg: {}".format(filename, str(e)))
+            return []
+        return [data[i:i + frame_size] for i in range(0, len(data) - frame_size + 1, frame_size)]
+
+    def sample_frames(self, frames, timestamps):
+        """
+        returns (frames, timestamps) with at most max_frames frames, evenly spread
+        """
+        if len(frames) <= self.max_frames:
+            return frames, timestamps
+        indexes = [int(i * len(frames) / self.max_frames) for i in range(self.max_frames)]
+        return [frames[i] for i in indexes], [timestamps[i] for i in indexes]
+
+    @staticmethod
+    def get_timestamps(frames, keyframes, duration):
+        """
+        returns the time of each frame: the keyframe timestamps read with ffprobe if they match the frames,
+        otherwise evenly spaced over the duration
+        """
+        if len(keyframes) == len(frames):
+            return list(keyframes)
+        return [i * duration / max(1, len(frames)) for i in range(len(frames))]
+
+    def score_detail(self, frames):
+        """
+        Scores how much detail each frame shows, as its edge density times its contrast.
+        Open water, sky or blurred frames score low, which gives bad optical flow offsets when used as reference.
+        returns list of scores
+        """
+        if not frames:
+            return []
+        w, h = self.frame_width, self.frame_height
+        if numpy is not None:
+            pixels = numpy.frombuffer(b"".join(frames), dtype=numpy.uint8).reshape(len(frames), h, w).astype(numpy.float32)
+            edges = numpy.abs(numpy.diff(pixels, axis=2)).mean(axis=(1, 2)) + numpy.abs(numpy.diff(pixels, axis=1)).mean(axis=(1, 2))
+            contrast = pixels.std(axis=(1, 2))
+            return [float(s) for s in edges / 255 * contrast / 128]
+        scores = []
+        for frame in frames:
+            # every third row and column is enough for the score. An odd step does not miss edges of regular patterns.
+            edge_sum = 0
+            values = []
+            for y in range(0, h - 1, 3):
+                row = frame[y * w:(y + 1) * w]
+                below = frame[(y + 1) * w:(y + 2) * w]
+                for x in range(0, w - 1, 3):
+                    value = row[x]
+                    edge_sum += abs(row[x + 1] - value) + abs(below[x] - value)
+                    values.append(value)
+            count = len(values)
+            mean = sum(values) / count
+            std = (sum((v - mean) ** 2 for v in values) / count) ** 0.5
+            scores.append(edge_sum / count / 255 * std / 128)
+        return scores
+
+    def measure_changes(self, frames):
+        """
+        returns (mean brightness of each frame, mean pixel change of each frame from the previous frame)
+        """
+        if not frames:
+            return [], []
+        w, h = self.frame_width, self.frame_height
+        if numpy is not None:
+            pixels = numpy.frombuffer(b"".join(frames), dtype=numpy.uint8).reshape(len(frames), h, w).astype(numpy.float32)
+            brightness = pixels.mean(axis=(1, 2))
+            motion = numpy.concatenate(([0.0], numpy.abs(numpy.diff(pixels, axis=0)).mean(axis=(1, 2))))
+            return [float(b) for b in brightness], [float(m) for m in motion]
+        # every third pixel of every third row
+        indexes = [y * w + x for y in range(0, h, 3) for x in range(0, w, 3)]
+        brightness = []
+        motion = [0.0]
+        previous = None
+        for frame in frames:
+            values = [frame[i] for i in indexes]
+            brightness.append(sum(values) / len(values))
+            if previous is not None:
+                motion.append(sum(abs(a - b) for a, b in zip(values, previous)) / len(values))
+            previous = values
+        return brightness, motion
+
+    def _get_frames(self, recording_dir, get_keyframes, duration):
+        """
+        returns (frames, timestamps) of the keyframes of preview.mp4, at most max_frames
+        """
+        with self._lock:
+            if recording_dir in self._frames:
+                return self._frames[recording_dir]
+        frames = self.read_keyframes(os.path.join(recording_dir, "preview.mp4"))
+        if not frames:
+            return [], []
+        frames, timestamps = self.sample_frames(frames, self.get_timestamps(frames, get_keyframes(), duration))
+        with self._lock:
+            self._frames[recording_dir] = (frames, timestamps)
+            while len(self._frames) > self.frames_cache_size:
+                # oldest first
+                del self._frames[next(iter(self._frames))]
+        return frames, timestamps
+
+    def find_boundary(self, brightness, motion, from_end=False):
+        """
+        Finds where the dead footage at the start of a recording ends, or at the end starts if from_end is True:
+        the largest change of brightness, e.g. going under water, and the end of a still camera.
+        :return: index of the first useful frame, or of the last one if from_end is True, or None
+        """
+        n = len(brightness)
+        k = self.exposure_frames
+        if n < 2 * k + 1:
+            return None
+        if from_end:
+            found = self.find_boundary(brightness[::-1], [0.0] + motion[:0:-1])
+            return None if found is None else n - 1 - found
+        boundary = None
+        search = range(k, max(k + 1, int(n * self.trim_search)))
+        steps = [(abs(sum(brightness[i - k:i]) / k - sum(brightness[i:i + k]) / k), i) for i in search if i + k <= n]
+        if steps:
+            step, i = max(steps)
+            if step >= self.exposure_threshold:
+                boundary = i
+        # the camera is still, e.g. on deck, until the median motion of the next exposure_frames frames is above
+        # the threshold. A camera still for the whole searched part is e.g. on a tripod and not trimmed.
+        limit = min(int(n * self.trim_search), n - k - 1)
+        still = 0
+        while still < limit and sorted(motion[still + 1:still + 1 + k])[k // 2] < self.motion_threshold:
+            still += 1
+        if 0 < still < limit:
+            boundary = max(boundary or 0, still)
+        return boundary
+
+    def propose_trim(self, recording_dir, window, get_keyframes, duration, min_duration=0):
+        """
+        Proposes a trim window without the dead footage at the start and end of the stitching window, e.g. on deck
+        or at the surface. The proposal is cached until preview.mp4 or the stitching window change.
+        :param window: (trim start, trim end) in seconds
+        :param min_duration: shortest trimmed length in seconds, shorter proposals are not used
+        :return: (trim start, trim end) in seconds, or None to keep the window
+        """
+        window = [int(window[0]), int(window[1])]
+        cached = self._get_cached(recording_dir, "trim", window)
+        if cached is not None:
+            return tuple(cached) if cached else None
+        frames, timestamps = self._get_frames(recording_dir, get_keyframes, duration)
+        if not frames:
+            return None
+        inside = [i for i, t in enumerate(timestamps) if window[0] <= t <= window[1]]
+        brightness, motion = self.measure_changes([frames[i] for i in inside])
+        timestamps = [timestamps[i] for i in inside]
+        start, end = window
+        first = self.find_boundary(brightness, motion)
+        last = self.find_boundary(brightness, motion, from_end=True)
+        if first is not None:
+            start = max(start, int(timestamps[first]))
+        if last is not None:
+            # up to the next keyframe, which is the first dead one
+            end = min(end, int(round(timestamps[last + 1] if last + 1 < len(timestamps) else timestamps[last] + 1)))
+        name = os.path.basename(os.path.normpath(recording_dir))
+        proposal = []
+        if [start, end] != window:
+            if end - start < max(1, min_duration):
+                self._log_info("Not trimming {} to {}-{}s, shorter than the minimum recording duration.".format(name, start, end))
+            else:
+                proposal = [start, end]
+                self._log_info("Trimming {} to {}-{}s, {}s of dead footage.".format(
+                    name, start, end, (window[1] - window[0]) - (end - start)))
+        self._set_cached(recording_dir, "trim", window, proposal)
+        return tuple(proposal) if proposal else None
+
+    def choose_reference_time(self, recording_dir, window, get_keyframes, duration):
+        """
+        Chooses the keyframe with the most detail inside the stitching window as reference time.
+        The choice is cached until preview.mp4 or the stitching window change.
+        :param window: (trim start, trim end) in seconds
+        :param get_keyframes: function returning the keyframe timestamps of preview.mp4 in seconds, not called if cached
+        :return: reference time in seconds, or None if no frame could be analysed
+        """
+        window = [int(window[0]), int(window[1])]
+        cached = self._get_cached(recording_dir, "reference_time", window)
+        if cached is not None:
+            return cached
+        frames, timestamps = self._get_frames(recording_dir, get_keyframes, duration)
+        if not frames:
+            return None
+        start, end = window
+        margin = min(self.edge_margin, (end - start) / 4)
+        candidates = [(score, t) for t, score in zip(timestamps, self.score_detail(frames))
+                      if start + margin <= t <= end - margin]
+        if not candidates:
+            return None
+        score, reference_time = max(candidates)
+        reference_time = int(round(reference_time))
+        self._set_cached(recording_dir, "reference_time", window, reference_time)
+        self._log_info("Reference time for {}: {}s, chosen from {} keyframes.".format(
+            os.path.basename(os.path.normpath(recording_dir)), reference_time, len(candidates)))
+        return reference_time
+
+    def _log_info(self, text):
+        if self.log_info:
+            self.log_info(text)
+        else:
+            print(text)
+
+    def _log_error(self, text):
+        if self.log_error:
+            self.log_error(text)
+        else:
+            sys.stderr.write(text)
+            sys.stderr.write("\n")
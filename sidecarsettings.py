@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Settings for a single recording, read from a batchstitcher.ini or batchstitcher.json file in its folder
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import os.path
+import json
+import threading
+import configparser
+from helpers import Helpers
+
+
+class SidecarSettings:
+    """
+    Reads and checks the settings file of each recording once, and again only after it was changed.
+    """
+
+    file_names = ("batchstitcher.ini", "batchstitcher.json")
+
+    # settings of the whole batch that cannot be changed per recording
+    batch_keys = ("source_filter", "threads", "target_dir", "ffprobe_path", "stitcher_path", "ffmpeg_path", "profiles",
+                  "retry_max_attempts", "pause_suspend_children", "trace_file", "profile_file", "sidecar_settings",
+                  "gui_theme")
+    batch_prefixes = ("source_", "rename_", "disk_", "preview_", "capability_", "watchdog_", "process_", "telemetry_",
+                      "vram_", "status_", "metrics_", "job_spool")
+
+    # settings that are not in the default settings but can be set
+    extra_keys = ("bitrate_mbps",)
+
+    def __init__(self, default_settings, log_info=None, log_error=None):
+        """
+        :param default_settings: dict of settings that can be set, with values of the expected types
+        """
+        self.default_settings = default_settings
+        self.log_info = log_info
+        self.log_error = log_error
+        # file path -> (mtime_ns, size, settings)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def find(self, recording_dir):
+        """
+        returns path of the settings file in a recording folder, or None
+        """
+        for file_name in self.file_names:
+            path = os.path.join(recording_dir, file_name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def get(self, recording_dir):
+        """
+        returns dict of the valid settings in the settings file of a recording folder, as read from the file
+        """
+        path = self.find(recording_dir)
+        if not path:
+            return {}
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return {}
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return dict(cached[2])
+        settings = self.validate(self.read(path), path)
+        if settings:
+            self._log_info("Using settings from {}: {}".format(path, ", ".join(f"{k} = {v}" for k, v in settings.items())))
+        with self._lock:
+            self._cache[path] = (stat.st_mtime_ns, stat.st_size, settings)
+        return dict(settings)
+
+    def read(self, path):
+        """
+        returns dict of all settings in a settings file. Ini files can have a [DEFAULT] section or none.
+        """
+        try:
+            if path.lower().endswith(".json"):
+                data = json.loads(Helpers.read_file(path, default='{}'))
+                if not isinstance(data, dict):
+                    raise ValueError("expected a JSON object")
+                return data
+            config = configparser.ConfigParser(interpolation=None)
+            data = Helpers.read_file(path, default='')
+            try:
+                config.read_string(data)
+            except configparser.MissingSectionHeaderError:
+                config.read_string("[DEFAULT]\n" + data)
+            settings = dict(config["DEFAULT"].items())
+            for section in config.sections():
+                settings.update(config[section].items())
+            return settings
+        except (configparser.Error, ValueError, OSError) as e:
+            self._log_error("Error reading settings file '{}': {}".format(path, str(e)))
+        return {}
+
+    def is_allowed(self, key):
+        if key in self.batch_keys or key.startswith(self.batch_prefixes):
+            return False
+        return key in self.default_settings or key in self.extra_keys
+
+    def validate(self, settings, path=""):
+        """
+        returns dict of the settings that can be set per recording and have a value of the expected type.
+        Other settings are logged and ignored.
+        """
+        valid = {}
+        for key, value in settings.items():
+            key = str(key).strip().lower()
+            if not self.is_allowed(key):
+                self._log_error("Ignoring setting '{}' in '{}', it cannot be set per recording.".format(key, path))
+                continue
+            default = self.default_settings.get(key, 0)
+            if isinstance(default, bool):
+                if str(value).strip().lower() not in ("1", "0", "true", "false", "yes", "no", "on", "off"):
+                    self._log_error("Ignoring setting '{}' in '{}', '{}' is not a yes/no value.".format(key, path, value))
+                    continue
+            elif isinstance(default, int):
+                if Helpers.parse_int(value, None) is None:
+                    self._log_error("Ignoring setting '{}' in '{}', '{}' is not a whole number.".format(key, path, value))
+                    continue
+            elif isinstance(default, float):
+                try:
+                    float(value)
+                except (TypeError, ValueError):
+                    self._log_error("Ignoring setting '{}' in '{}', '{}' is not a number.".format(key, path, value))
+                    continue
+            elif isinstance(value, (dict, list)):
+                self._log_error("Ignoring setting '{}' in '{}', expected a single value.".format(key, path))
+                continue
+            valid[key] = value
+        return valid
+
+    def _log_info(self, text):
+        if self.log_info:
+            self.log_info(text)
+        else:
+            print(text)
+
+    def _log_error(self, text):
+        if self.log_error:
+            self.log_error(text)
+        else:
+            print(text)
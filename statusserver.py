@@ -0,0 +1,314 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Local HTTP server showing the state of a running batch as JSON and accepting control commands
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import os.path
+import json
+import hmac
+import ipaddress
+import threading
+from time import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from helpers import Helpers
+from events import JobQueued, JobStarted, Progress, JobFinished, JobFailed, JobCancelled
+from stitchapi import StitchJob
+
+
+class JobTracker:
+    """
+    Keeps the state of each job and throughput totals from the events of a controller.
+    """
+
+    def __init__(self, events):
+        self.started = time()
+        # job name -> dict of job state
+        self.jobs = {}
+        self.totals = {"done": 0, "failed": 0, "cancelled": 0, "seconds_stitched": 0, "wall_time": 0.0,
+                       "output_bytes": 0}
+        self._lock = threading.Lock()
+        self._events = events
+        self.subscription = events.subscribe(self._on_event,
+                                             (JobQueued, JobStarted, Progress, JobFinished, JobFailed, JobCancelled),
+                                             maxsize=10000)
+
+    def close(self):
+        self._events.unsubscribe(self.subscription)
+
+    def _on_event(self, event):
+        with self._lock:
+            job = self.jobs.setdefault(event.name, {"name": event.name})
+            if isinstance(event, JobQueued):
+                job.update(state="queued", recording=event.recording, profile=event.profile,
+                           priority=event.priority, queued=event.time)
+            elif isinstance(event, JobStarted):
+                job.update(state="running", slot=event.slot, attempt=event.attempt, started=event.time,
+                           output_destination=event.output_destination, stitching_duration=event.stitching_duration)
+            elif isinstance(event, Progress):
+                job["elapsed"] = event.elapsed
+            elif isinstance(event, JobFinished):
+                job.update(state="done", returncode=0, fps=event.fps, wall_time=event.wall_time,
+                           output_size=event.output_size, finished=event.time)
+                self.totals["done"] += 1
+                self.totals["seconds_stitched"] += event.stitching_duration or 0
+                self.totals["wall_time"] += event.wall_time or 0
+                self.totals["output_bytes"] += event.output_size or 0
+            elif isinstance(event, JobFailed):
+                job.update(returncode=event.returncode, message=event.message, finished=event.time)
+                if job.get("state") != "cancelled":
+                    job["state"] = "failed"
+                    self.totals["failed"] += 1
+            elif isinstance(event, JobCancelled):
+                job["state"] = "cancelled"
+                self.totals["cancelled"] += 1
+
+    def get_jobs(self, queued=None, running=None):
+        """
+        :param queued, running: names of the jobs the controller has queued and running. Jobs that events show
+                                as queued or running but that are neither, ended without a result, e.g. with a bad
+                                trim window, and are shown as "ended".
+        """
+        with self._lock:
+            jobs = [dict(job) for job in self.jobs.values()]
+        if queued is not None and running is not None:
+            for job in jobs:
+                if job["name"] in running:
+                    job["state"] = "running"
+                elif job["name"] in queued:
+                    job["state"] = "queued"
+                elif job.get("state") in ("queued", "running"):
+                    job["state"] = "ended"
+        return jobs
+
+    def get_throughput(self):
+        """
+        returns totals, and seconds of recordings stitched per hour since the batch started
+        """
+        with self._lock:
+            totals = dict(self.totals)
+            fps = [job["fps"] for job in self.jobs.values() if job.get("state") == "done" and job.get("fps")]
+        elapsed = max(1.0, time() - self.started)
+        totals["elapsed"] = round(elapsed, 1)
+        totals["seconds_stitched_per_hour"] = round(totals["seconds_stitched"] / elapsed * 3600, 1)
+        totals["mean_fps"] = round(sum(fps) / len(fps), 2) if fps else 0
+        return totals
+
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /status, /jobs and /queue return JSON.
+    POST /jobs queues a job, e.g. {"recording": "VID_xxx", "overrides": {"width": 3840}, "profile": "web"}.
+    POST /cancel {"name": ...}, /priority {"name": ..., "priority": 0}, /pause {"suspend": true},
+    /resume, /drain and /stop control the batch.
+    """
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.status_server.token
+        if not token:
+            return True
+        if hmac.compare_digest(self.headers.get("X-Token", ""), token):
+            return True
+        self._send_json(401, {"error": "Missing or wrong X-Token header"})
+        return False
+
+    def _read_json(self):
+        length = Helpers.parse_int(self.headers.get("Content-Length"))
+        if length <= 0:
+            return {}
+        data = json.loads(self.rfile.read(length).decode("utf-8"))
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        return data
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        status_server = self.server.status_server
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path in ("", "/status"):
+            self._send_json(200, status_server.get_status())
+        elif path == "/jobs":
+            self._send_json(200, status_server.get_jobs())
+        elif path == "/queue":
+            self._send_json(200, status_server.controller.get_queue())
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        # web pages can only send JSON to another origin after a CORS preflight, which is never allowed
+        if self.headers.get("Content-Type", "").split(";", 1)[0].strip().lower() != "application/json":
+            self._send_json(415, {"error": "Content-Type must be application/json"})
+            return
+        path = self.path.split("?", 1)[0].rstrip("/")
+        try:
+            data = self._read_json()
+        except ValueError as e:
+            self._send_json(400, {"error": "Invalid JSON: {}".format(str(e))})
+            return
+        try:
+            status, result = self.server.status_server.handle_command(path, data)
+        except Exception as e:
+            status, result = 500, {"error": str(e)}
+        self._send_json(status, result)
+
+    def log_message(self, format, *args):
+        # requests are not logged, monitoring scripts may poll often
+        pass
+
+
+class StatusServer:
+
+    def __init__(self, controller, host="127.0.0.1", port=8765, token=""):
+        """
+        :param controller: ProStitcherController
+        :param host: interface to listen on, 127.0.0.1 for this computer only, 0.0.0.0 for all
+        :param port: TCP port, 0 for any free port
+        :param token: if set, requests must send it in the X-Token header
+        """
+        self.controller = controller
+        self.host = host or "127.0.0.1"
+        self.port = Helpers.parse_int(port)
+        self.token = token or ""
+        self.tracker = None
+        self._httpd = None
+        self._thread = None
+
+    def is_loopback(self):
+        if self.host.lower() == "localhost":
+            return True
+        try:
+            return ipaddress.ip_address(self.host).is_loopback
+        except ValueError:
+            return False
+
+    def start(self):
+        """
+        returns True if the server is listening
+        """
+        if not self.token and not self.is_loopback():
+            self.controller._log_error("Not starting status server on {}: set status_token to listen on other "
+                                       "interfaces than this computer.".format(self.host))
+            return False
+        try:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), StatusRequestHandler)
+        except OSError as e:
+            self.controller._log_error("Could not start status server on {}:{}: {}".format(self.host, self.port, str(e)))
+            return False
+        self._httpd.daemon_threads = True
+        self._httpd.status_server = self
+        self.port = self._httpd.server_address[1]
+        self.tracker = JobTracker(self.controller.events)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="Status server", daemon=True)
+        self._thread.start()
+        self.controller._log_info("Status server listening on http://{}:{}/status".format(self.host, self.port))
+        return True
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        if self.tracker:
+            self.tracker.close()
+
+    def get_jobs(self):
+        """
+        returns all jobs, with the queued and running state taken from the controller
+        """
+        queued = {job["name"] for job in self.controller.get_queue()}
+        running = {job["name"] for job in self.controller.get_running()}
+        return self.tracker.get_jobs(queued, running)
+
+    def get_status(self):
+        jobs = self.get_jobs()
+        counts = {}
+        for job in jobs:
+            counts[job.get("state", "unknown")] = counts.get(job.get("state", "unknown"), 0) + 1
+        return {
+            "state": self.controller.get_state(),
+            "jobs": counts,
+            "running": [job for job in jobs if job.get("state") == "running"],
+            "queued": len(self.controller.get_queue()),
+            "throughput": self.tracker.get_throughput(),
+        }
+
+    def handle_command(self, path, data):
+        """
+        returns (HTTP status, result dict)
+        """
+        controller = self.controller
+        if path == "/jobs":
+            recording = str(data.get("recording") or "")
+            if not recording or not self.is_in_source_dir(recording):
+                return 400, {"error": "Recording folder not found: '{}'".format(recording)}
+            overrides = data.get("overrides") or {}
+            if not isinstance(overrides, dict):
+                return 400, {"error": "overrides must be a JSON object"}
+            # the same settings as in the settings file of a recording, no paths of programs or batch settings
+            rejected = [str(k) for k in overrides if not controller._sidecars.is_allowed(str(k).strip().lower())]
+            if rejected:
+                return 400, {"error": "Settings cannot be changed per job: {}".format(", ".join(rejected))}
+            valid = controller._sidecars.validate(overrides, "status request")
+            if len(valid) != len(overrides):
+                return 400, {"error": "Invalid values for: {}".format(
+                    ", ".join(str(k) for k in overrides if str(k).strip().lower() not in valid))}
+            overrides = valid
+            priority = data.get("priority")
+            job = StitchJob(recording, overrides, profile=data.get("profile"), name=data.get("name"),
+                            priority=Helpers.parse_int(priority) if priority is not None else None)
+            controller.submit(job)
+            return 200, {"name": job.name, "queued": True}
+        elif path == "/cancel":
+            return self._result(controller.cancel(str(data.get("name"))), data)
+        elif path == "/priority":
+            if "priority" not in data:
+                return 400, {"error": "priority missing"}
+            return self._result(controller.reprioritize(str(data.get("name")), Helpers.parse_int(data["priority"])), data)
+        elif path == "/pause":
+            controller.pause(data.get("suspend"))
+        elif path == "/resume":
+            controller.resume()
+        elif path == "/drain":
+            controller.drain()
+        elif path == "/stop":
+            controller.stop()
+        else:
+            return 404, {"error": "Not found"}
+        return 200, {"state": controller.get_state()}
+
+    def is_in_source_dir(self, recording):
+        """
+        returns True if recording is a folder inside the source folder, not an absolute path or one outside it
+        """
+        source_dir = os.path.realpath(self.controller.settings["source_dir"])
+        recording_dir = os.path.realpath(os.path.join(source_dir, recording))
+        try:
+            if os.path.commonpath([source_dir, recording_dir]) != source_dir or recording_dir == source_dir:
+                return False
+        except ValueError:
+            # different drives on Windows
+            return False
+        return os.path.isdir(recording_dir)
+
+    @staticmethod
+    def _result(found, data):
+        if not found:
+            return 404, {"error": "Job not found: '{}'".format(data.get("name"))}
+        return 200, {"name": data.get("name"), "ok": True}
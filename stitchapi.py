@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Settings, jobs and results for using the stitching controller from other Python code
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import itertools
+from helpers import Helpers
+
+
+class StitchSettings:
+    """
+    Settings with values converted to the types of ProStitcherController.default_settings and checked once.
+    Values are read as attributes, e.g. settings.width, or like a dict, e.g. settings["width"].
+    """
+
+    PREVIEW_MODES = ("off", "first", "only", "approved")
+
+    # settings parsed as a different type than their default value
+    int_keys = ("roll_x", "tilt_y", "pan_z")
+    float_keys = ("telemetry_interval", "watchdog_timeout_factor")
+
+    # values used when a number setting cannot be parsed, 0 for settings not listed
+    fallbacks = {
+        "disk_space_reserve_mb": 1024,
+        "disk_check_interval": 30,
+        "segment_count": 1,
+        "segment_min_duration": 300,
+        "segment_overlap": 2,
+        "preview_width": 1920,
+        "preview_duration": 10,
+        "telemetry_interval": 5,
+        "retry_max_attempts": 2,
+        "watchdog_stall_timeout": 600,
+        "watchdog_timeout_factor": 3,
+        "watchdog_requeue": 1,
+        "capability_test_duration": 2,
+        "vram_check_interval": 10,
+        "metrics_interval": 15,
+        "job_spool_poll_interval": 10,
+    }
+
+    # settings where 0 is not valid and the fallback is used instead
+    nonzero_keys = ("disk_check_interval", "vram_check_interval", "metrics_interval", "job_spool_poll_interval")
+
+    def __init__(self, settings=None, **kwargs):
+        """
+        :param settings: dict or StitchSettings, missing settings are set to their defaults
+        :param kwargs: settings that replace those in settings, e.g. width=3840
+        """
+        values = dict(self.get_defaults())
+        if isinstance(settings, StitchSettings):
+            settings = settings.to_dict()
+        values.update(settings or {})
+        values.update(kwargs)
+        self._values = self.validate(values)
+
+    @staticmethod
+    def get_defaults():
+        # imported here because the controller imports this module
+        from prostitchercontroller import ProStitcherController
+        return ProStitcherController.default_settings
+
+    @classmethod
+    def from_ini(cls, path, **kwargs):
+        """
+        Reads settings from the DEFAULT section of an ini file like batchstitcher.ini.
+        """
+        return cls(Helpers.read_config(path, cls.get_defaults()), **kwargs)
+
+    @classmethod
+    def parse_value(cls, key, value):
+        """
+        Converts a setting to the type of its default value. Settings without default are not changed.
+        """
+        default = cls.get_defaults().get(key)
+        fallback = cls.fallbacks.get(key, 0)
+        if key in cls.int_keys:
+            return Helpers.parse_int(value, fallback)
+        elif key in cls.float_keys:
+            return Helpers.parse_float(value, fallback)
+        elif isinstance(default, bool):
+            return Helpers.parse_bool(value)
+        elif isinstance(default, int):
+            return Helpers.parse_int(value, fallback)
+        elif isinstance(default, float):
+            return Helpers.parse_float(value, fallback)
+        return value
+
+    @classmethod
+    def validate(cls, values):
+        """
+        returns dict of settings with values converted and out of range values replaced
+        """
+        settings = {k: cls.parse_value(k, v) for k, v in values.items()}
+        for key in cls.nonzero_keys:
+            settings[key] = settings.get(key) or cls.fallbacks[key]
+        if settings.get("preview_mode") not in cls.PREVIEW_MODES:
+            settings["preview_mode"] = cls.PREVIEW_MODES[0]
+        settings["bitrate_mbps"] = int(settings["bitrate"] / 1024 / 1024)
+        return settings
+
+    def replace(self, **kwargs):
+        """
+        returns a copy with some settings changed
+        """
+        return StitchSettings(self._values, **kwargs)
+
+    def to_dict(self):
+        return dict(self._values)
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["_values"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __repr__(self):
+        return "StitchSettings({!r})".format(self._values)
+
+
+class StitchJob:
+    """
+    A recording to stitch with ProStitcherController.submit().
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, recording, overrides=None, profile=None, name=None, output_destination=None, priority=None):
+        """
+        :param recording: folder name in source_dir, or absolute path of the recording folder
+        :param overrides: dict or StitchSettings with settings for this job only
+        :param profile: name of a profile of the controller to apply before the overrides, also added to the file name
+        :param name: name in log messages and results, defaults to recording and profile
+        :param output_destination: path of the output file, defaults to a new file in target_dir
+        :param priority: jobs with lower values are started first, defaults to ProStitcherController.PRIORITY_DEFAULT
+        """
+        self.id = next(self._ids)
+        self.recording = recording
+        if isinstance(overrides, StitchSettings):
+            overrides = overrides.to_dict()
+        self.overrides = dict(overrides or {})
+        self.profile = profile
+        self.name = name or (f"{recording} ({profile})" if profile else recording)
+        self.output_destination = output_destination
+        self.priority = priority
+
+    def __repr__(self):
+        return "StitchJob({!r}, name={!r})".format(self.recording, self.name)
+
+
+class JobResult:
+    """
+    Outcome of a stitching job. returncode is the ProStitcher exit code of the last attempt, 0 on success.
+    """
+
+    def __init__(self, name, recording, returncode, output_path=None, output_size=0, stitching_duration=0,
+                 wall_time=0.0, fps=0.0, profile=None, attempt=1, fallback=None, metrics=None, settings=None):
+        """
+        :param stitching_duration: stitched length of the recording in seconds
+        :param wall_time: seconds ProStitcher ran
+        :param fps: achieved stitching speed in frames per second
+        :param fallback: settings changed by retries after known errors
+        :param metrics: resource usage summary, see TelemetrySampler.get_summary()
+        :param settings: effective settings of the job
+        """
+        self.name = name
+        self.recording = recording
+        self.returncode = returncode
+        self.output_path = output_path
+        self.output_size = output_size
+        self.stitching_duration = stitching_duration
+        self.wall_time = wall_time
+        self.fps = fps
+        self.profile = profile
+        self.attempt = attempt
+        self.fallback = fallback or {}
+        self.metrics = metrics or {}
+        self.settings = settings or {}
+
+    @classmethod
+    def from_result(cls, result):
+        """
+        Creates a JobResult from an entry of ProStitcherController.results.
+        """
+        return cls(result["name"], result["recording"], result["returncode"],
+                   output_path=result.get("output_destination"),
+                   output_size=result.get("output_size", 0),
+                   stitching_duration=result.get("stitching_duration", 0),
+                   wall_time=result.get("wall_time", 0.0),
+                   fps=result.get("fps", 0.0),
+                   profile=result.get("profile"),
+                   attempt=result.get("attempt", 1),
+                   fallback=result.get("fallback"),
+                   metrics=result.get("metrics"),
+                   settings=result.get("settings"))
+
+    @property
+    def succeeded(self):
+        return self.returncode == 0
+
+    def __repr__(self):
+        return "JobResult({!r}, returncode={}, fps={})".format(self.name, self.returncode, self.fps)
+
+
+class BatchResult:
+    """
+    Outcome of ProStitcherController.stitch(): the last attempt of each job, in the order the jobs ended.
+    """
+
+    def __init__(self, jobs=None, stopped=False):
+        """
+        :param jobs: list of JobResult
+        :param stopped: True if the batch was cancelled or finished early
+        """
+        self.jobs = list(jobs or [])
+        self.stopped = stopped
+
+    @classmethod
+    def from_results(cls, results, stopped=False):
+        last = {}
+        for result in results:
+            last.pop(result["name"], None)
+            last[result["name"]] = JobResult.from_result(result)
+        return cls(list(last.values()), stopped)
+
+    @property
+    def succeeded(self):
+        return [job for job in self.jobs if job.succeeded]
+
+    @property
+    def failed(self):
+        return [job for job in self.jobs if not job.succeeded]
+
+    @property
+    def ok(self):
+        return not self.stopped and not self.failed
+
+    def __repr__(self):
+        return "BatchResult({} succeeded, {} failed{})".format(len(self.succeeded), len(self.failed),
+                                                              ", stopped" if self.stopped else "")
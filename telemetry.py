@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Sample CPU, memory, disk and GPU usage of a stitching process while it runs
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import os
+import shlex
+import shutil
+import threading
+import subprocess
+from time import time
+from helpers import Helpers
+
+
+class TelemetrySampler:
+
+    default_gpu_command = "nvidia-smi --query-gpu=utilization.gpu,memory.used --format=csv,noheader,nounits"
+    # GPU commands that could not be parsed, logged only once
+    _invalid_commands = set()
+
+    def __init__(self, interval=5, gpu_command=None, log_error=None):
+        """
+        :param interval: seconds between samples
+        :param gpu_command: command printing "utilization %, memory used MB" per GPU and line, empty to skip GPU
+        :param log_error: called with errors, print if None
+        """
+        self.interval = max(0.1, Helpers.parse_float(interval, 5))
+        self.log_error = log_error
+        self.gpu_args = None
+        if gpu_command:
+            try:
+                args = shlex.split(gpu_command)
+            except ValueError as e:
+                args = None
+                if gpu_command not in TelemetrySampler._invalid_commands:
+                    TelemetrySampler._invalid_commands.add(gpu_command)
+                    self._log_error("Not sampling GPU usage, invalid command '{}': {}".format(gpu_command, str(e)))
+            if args and shutil.which(args[0]):
+                self.gpu_args = args
+        self.pid = None
+        # metric name -> list of sampled values
+        self.samples = {}
+        self._io_start = None
+        self._io_last = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def start(self, pid):
+        self.pid = pid
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval + 5)
+            self._thread = None
+
+    def _run(self):
+        last_cpu = self._read_cpu_time()
+        last_time = time()
+        self._io_start = self._read_io()
+        while not self._stop.wait(self.interval):
+            now = time()
+            cpu = self._read_cpu_time()
+            if cpu is not None and last_cpu is not None and now > last_time:
+                self._add("cpu_percent", 100.0 * (cpu - last_cpu) / (now - last_time))
+            last_cpu, last_time = cpu, now
+            rss = self._read_rss()
+            if rss is not None:
+                self._add("rss_mb", rss / 1024 / 1024)
+            io = self._read_io()
+            if io is not None:
+                self._io_last = io
+            gpu = self._read_gpu()
+            if gpu:
+                self._add("gpu_percent", gpu[0])
+                self._add("gpu_memory_mb", gpu[1])
+
+    def _add(self, name, value):
+        self.samples.setdefault(name, []).append(value)
+
+    def _read_cpu_time(self):
+        """
+        returns user + system CPU seconds of the process from /proc, or None
+        """
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                # the process name in field 2 may contain spaces, fields after it are separated by single spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self._clock_ticks
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def _read_rss(self):
+        """
+        returns resident memory in bytes from /proc, or None
+        """
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, IndexError, ValueError):
+            pass
+        return None
+
+    def _read_io(self):
+        """
+        returns (read bytes, written bytes) from /proc/<pid>/io, or None
+        """
+        try:
+            values = {}
+            with open(f"/proc/{self.pid}/io") as f:
+                for line in f:
+                    k, v = line.split(":", 1)
+                    values[k.strip()] = int(v)
+            return values["read_bytes"], values["write_bytes"]
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _read_gpu(self):
+        """
+        returns (mean utilization in percent, total memory used in MB) over all GPUs, or None
+        """
+        if not self.gpu_args:
+            return None
+        try:
+            output = subprocess.check_output(self.gpu_args, stderr=subprocess.DEVNULL, timeout=10).decode()
+            rows = [[Helpers.parse_float(v) for v in line.split(",")] for line in output.splitlines() if line.strip()]
+            rows = [r for r in rows if len(r) >= 2]
+            if rows:
+                return sum(r[0] for r in rows) / len(rows), sum(r[1] for r in rows)
+        except (OSError, subprocess.SubprocessError, ValueError):
+            # do not try again for every sample if the command does not work
+            self.gpu_args = None
+        return None
+
+    def get_summary(self):
+        """
+        returns dict of metric name -> {"peak": value, "mean": value}, and total disk read and written in MB
+        """
+        summary = {}
+        for name, values in self.samples.items():
+            if values:
+                summary[name] = {"peak": round(max(values), 1), "mean": round(sum(values) / len(values), 1)}
+        if self._io_start and self._io_last:
+            summary["read_mb"] = round((self._io_last[0] - self._io_start[0]) / 1024 / 1024, 1)
+            summary["write_mb"] = round((self._io_last[1] - self._io_start[1]) / 1024 / 1024, 1)
+        return summary
+
+    @staticmethod
+    def format_summary(summary):
+        parts = []
+        if "cpu_percent" in summary:
+            parts.append("CPU {mean}% mean, {peak}% peak".format(**summary["cpu_percent"]))
+        if "rss_mb" in summary:
+            parts.append("memory {} MB peak".format(summary["rss_mb"]["peak"]))
+        if "read_mb" in summary:
+            parts.append("read {} MB, written {} MB".format(summary["read_mb"], summary["write_mb"]))
+        if "gpu_percent" in summary:
+            parts.append("GPU {mean}% mean, {peak}% peak".format(**summary["gpu_percent"]))
+        if "gpu_memory_mb" in summary:
+            parts.append("GPU memory {} MB peak".format(summary["gpu_memory_mb"]["peak"]))
+        return ", ".join(parts)
+
+    def _log_error(self, text):
+        if self.log_error:
+            self.log_error(text)
+        else:
+            print(text)
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Optional timing spans and profiling for the batch controller, exported as Chrome trace events
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os
+import json
+import pstats
+import cProfile
+import functools
+import threading
+from time import perf_counter_ns
+from contextlib import contextmanager
+
+
+class Tracer:
+
+    def __init__(self):
+        self.enabled = False
+        self.profiling = False
+        self._events = []
+        self._thread_names = {}
+        self._profiles = []
+        self._profile_warned = False
+        self._lock = threading.Lock()
+        self._start = perf_counter_ns()
+
+    def start(self, trace=True, profile=False):
+        """
+        Clears recorded spans and enables tracing and/or profiling.
+        """
+        with self._lock:
+            self._events = []
+            self._thread_names = {}
+            self._profiles = []
+            self._profile_warned = False
+        self._start = perf_counter_ns()
+        self.enabled = trace
+        self.profiling = profile
+
+    def stop(self):
+        self.enabled = False
+        self.profiling = False
+
+    @contextmanager
+    def span(self, name, category="controller", **args):
+        """
+        Records the duration of the enclosed block. Does nothing unless tracing is enabled.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self._add_event(name, category, start, perf_counter_ns(), args)
+
+    def traced(self, name=None, category="controller"):
+        """
+        Decorator recording a span for each call of a function.
+        """
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(span_name, category):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _add_event(self, name, category, start, end, args):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self._start) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+        }
+        if args:
+            event["args"] = {k: str(v) for k, v in args.items()}
+        with self._lock:
+            self._events.append(event)
+            self._thread_names.setdefault(thread.ident, thread.name)
+
+    def start_thread_profile(self):
+        """
+        Starts a profiler for the calling thread, as cProfile only profiles the thread it was enabled in.
+        From Python 3.12 only one profiler can be active at a time, so only the first thread that asks is profiled.
+        returns the profiler, or None if profiling is off or another profiler is active
+        """
+        if not self.profiling:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            with self._lock:
+                if not self._profile_warned:
+                    self._profile_warned = True
+                    sys.stderr.write("Profiling only one thread: {}\n".format(str(e)))
+            return None
+        return profiler
+
+    def stop_thread_profile(self, profiler):
+        if profiler:
+            profiler.disable()
+            with self._lock:
+                self._profiles.append(profiler)
+
+    def get_totals(self):
+        """
+        returns dict of span name -> (count, total seconds)
+        """
+        totals = {}
+        with self._lock:
+            events = list(self._events)
+        for event in events:
+            count, duration = totals.get(event["name"], (0, 0.0))
+            totals[event["name"]] = (count + 1, duration + event["dur"] / 1000000)
+        return totals
+
+    def export(self, path):
+        """
+        Writes recorded spans as Chrome trace event JSON, to open in chrome://tracing or Perfetto.
+        """
+        with self._lock:
+            events = list(self._events)
+            for tid, thread_name in self._thread_names.items():
+                events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                               "args": {"name": thread_name}})
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+            return True
+        except Exception as e:
+            sys.stderr.write("Error writing trace: {}\n".format(str(e)))
+        return False
+
+    def export_profile(self, path):
+        """
+        Writes the combined profiles of all threads in pstats format, e.g. for snakeviz or python -m pstats.
+        """
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return False
+        try:
+            pstats.Stats(*profiles).dump_stats(path)
+            return True
+        except Exception as e:
+            sys.stderr.write("Error writing profile: {}\n".format(str(e)))
+        return False
+
+
+# shared by all controllers, so spans of helpers and test stitches end up in the same trace
+tracer = Tracer()
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Estimate the VRAM stitching jobs need and only start them when the GPU has enough free memory
+"""
+
+__author__ = "Axel Busch"
+__copyright__ = "Copyright 2025, Xlvisuals Limited"
+__license__ = "GPL-2.1"
+__version__ = "0.0.9"
+__email__ = "info@xlvisuals.com"
+
+import sys
+import os.path
+import json
+import shlex
+import shutil
+import threading
+import subprocess
+from time import sleep, time
+from helpers import Helpers
+
+
+class VramPlanner:
+
+    history_version = 1
+
+    # Prints "total MB, used MB" per GPU and line
+    default_probe_command = "nvidia-smi --query-gpu=memory.total,memory.used --format=csv,noheader,nounits"
+
+    # Settings that have the largest effect on VRAM usage
+    keys = ("width", "blend_mode", "stitching_mode", "decode_use_hardware", "decode_hardware_count")
+
+    # Estimate when no peak was measured yet: CUDA context and buffers, per hardware decoder,
+    # and full size output frames held per stitching mode
+    base_mb = 700
+    decoder_mb = 120
+    frames_per_mode = {
+        "New Optical Flow": 24,
+        "Optical Flow": 16,
+        "Scene-specific Template": 6,
+        "Template": 4,
+    }
+    # Output height relative to a mono panorama of the same width
+    height_factors = {
+        "pano": 1,
+        "stereo_top_left": 2,
+        "stereo_top_right": 2,
+        "vr180": 1,
+        "vr180_4lens": 1,
+    }
+
+    # Margin on top of measured peaks
+    margin = 1.1
+
+    # Weight of a lower measurement in the learned peak. Higher measurements replace it right away.
+    weight = 0.3
+
+    # Seconds after start during which a job may not have allocated its memory yet
+    ramp_up_time = 60
+
+    def __init__(self, budget_mb=0, probe_command=None, reserve_mb=512, history_path=None, log_info=None, log_error=None):
+        """
+        :param budget_mb: VRAM available for stitching if the probe command does not work, 0 for no limit
+        :param probe_command: command printing "total MB, used MB" per GPU and line, empty to use the budget only
+        :param reserve_mb: VRAM to leave free for the desktop and other applications
+        """
+        if history_path is None:
+            history_path = os.path.join(Helpers.get_datadir(), "BatchStitcher", "vram_history.json")
+        self.history_path = history_path
+        self.budget_mb = max(0, Helpers.parse_int(budget_mb))
+        self.reserve_mb = max(0, Helpers.parse_int(reserve_mb))
+        self.log_info = log_info
+        self.log_error = log_error
+        self.probe_args = None
+        if probe_command:
+            args = shlex.split(probe_command)
+            if args and shutil.which(args[0]):
+                self.probe_args = args
+        # settings key -> learned peak VRAM in MB
+        self._peaks = {}
+        # job name -> dict with reserved MB, start time, used VRAM before start, and whether other jobs ran alongside
+        self._reservations = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_key(cls, settings):
+        return "/".join(str(settings.get(k, "")) for k in cls.keys)
+
+    def load(self):
+        try:
+            if self.history_path and os.path.isfile(self.history_path):
+                data = json.loads(Helpers.read_file(self.history_path, default='{}'))
+                if data.get("version") == self.history_version:
+                    self._peaks = data.get("peaks", {})
+        except Exception as e:
+            sys.stderr.write("Error reading VRAM history: {}\n".format(str(e)))
+            self._peaks = {}
+
+    def save(self):
+        if not self.history_path:
+            return False
+        try:
+            history_dir = os.path.dirname(self.history_path)
+            if history_dir and not os.path.exists(history_dir):
+                os.makedirs(history_dir)
+            with self._lock:
+                data = json.dumps({"version": self.history_version, "peaks": self._peaks})
+            tmp_path = self.history_path + ".tmp"
+            if Helpers.write_file(tmp_path, data):
+                os.replace(tmp_path, self.history_path)
+                return True
+        except Exception as e:
+            sys.stderr.write("Error writing VRAM history: {}\n".format(str(e)))
+        return False
+
+    @classmethod
+    def estimate_model(cls, settings):
+        """
+        Estimates the VRAM of a job in MB from its settings, without measurements.
+        """
+        width = max(0, Helpers.parse_int(settings.get("width")))
+        height = width / 2 * cls.height_factors.get(settings.get("blend_mode"), 1)
+        frame_mb = width * height * 4 / 1024 / 1024
+        frames = cls.frames_per_mode.get(settings.get("stitching_mode"), cls.frames_per_mode["New Optical Flow"])
+        decoders = 0
+        if Helpers.parse_int(settings.get("decode_use_hardware")):
+            decoders = max(0, Helpers.parse_int(settings.get("decode_hardware_count")))
+        return int(cls.base_mb + decoders * cls.decoder_mb + frames * frame_mb)
+
+    def estimate(self, settings):
+        """
+        Returns the VRAM a job needs in MB, from measured peaks of earlier jobs with the same settings if available.
+        """
+        with self._lock:
+            peak = self._peaks.get(self.get_key(settings))
+        if peak:
+            return int(peak * self.margin)
+        return self.estimate_model(settings)
+
+    def learn(self, name, settings, peak_mb):
+        """
+        Updates the learned peak from the GPU memory measured while a job ran.
+        Only jobs that ran alone are used, as the measurement includes all processes on the GPU.
+        """
+        with self._lock:
+            reservation = self._reservations.get(name)
+            if not reservation or reservation["shared"] or reservation["baseline"] is None:
+                return
+            used = Helpers.parse_float(peak_mb) - reservation["baseline"]
+            if used <= 0:
+                return
+            key = self.get_key(settings)
+            if key in self._peaks and used < self._peaks[key]:
+                self._peaks[key] = round(self._peaks[key] * (1 - self.weight) + used * self.weight)
+            else:
+                self._peaks[key] = round(used)
+
+    def read_probe(self):
+        """
+        returns (free MB on the first GPU, used MB on all GPUs), or None
+        """
+        if not self.probe_args:
+            return None
+        try:
+            output = subprocess.check_output(self.probe_args, stderr=subprocess.DEVNULL, timeout=10).decode()
+            rows = [[Helpers.parse_float(v) for v in line.split(",")] for line in output.splitlines() if line.strip()]
+            rows = [r for r in rows if len(r) >= 2]
+            if rows:
+                return rows[0][0] - rows[0][1], sum(r[1] for r in rows)
+        except (OSError, subprocess.SubprocessError, ValueError):
+            pass
+        self._log_error("VRAM probe command failed, using the VRAM budget only.")
+        self.probe_args = None
+        return None
+
+    def _get_available(self, probe):
+        """
+        returns VRAM in MB available for another job, or None if unknown
+        """
+        available = None
+        if probe is not None:
+            # running jobs that just started may not have allocated their memory yet
+            now = time()
+            pending = sum(r["mb"] for r in self._reservations.values() if now - r["start"] < self.ramp_up_time)
+            available = probe[0] - self.reserve_mb - pending
+        if self.budget_mb:
+            budget_available = self.budget_mb - self.reserve_mb - sum(r["mb"] for r in self._reservations.values())
+            available = budget_available if available is None else min(available, budget_available)
+        return available
+
+    def try_reserve(self, name, vram_mb):
+        """
+        Reserves VRAM for a job if it fits. A job always starts if no other job is running.
+        :return: True if the job can start
+        """
+        probe = self.read_probe()
+        with self._lock:
+            available = self._get_available(probe)
+            if self._reservations and available is not None and vram_mb > available:
+                return False
+            shared = bool(self._reservations)
+            for reservation in self._reservations.values():
+                reservation["shared"] = True
+            self._reservations[name] = {"mb": vram_mb,
+                                        "start": time(),
+                                        "baseline": probe[1] if probe is not None else None,
+                                        "shared": shared}
+        if not shared and available is not None and vram_mb > available:
+            self._log_info(f"Warning: {name} may need more VRAM than available "
+                           f"(estimated {vram_mb} MB, {max(0, int(available))} MB free).")
+        return True
+
+    def wait_for_vram(self, name, vram_mb, is_stopping=None, interval=10):
+        """
+        Blocks until a job fits into free VRAM and reserves it, or is_stopping() returns True.
+        :return: True if the job can start
+        """
+        waiting = False
+        while not self.try_reserve(name, vram_mb):
+            if is_stopping and is_stopping():
+                return False
+            if not waiting:
+                self._log_info(f"Waiting for {vram_mb} MB of free VRAM to stitch {name}.")
+                waiting = True
+            for i in range(max(1, int(interval))):
+                if is_stopping and is_stopping():
+                    return False
+                sleep(1)
+        return True
+
+    def release(self, name):
+        with self._lock:
+            self._reservations.pop(name, None)
+
+    def _log_info(self, text):
+        if self.log_info:
+            self.log_info(text)
+        else:
+            print(text)
+
+    def _log_error(self, text):
+        if self.log_error:
+            self.log_error(text)
+        else:
+            sys.stderr.write(text)
+            sys.stderr.write("\n")